@@ -33,12 +33,13 @@ def image_resize(image, width=None, height=None, inter=cv2.INTER_AREA):
     return resized
 
 
-def visualize_fps(img, pTime = 0):
-    cTime = time.time()
-    fps = 1 / (cTime - pTime)
-    pTime = cTime
+# Draws the FPS since the previous frame; pass the returned time back in on the next call
+def visualize_fps(img, pTime=0):
+    cTime = time.perf_counter()
+    fps = 1 / (cTime - pTime) if pTime else 0
     cv2.putText(img, str(int(fps)), (50, 100), cv2.FONT_HERSHEY_PLAIN, 5,
                 (255, 0, 0), 5)
+    return cTime
 
 # function that find distance between two point
 def distanceCalculate(p1, p2):
@@ -10,9 +10,12 @@ import mediapipe as mp
 from sklearn.preprocessing import StandardScaler
 import time
 import os
-# Initialize MediaPipe pose
+import math
+import contextlib
+from perf_metrics import FrameMetrics
+from frame_sampler import FrameSampler
+# MediaPipe pose landmark definitions
 mp_pose = mp.solutions.pose
-pose = mp_pose.Pose()
 
 # Define relevant landmarks indices
 relevant_landmarks_indices = [
@@ -57,6 +60,72 @@ def calculate_y_distance(a, b):
         return -1.0  # Placeholder for missing landmarks
     return np.abs(a[1] - b[1])
 
+# Feature definitions as rows of the (12, 3) array of relevant landmarks:
+# 0/1 shoulders, 2/3 elbows, 4/5 wrists, 6/7 hips, 8/9 knees, 10/11 ankles (left/right)
+ANGLE_TRIPLES = np.array([
+    [0, 2, 4],   # LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST
+    [1, 3, 5],   # RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST
+    [6, 8, 10],  # LEFT_HIP, LEFT_KNEE, LEFT_ANKLE
+    [7, 9, 11],  # RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE
+    [0, 6, 8],   # LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE
+    [1, 7, 9],   # RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE
+    [6, 0, 2],   # LEFT_HIP, LEFT_SHOULDER, LEFT_ELBOW
+    [7, 1, 3],   # RIGHT_HIP, RIGHT_SHOULDER, RIGHT_ELBOW
+])
+DISTANCE_PAIRS = np.array([
+    [0, 1],   # LEFT_SHOULDER, RIGHT_SHOULDER
+    [6, 7],   # LEFT_HIP, RIGHT_HIP
+    [6, 8],   # LEFT_HIP, LEFT_KNEE
+    [7, 9],   # RIGHT_HIP, RIGHT_KNEE
+    [0, 6],   # LEFT_SHOULDER, LEFT_HIP
+    [1, 7],   # RIGHT_SHOULDER, RIGHT_HIP
+    [2, 8],   # LEFT_ELBOW, LEFT_KNEE
+    [3, 9],   # RIGHT_ELBOW, RIGHT_KNEE
+    [4, 0],   # LEFT_WRIST, LEFT_SHOULDER
+    [5, 1],   # RIGHT_WRIST, RIGHT_SHOULDER
+    [4, 6],   # LEFT_WRIST, LEFT_HIP
+    [5, 7],   # RIGHT_WRIST, RIGHT_HIP
+])
+Y_DISTANCE_PAIRS = np.array([
+    [2, 0],  # LEFT_ELBOW, LEFT_SHOULDER
+    [3, 1],  # RIGHT_ELBOW, RIGHT_SHOULDER
+])
+# Distances tried in order as the normalization factor: shoulder-hip, then hip-knee
+NORMALIZATION_DISTANCES = [4, 5, 2, 3]
+
+
+# Compute the 22 classifier features from a PoseLandmarks (or a (33, 4) array).
+# Same values as calculate_angle/calculate_distance applied feature by feature,
+# including -1.0 for features that touch a landmark with a zero coordinate.
+def landmark_features(landmarks):
+    data = landmarks.data if hasattr(landmarks, "data") else landmarks
+    points = data[relevant_landmarks_indices, :3].astype(np.float64)
+    has_zero = (points == 0).any(axis=1)
+
+    a, b, c = points[ANGLE_TRIPLES[:, 0]], points[ANGLE_TRIPLES[:, 1]], points[ANGLE_TRIPLES[:, 2]]
+    radians = np.arctan2(c[:, 1] - b[:, 1], c[:, 0] - b[:, 0]) - np.arctan2(a[:, 1] - b[:, 1], a[:, 0] - b[:, 0])
+    angles = np.abs(radians * 180.0 / np.pi)
+    angles = np.where(angles > 180.0, 360 - angles, angles)
+    angles[has_zero[ANGLE_TRIPLES].any(axis=1)] = -1.0
+
+    distances = np.linalg.norm(points[DISTANCE_PAIRS[:, 0]] - points[DISTANCE_PAIRS[:, 1]], axis=1)
+    distances[has_zero[DISTANCE_PAIRS].any(axis=1)] = -1.0
+
+    y_distances = np.abs(points[Y_DISTANCE_PAIRS[:, 0], 1] - points[Y_DISTANCE_PAIRS[:, 1], 1])
+    y_distances[has_zero[Y_DISTANCE_PAIRS].any(axis=1)] = -1.0
+
+    normalization_factor = 0.5  # Fallback normalization factor
+    for idx in NORMALIZATION_DISTANCES:
+        if distances[idx] > 0:
+            normalization_factor = distances[idx]
+            break
+
+    # Normalize distances, leaving the -1.0 placeholders as they are
+    distances = np.where(distances != -1.0, distances / normalization_factor, distances)
+    y_distances = np.where(y_distances != -1.0, y_distances / normalization_factor, y_distances)
+    return np.concatenate((angles, distances, y_distances))
+
+
 def draw_styled_text(frame, text, position, font=cv2.FONT_HERSHEY_SIMPLEX, font_scale=0.55, font_color=(255, 255, 255), font_thickness=2, bg_color=(0, 0, 0), padding=5):
     text_size, _ = cv2.getTextSize(text, font, font_scale, font_thickness)
     text_x, text_y = position
@@ -65,71 +134,258 @@ def draw_styled_text(frame, text, position, font=cv2.FONT_HERSHEY_SIMPLEX, font_
     cv2.putText(frame, text, (text_x, text_y), font, font_scale, font_color, font_thickness, lineType=cv2.LINE_AA)
 
 
-def count_repetition_push_up(detector, img, landmark_list, stage, counter, exercise_instance):
+def count_repetition_push_up(detector, img, landmark_list, stage, counter, exercise_instance, reps=None):
     right_arm_angle = detector.find_angle(img, 12, 14, 16)
-    right_shoulder = landmark_list[12][1:]
-    right_wrist = landmark_list[16][1:]
+    right_shoulder = landmark_list.data[12, :2]
     left_arm_angle = detector.find_angle(img, 11, 13, 15)
-    left_shoulder = landmark_list[11][1:]
-    exercise_instance.visualize_angle(img, right_arm_angle, right_shoulder)
-    exercise_instance.visualize_angle(img, left_arm_angle, left_shoulder)
+    left_shoulder = landmark_list.data[11, :2]
+    if exercise_instance is not None:
+        exercise_instance.visualize_angle(img, right_arm_angle, right_shoulder)
+        exercise_instance.visualize_angle(img, left_arm_angle, left_shoulder)
 
     if left_arm_angle < 220:
         stage = "down"
     if left_arm_angle > 240 and stage == "down":
         stage = "up"
         counter += 1
-    
+    if reps is not None:
+        reps.observe(left_arm_angle, stage, counter)
+
     return stage, counter
 
 
 
-def count_repetition_squat(detector, img, landmark_list, stage, counter, exercise_instance):
+def count_repetition_squat(detector, img, landmark_list, stage, counter, exercise_instance, reps=None):
     right_leg_angle = detector.find_angle(img, 24, 26, 28)
     left_leg_angle = detector.find_angle(img, 23, 25, 27)
-    right_leg = landmark_list[26][1:]
-    exercise_instance.visualize_angle(img, right_leg_angle, right_leg)
-
-    if right_leg_angle > 160 and left_leg_angle < 220:
+    right_leg = landmark_list.data[26, :2]
+    if exercise_instance is not None:
+        exercise_instance.visualize_angle(img, right_leg_angle, right_leg)
+
+    # find_angle measures 0-360 clockwise, so the same knee reads 140 or 220 depending on
+    # which way the person faces; fold both to the inner angle so side views count too
+    right_knee = 360 - right_leg_angle if right_leg_angle > 180 else right_leg_angle
+    left_knee = 360 - left_leg_angle if left_leg_angle > 180 else left_leg_angle
+    if right_knee > 160 and left_knee > 160:
         stage = "down"
-    if right_leg_angle < 140 and left_leg_angle > 210 and stage == "down":
+    if right_knee < 150 and left_knee < 150 and stage == "down":
         stage = "up"
         counter += 1
-    
+    if reps is not None:
+        reps.observe(right_knee, stage, counter)
+
     return stage, counter
 
-def count_repetition_shoulder_press(detector, img, landmark_list, stage, counter, exercise_instance):
+def count_repetition_shoulder_press(detector, img, landmark_list, stage, counter, exercise_instance, reps=None):
     right_arm_angle = detector.find_angle(img, 12, 14, 16)
     left_arm_angle = detector.find_angle(img, 11, 13, 15)
-    right_elbow = landmark_list[14][1:]
-    exercise_instance.visualize_angle(img, right_arm_angle, right_elbow)
+    right_elbow = landmark_list.data[14, :2]
+    if exercise_instance is not None:
+        exercise_instance.visualize_angle(img, right_arm_angle, right_elbow)
 
     if right_arm_angle > 280 and left_arm_angle < 80:
         stage = "down"
     if right_arm_angle < 240 and left_arm_angle > 120 and stage == "down":
         stage = "up"
         counter += 1
-    
+    if reps is not None:
+        reps.observe(right_arm_angle, stage, counter)
+
     return stage, counter
 
 
+# Counting function for each label of the exercise classifier.
+# They can run headless: pass img=None and exercise_instance=None to skip all drawing.
+# An optional RepTracker (reps=) turns the counted joint's angle into per-rep events.
+COUNT_FUNCTIONS = {
+    'push-up': count_repetition_push_up,
+    'squat': count_repetition_squat,
+    'shoulder press': count_repetition_shoulder_press
+}
+
+# Names the exercise history uses for each classifier label, the same as the webcam page saves
+EXERCISE_NAMES = {
+    'push-up': 'Push Up',
+    'squat': 'Squat',
+    'shoulder press': 'Shoulder Press'
+}
+
+
+
+class SegmentTimeline:
+    """
+    Exercise segments of a video, built from window labels as they are classified.
+    Runs of windows with the same label form segments; a run shorter than
+    min_segment_windows joins the segment before it (the first segment, when short,
+    joins the one after it). settled() tells which segments can no longer change label,
+    so they can be counted before the video has been read to the end.
+    """
+
+    def __init__(self, exercise_classes, window_size, stride, min_segment_windows):
+        self.exercise_classes = exercise_classes
+        self.window_size = window_size
+        self.stride = stride
+        self.min_segment_windows = min_segment_windows
+        self.labels = []
+        self.confidences = []
+        self.merged = []  # [label, first window, end window] of every closed run
+        self.run = None   # the run still being extended
+
+    def add(self, labels, confidences):
+        for label in labels.tolist():
+            index = len(self.labels)
+            self.labels.append(label)
+            if self.run is not None and self.run[0] == label:
+                self.run[2] = index + 1
+            else:
+                if self.run is not None:
+                    self.close(self.merged, self.run)
+                self.run = [label, index, index + 1]
+        self.confidences.extend(confidences.tolist())
+
+    def close(self, merged, run):
+        if merged and (run[2] - run[1] < self.min_segment_windows or merged[-1][0] == run[0]):
+            merged[-1][2] = run[2]
+        else:
+            merged.append(list(run))
+            if len(merged) == 2 and merged[0][2] - merged[0][1] < self.min_segment_windows:
+                merged[1][1] = merged[0][1]
+                merged.pop(0)
+
+    def settled(self):
+        segments = [list(segment) for segment in self.merged]
+        run = self.run
+        if run is not None:
+            if not segments or segments[-1][0] == run[0] or run[2] - run[1] >= self.min_segment_windows:
+                self.close(segments, run)
+            # else a short run of another label may still grow into a segment or join the last one
+        if len(segments) == 1 and segments[0][2] - segments[0][1] < self.min_segment_windows:
+            return []  # a short first segment may still join the next one
+        return segments
+
+    def finish(self):
+        if self.run is not None:
+            self.close(self.merged, self.run)
+            self.run = None
+        return self.merged
+
+    def frame_range(self, segments, i, detected_frames, final):
+        # A segment owns the detected frames between the centres of its boundary windows.
+        # Before the end the last segment only owns frames up to its last known window.
+        label, first, last = segments[i]
+        start = 0 if i == 0 else (first * self.stride + (first - 1) * self.stride) // 2 + self.window_size // 2
+        if final and i == len(segments) - 1:
+            end = detected_frames
+        else:
+            end = ((last - 1) * self.stride + last * self.stride) // 2 + self.window_size // 2
+        return start, min(end, detected_frames)
+
+
+class SegmentCounter:
+    """Counts the segments of a SegmentTimeline in order, frame by frame as they settle."""
+
+    def __init__(self, timeline, landmarks, frame_numbers, fps, metrics, rep_tracker=None):
+        self.timeline = timeline
+        self.landmarks = landmarks
+        self.frame_numbers = frame_numbers
+        self.fps = fps
+        self.metrics = metrics
+        self.rep_tracker = rep_tracker
+        self.width = self.height = 0
+        self.detector = pm.posture_detector()  # replays landmarks, no pose graph is built
+        self.segments = []  # finished segments
+        self.current = None  # index, count function, stage, reps, next frame of the segment being counted
+
+    def total_reps(self):
+        reps = sum(segment["reps"] or 0 for segment in self.segments)
+        if self.current is not None and self.current[3] is not None:
+            reps += self.current[3]
+        return reps
+
+    def count(self, settled, final=False):
+        timeline = self.timeline
+        for i in range(len(self.segments), len(settled)):
+            label, first, last = settled[i]
+            exercise_label = timeline.exercise_classes[label]
+            start, end = timeline.frame_range(settled, i, len(self.landmarks), final)
+            if self.current is None or self.current[0] != i:
+                count_function = COUNT_FUNCTIONS.get(exercise_label)
+                if count_function is not None and self.rep_tracker is not None:
+                    self.rep_tracker.begin(exercise_label)
+                self.current = [i, count_function, None, None if count_function is None else 0, start]
+            _, count_function, stage, reps, position = self.current
+            if count_function is not None:
+                with self.metrics.span("count"):
+                    for data, frame_number in zip(self.landmarks[position:end], self.frame_numbers[position:end]):
+                        if self.rep_tracker is not None:
+                            self.rep_tracker.frame_time = frame_number / self.fps
+                        landmark_list = self.detector.set_landmarks(data, self.width, self.height)
+                        stage, reps = count_function(self.detector, None, landmark_list, stage, reps, None,
+                                                     self.rep_tracker)
+            self.current[2:] = [stage, reps, max(position, end)]
+            if not final and i == len(settled) - 1:
+                break  # the last settled segment may still grow
+            self.segments.append({
+                "exercise": exercise_label,
+                "confidence": float(np.mean(timeline.confidences[first:last])),
+                "start_time": self.frame_numbers[start] / self.fps,
+                "end_time": (self.frame_numbers[end - 1] + 1) / self.fps,
+                "reps": reps,
+            })
+            self.current = None
+        return self.segments
 
 # Define the class that handles the analysis of the exercises
 import joblib
 from tensorflow.keras.models import load_model
 
+# Exercise classifiers; all take the same scaled 30x22 window and share the scaler and label encoder
+CLASSIFIER_MODELS = {
+    'bilstm': 'final_forthesis_bidirectionallstm_and_encoders_exercise_classifier_model.h5',
+    'student': 'student_exercise_classifier_model.h5',  # not shipped; build it with distill_classifier.py
+}
+
 class Exercise:
-    def __init__(self):
+    def __init__(self, metrics=None, detector_factory=None, analysis_fps=None, quality=None, classifier=None,
+                 recorder=None, reps=None, presence=None, telemetry=None, classification_gate=None):
         self.lstm_model = None
         self.scaler = None
         self.label_encoder = None
         self.exercise_classes = []
+        # Stage timings; disabled unless the caller passes an enabled FrameMetrics
+        self.metrics = metrics if metrics is not None else FrameMetrics(enabled=False)
+        # Builds the pose detectors; e.g. PoseLease.detector to use a shared pool worker
+        self.detector_factory = detector_factory or pm.posture_detector
+        # Frames analysed per second of uploaded video; None analyses every frame it gets to
+        self.analysis_fps = analysis_fps
+        # Optional AdaptiveQualityController that tunes the pose model to hold a frame rate
+        self.quality = quality
+        # Optional SessionRecorder that keeps the landmark stream of exercise_method sessions
+        self.recorder = recorder
+        # Optional RepTracker that receives every rep counted by exercise_method
+        self.reps = reps
+        # Optional PresenceGate that idles the webcam loops while nobody is in front of the camera
+        self.presence = presence
+        # Optional TelemetryPublisher that shows the live exercise, stage and count to the doctor
+        self.telemetry = telemetry
+        # Optional ClassificationGate that skips the classifier while the movement is unchanged
+        self.classification_gate = classification_gate
+
+        # Which classifier to load; EXERCISE_CLASSIFIER=student picks the distilled model
+        self.classifier = classifier or os.getenv('EXERCISE_CLASSIFIER', 'bilstm')
 
         # Load LSTM model
         try:
-            self.lstm_model = load_model('final_forthesis_bidirectionallstm_and_encoders_exercise_classifier_model.h5')
+            self.lstm_model = load_model(CLASSIFIER_MODELS[self.classifier])
         except Exception as e:
-            print(f"❌ Error loading LSTM model: {e}")
+            print(f"❌ Error loading {self.classifier} classifier: {e}")
+            if self.classifier != 'bilstm':
+                print("⚙️ Falling back to the BiLSTM classifier")
+                self.classifier = 'bilstm'
+                try:
+                    self.lstm_model = load_model(CLASSIFIER_MODELS['bilstm'])
+                except Exception as e:
+                    print(f"❌ Error loading LSTM model: {e}")
 
         # Load scaler
         try:
@@ -155,91 +411,167 @@ class Exercise:
         print("✅ Starting classification and counting...")
 
     def extract_features(self, landmarks):
-        features = []
-        if len(landmarks) == len(relevant_landmarks_indices) * 3:
-            # Angles
-            features.append(calculate_angle(landmarks[0:3], landmarks[6:9], landmarks[12:15]))  # LEFT_SHOULDER, LEFT_ELBOW, LEFT_WRIST
-            features.append(calculate_angle(landmarks[3:6], landmarks[9:12], landmarks[15:18]))  # RIGHT_SHOULDER, RIGHT_ELBOW, RIGHT_WRIST
-            features.append(calculate_angle(landmarks[18:21], landmarks[24:27], landmarks[30:33]))  # LEFT_HIP, LEFT_KNEE, LEFT_ANKLE
-            features.append(calculate_angle(landmarks[21:24], landmarks[27:30], landmarks[33:36]))  # RIGHT_HIP, RIGHT_KNEE, RIGHT_ANKLE
-            features.append(calculate_angle(landmarks[0:3], landmarks[18:21], landmarks[24:27]))  # LEFT_SHOULDER, LEFT_HIP, LEFT_KNEE
-            features.append(calculate_angle(landmarks[3:6], landmarks[21:24], landmarks[27:30]))  # RIGHT_SHOULDER, RIGHT_HIP, RIGHT_KNEE
-
-            # New angles
-            features.append(calculate_angle(landmarks[18:21], landmarks[0:3], landmarks[6:9]))  # LEFT_HIP, LEFT_SHOULDER, LEFT_ELBOW
-            features.append(calculate_angle(landmarks[21:24], landmarks[3:6], landmarks[9:12]))  # RIGHT_HIP, RIGHT_SHOULDER, RIGHT_ELBOW
-
-            # Distances
-            distances = [
-                calculate_distance(landmarks[0:3], landmarks[3:6]),  # LEFT_SHOULDER, RIGHT_SHOULDER
-                calculate_distance(landmarks[18:21], landmarks[21:24]),  # LEFT_HIP, RIGHT_HIP
-                calculate_distance(landmarks[18:21], landmarks[24:27]),  # LEFT_HIP, LEFT_KNEE
-                calculate_distance(landmarks[21:24], landmarks[27:30]),  # RIGHT_HIP, RIGHT_KNEE
-                calculate_distance(landmarks[0:3], landmarks[18:21]),  # LEFT_SHOULDER, LEFT_HIP
-                calculate_distance(landmarks[3:6], landmarks[21:24]),  # RIGHT_SHOULDER, RIGHT_HIP
-                calculate_distance(landmarks[6:9], landmarks[24:27]),  # LEFT_ELBOW, LEFT_KNEE
-                calculate_distance(landmarks[9:12], landmarks[27:30]),  # RIGHT_ELBOW, RIGHT_KNEE
-                calculate_distance(landmarks[12:15], landmarks[0:3]),  # LEFT_WRIST, LEFT_SHOULDER
-                calculate_distance(landmarks[15:18], landmarks[3:6]),  # RIGHT_WRIST, RIGHT_SHOULDER
-                calculate_distance(landmarks[12:15], landmarks[18:21]),  # LEFT_WRIST, LEFT_HIP
-                calculate_distance(landmarks[15:18], landmarks[21:24])   # RIGHT_WRIST, RIGHT_HIP
-            ]
-
-            # Y-coordinate distances
-            y_distances = [
-                calculate_y_distance(landmarks[6:9], landmarks[0:3]),  # LEFT_ELBOW, LEFT_SHOULDER
-                calculate_y_distance(landmarks[9:12], landmarks[3:6])   # RIGHT_ELBOW, RIGHT_SHOULDER
-            ]
-
-            # Normalization factor based on shoulder-hip or hip-knee distance
-            normalization_factor = -1
-            distances_to_check = [
-                calculate_distance(landmarks[0:3], landmarks[18:21]),  # LEFT_SHOULDER, LEFT_HIP
-                calculate_distance(landmarks[3:6], landmarks[21:24]),  # RIGHT_SHOULDER, RIGHT_HIP
-                calculate_distance(landmarks[18:21], landmarks[24:27]),  # LEFT_HIP, LEFT_KNEE
-                calculate_distance(landmarks[21:24], landmarks[27:30])   # RIGHT_HIP, RIGHT_KNEE
-            ]
-
-            for distance in distances_to_check:
-                if distance > 0:
-                    normalization_factor = distance
-                    break
-            
-            if normalization_factor == -1:
-                normalization_factor = 0.5  # Fallback normalization factor
-            
-            # Normalize distances
-            normalized_distances = [d / normalization_factor if d != -1.0 else d for d in distances]
-            normalized_y_distances = [d / normalization_factor if d != -1.0 else d for d in y_distances]
-
-            # Combine features
-            features.extend(normalized_distances)
-            features.extend(normalized_y_distances)
-
-        else:
-            print(f"Insufficient landmarks: expected {len(relevant_landmarks_indices)}, got {len(landmarks)//3}")
-            features = [-1.0] * 22  # Placeholder for missing landmarks
-        return features
-    
-    def preprocess_frame(self, frame, pose):
-        frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = pose.process(frame_rgb)
-        landmarks = []
-        if results.pose_landmarks:
-            for idx in relevant_landmarks_indices:
-                landmark = results.pose_landmarks.landmark[idx]
-                landmarks.extend([landmark.x, landmark.y, landmark.z])
-        return landmarks
+        if len(landmarks) != 0:
+            return landmark_features(landmarks)
+        print(f"Insufficient landmarks: expected {len(relevant_landmarks_indices)}, got 0")
+        return np.full(22, -1.0)  # Placeholder for missing landmarks
+
+    def adapt_quality(self, detector, pose_seconds):
+        if self.quality is not None:
+            self.quality.observe(detector, pose_seconds)
+
+    def skip_idle_frame(self, frame, stframe):
+        # True if the presence gate lets this webcam frame go without pose inference
+        if self.presence is None or self.presence.check(frame):
+            return False
+        self.presence.draw_overlay(frame)
+        with self.metrics.span("display"):
+            stframe.image(frame, channels='BGR', use_container_width=True)
+        if self.quality is not None:
+            self.quality.pause()
+        self.presence.wait()
+        return True
+
+    def observe_presence(self, landmark_list):
+        if self.presence is not None:
+            self.presence.observe(len(landmark_list) != 0)
+
+    def publish_state(self, exercise_label, stage, counter):
+        if self.telemetry is not None:
+            self.telemetry.update(exercise=exercise_label, stage=stage, counter=counter)
+
+    def record_frame(self, landmark_list, stage, counter):
+        if self.recorder is not None:
+            self.recorder.record(time.time(), landmark_list, stage, counter)
+
+    def preprocess_frame(self, frame, detector):
+        detector.find_person(frame, draw=False)
+        return detector.find_landmarks(frame, draw=False)
+
+    # (frame, landmark list, pose seconds) for every frame read(buffer) returns. A pooled
+    # detector keeps the next frames in flight in its worker, so capture and inference
+    # overlap (live=True drops frames the worker cannot keep up with, files wait);
+    # a local one runs them one after the other.
+    def pose_stream(self, detector, read, live):
+        if hasattr(detector, "stream"):
+            for frame, landmark_list in detector.stream(read, live, self.metrics):
+                yield frame, landmark_list, detector.pose_seconds
+            return
+        while True:
+            ret, frame = read(detector.frame_buffer())
+            if not ret:
+                return
+            pose_start = time.perf_counter()
+            with self.metrics.span("pose"):
+                landmark_list = self.preprocess_frame(frame, detector)
+            yield frame, landmark_list, time.perf_counter() - pose_start
     
     def visualize_angle(self, img, angle, landmark):
         cv2.putText(img, str(int(angle)),
-                    tuple(np.multiply(landmark, [640, 480]).astype(int)),
+                    tuple(np.multiply(landmark, [img.shape[1], img.shape[0]]).astype(int)),
                     cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA)
 
+    # Classify one window of feature vectors, returns the exercise label or None
+    def classify_window(self, landmarks_window, window_size=30):
+        landmarks_window_np = np.array(landmarks_window).flatten().reshape(1, -1)
+        scaled_landmarks_window = self.scaler.transform(landmarks_window_np)
+        scaled_landmarks_window = scaled_landmarks_window.reshape(1, window_size, 22)
+
+        prediction = self.lstm_model.predict(scaled_landmarks_window, verbose=0)
+
+        if prediction.shape[1] != len(self.exercise_classes):
+            print(f"Unexpected prediction shape: {prediction.shape}")
+            return None
+
+        predicted_class = np.argmax(prediction, axis=1)[0]
+
+        if predicted_class >= len(self.exercise_classes):
+            print(f"Invalid class index: {predicted_class}")
+            return None
+
+        return self.exercise_classes[predicted_class]
+
+    # Class probabilities for every window of a (frames, 22) feature array, starting
+    # every `stride` frames. Windows are a strided view of the features; only one batch
+    # at a time is copied for scaling.
+    def classify_windows(self, features, window_size=30, stride=5, batch_size=256):
+        windows = np.lib.stride_tricks.sliding_window_view(features, window_size, axis=0)
+        windows = windows.transpose(0, 2, 1)[::stride]  # (n_windows, window_size, 22)
+        probabilities = np.empty((len(windows), len(self.exercise_classes)), dtype=np.float32)
+        for start in range(0, len(windows), batch_size):
+            batch = windows[start:start + batch_size].reshape(-1, window_size * 22)
+            scaled = self.scaler.transform(batch).reshape(-1, window_size, 22)
+            probabilities[start:start + batch_size] = self.lstm_model.predict_on_batch(scaled)
+        return probabilities
+
+    # Offline auto-classification of a whole video: pose once per frame, with the windows
+    # classified in batches of chunk_windows as the video is read. Returns the timeline of
+    # exercise segments, each counted with the counter for its label (and its reps reported
+    # to rep_tracker, timed by the video clock). progress(fraction, reps) sees the reps
+    # counted so far and reaches 1.0 only once the last segment is counted.
+    def classify_video(self, cap, window_size=30, stride=5, batch_size=256, min_segment_windows=3, progress=None,
+                       rep_tracker=None, chunk_windows=12):
+        if not self.is_ready():
+            print("🚫 Model components not fully loaded. Cannot proceed.")
+            return []
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        detector = self.detector_factory()
+        metrics = self.metrics
+
+        features, landmarks, frame_numbers = [], [], []
+        timeline = SegmentTimeline(self.exercise_classes, window_size, stride, min_segment_windows)
+        counter = SegmentCounter(timeline, landmarks, frame_numbers, fps, metrics, rep_tracker)
+        frame_number = 0
+
+        def classify_pending():
+            # Windows not classified yet, given the detected frames read so far
+            first = len(timeline.labels)
+            available = (len(features) - window_size) // stride + 1
+            if available <= first:
+                return
+            with metrics.span("classify"):
+                chunk = np.asarray(features[first * stride:(available - 1) * stride + window_size])
+                probabilities = self.classify_windows(chunk, window_size, stride, batch_size)
+            timeline.add(probabilities.argmax(axis=1), probabilities.max(axis=1))
+
+        def read(buffer):
+            with metrics.span("capture"):
+                return cap.read(buffer) if cap.isOpened() else (False, None)
+
+        for frame, landmark_list, _ in self.pose_stream(detector, read, live=False):
+            if len(landmark_list) != 0:
+                with metrics.span("features"):
+                    features.append(self.extract_features(landmark_list))
+                landmarks.append(landmark_list.data.copy())
+                frame_numbers.append(frame_number)
+                counter.width, counter.height = landmark_list.width, landmark_list.height
+                if len(features) >= window_size and \
+                        (len(features) - window_size) // stride + 1 - len(timeline.labels) >= chunk_windows:
+                    classify_pending()
+                    counter.count(timeline.settled())
+            frame_number += 1
+            metrics.tick()
+            if progress is not None and total_frames:
+                # The last step is left for counting the final segment
+                progress(min(frame_number / total_frames, 0.99), counter.total_reps())
+        cap.release()
+
+        if len(features) < window_size:
+            print(f"Not enough frames with a person to classify: {len(features)} of {window_size}")
+            return []
+
+        classify_pending()
+        segments = counter.count(timeline.finish(), final=True)
+        if progress is not None:
+            progress(1.0, counter.total_reps())
+        return segments
+
     # Auto classify and count method with repetition counting logic
-    def auto_classify_and_count(self):
+    def auto_classify_and_count(self, source=0):
         stframe = st.empty()
-        cap = cv2.VideoCapture(0)
+        cap = cv2.VideoCapture(source)
         if not cap.isOpened():
             print("Error opening webcam.")
             return
@@ -253,61 +585,66 @@ class Exercise:
 
         print("Starting real-time classification...")
 
-        detector = pm.posture_detector()
-        pose = mp.solutions.pose.Pose()
+        detector = self.detector_factory()
+        metrics = self.metrics
 
         while True:
-            ret, frame = cap.read()
+            with metrics.span("capture"):
+                ret, frame = cap.read()
             if not ret:
                 print("Error reading frame.")
                 break
+            if self.skip_idle_frame(frame, stframe):
+                continue
 
-            landmarks = self.preprocess_frame(frame, pose)
-            if len(landmarks) == len(relevant_landmarks_indices) * 3:
-                features = self.extract_features(landmarks)
-                if len(features) == 22:
-                    landmarks_window.append(features)
+            # One pose inference per frame feeds both classification and counting
+            pose_start = time.perf_counter()
+            with metrics.span("pose"):
+                landmark_list = self.preprocess_frame(frame, detector)
+            self.adapt_quality(detector, time.perf_counter() - pose_start)
+            self.observe_presence(landmark_list)
+
+            with metrics.span("features"):
+                if len(landmark_list) != 0:
+                    landmarks_window.append(self.extract_features(landmark_list))
 
             frame_count += 1
 
             if len(landmarks_window) == window_size:
-                landmarks_window_np = np.array(landmarks_window).flatten().reshape(1, -1)
-                scaled_landmarks_window = self.scaler.transform(landmarks_window_np)
-                scaled_landmarks_window = scaled_landmarks_window.reshape(1, window_size, 22)
-
-                prediction = self.lstm_model.predict(scaled_landmarks_window)
-
-                if prediction.shape[1] != len(self.exercise_classes):
-                    print(f"Unexpected prediction shape: {prediction.shape}")
-                    return
-
-                predicted_class = np.argmax(prediction, axis=1)[0]
-
-                if predicted_class >= len(self.exercise_classes):
-                    print(f"Invalid class index: {predicted_class}")
+                with metrics.span("classify"):
+                    if self.classification_gate is not None:
+                        prediction = self.classification_gate.classify(landmarks_window, self, window_size)
+                    else:
+                        prediction = self.classify_window(landmarks_window, window_size)
+                if prediction is None:
                     return
 
-                current_prediction = self.exercise_classes[predicted_class]
+                current_prediction = prediction
                 print(f"Current Prediction: {current_prediction}")
 
                 landmarks_window = []
                 frame_count = 0
 
             # Repetition counting logic based on current prediction
-            detector.find_person(frame, draw=True)  # Ensuring landmarks are drawn on the frame
-            landmark_list = detector.find_landmarks(frame, draw=True)  # Change draw=False to draw=True
-            if len(landmark_list) > 0:
-                if self.are_hands_joined(landmark_list, stop=True):
-                    break  # Stop if hands are joined
-
-                if current_prediction == 'push-up':
-                    stages['push_up'], counters['push_up'] = count_repetition_push_up(detector, frame, landmark_list, stages['push_up'], counters['push_up'], self)
-
-                elif current_prediction == 'squat':
-                    stages['squat'], counters['squat'] = count_repetition_squat(detector, frame, landmark_list, stages['squat'], counters['squat'], self)
-
-                elif current_prediction == 'shoulder press':
-                    stages['shoulder_press'], counters['shoulder_press'] = count_repetition_shoulder_press(detector, frame, landmark_list, stages['shoulder_press'], counters['shoulder_press'], self)
+            with metrics.span("draw"):
+                detector.draw_person(frame)  # Ensuring landmarks are drawn on the frame
+                detector.find_landmarks(frame, draw=True)
+            with metrics.span("count"):
+                if len(landmark_list) > 0:
+                    if self.are_hands_joined(landmark_list, stop=True):
+                        break  # Stop if hands are joined
+
+                    if current_prediction == 'push-up':
+                        stages['push_up'], counters['push_up'] = count_repetition_push_up(detector, frame, landmark_list, stages['push_up'], counters['push_up'], self)
+
+                    elif current_prediction == 'squat':
+                        stages['squat'], counters['squat'] = count_repetition_squat(detector, frame, landmark_list, stages['squat'], counters['squat'], self)
+
+                    elif current_prediction == 'shoulder press':
+                        stages['shoulder_press'], counters['shoulder_press'] = count_repetition_shoulder_press(detector, frame, landmark_list, stages['shoulder_press'], counters['shoulder_press'], self)
+            counter_key = current_prediction.replace('-', '_').replace(' ', '_')
+            if counter_key in counters:
+                self.publish_state(current_prediction, stages[counter_key], counters[counter_key])
             
             exercise_name_map = {
                 'push_up': 'Push-up',
@@ -315,25 +652,29 @@ class Exercise:
                 'shoulder_press': 'Press'
             }
 
-            # Calculate the spacing for exercise repetitions display
-            height, width, _ = frame.shape
-            num_exercises = len(counters)
-            vertical_spacing = height // (num_exercises + 1)
+            with metrics.span("draw"):
+                # Calculate the spacing for exercise repetitions display
+                height, width, _ = frame.shape
+                num_exercises = len(counters)
+                vertical_spacing = height // (num_exercises + 1)
 
-            # Draw black rectangles on the left and top side
-            cv2.rectangle(frame, (0, 0), (120, height), (0, 0, 0), -1)
-            cv2.rectangle(frame, (0, 0), (width, 30), (0, 0, 0), -1)
+                # Draw black rectangles on the left and top side
+                cv2.rectangle(frame, (0, 0), (120, height), (0, 0, 0), -1)
+                cv2.rectangle(frame, (0, 0), (width, 30), (0, 0, 0), -1)
 
-            # Display the frame with predicted exercise and repetition count
-            short_name = exercise_name_map.get(current_prediction, current_prediction)
-            text_size, _ = cv2.getTextSize(f"Exercise: {short_name}", cv2.FONT_HERSHEY_SIMPLEX, 1.5, 2)
-            draw_styled_text(frame, f"Exercise: {short_name}", ((width - 290) // 2 + 100, 20))
+                # Display the frame with predicted exercise and repetition count
+                short_name = exercise_name_map.get(current_prediction, current_prediction)
+                draw_styled_text(frame, f"Exercise: {short_name}", ((width - 290) // 2 + 100, 20))
 
-            for idx, (exercise, count) in enumerate(counters.items()):
-                short_name = exercise_name_map.get(exercise, exercise)
-                draw_styled_text(frame, f"{short_name}: {count}", (10, (idx + 1) * vertical_spacing))
+                for idx, (exercise, count) in enumerate(counters.items()):
+                    short_name = exercise_name_map.get(exercise, exercise)
+                    draw_styled_text(frame, f"{short_name}: {count}", (10, (idx + 1) * vertical_spacing))
 
-            stframe.image(frame, channels='BGR', use_container_width=True)
+                metrics.draw_overlay(frame)
+
+            with metrics.span("display"):
+                stframe.image(frame, channels='BGR', use_container_width=True)
+            metrics.tick()
 
             if cv2.waitKey(1) & 0xFF == ord('q'):
                 break
@@ -343,12 +684,12 @@ class Exercise:
     
     # Check if hands are joined together in a 'prayer' gesture
     def are_hands_joined(self, landmark_list, stop, is_video=False):
-        # Extract wrist coordinates
-        left_wrist = landmark_list[15][1:]  # (x, y) for left wrist
-        right_wrist = landmark_list[16][1:]  # (x, y) for right wrist
+        # Extract wrist pixel coordinates
+        left_x, left_y = landmark_list.pixel(15)  # (x, y) for left wrist
+        right_x, right_y = landmark_list.pixel(16)  # (x, y) for right wrist
 
         # Calculate the Euclidean distance between the wrists
-        distance = np.linalg.norm(np.array(left_wrist) - np.array(right_wrist))
+        distance = math.hypot(left_x - right_x, left_y - right_y)
         # Consider hands joined if the distance is below a certain threshold, e.g., 50 pixels
         if distance < 30 and not is_video:
             print("JOINED HANDS")
@@ -360,7 +701,7 @@ class Exercise:
     # Visualize the angle between 3 point on screen
     def visualize_angle(self, img, angle, landmark):
             cv2.putText(img, str(angle),
-                        tuple(np.multiply(landmark, [640, 480]).astype(int)),
+                        tuple(np.multiply(landmark, [img.shape[1], img.shape[0]]).astype(int)),
                         cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 2, cv2.LINE_AA
                         )
 
@@ -392,97 +733,120 @@ class Exercise:
     # Generic exercise method
     # Generic exercise method
     def exercise_method(self, cap, is_video, count_repetition_function, multi_stage=False, counter=0, stage=None, stage_right=None, stage_left=None):
+        metrics = self.metrics
         if is_video:
             stframe = st.empty()
-            detector = pm.posture_detector()
-
-            # Get the original video's FPS
-            original_fps = cap.get(cv2.CAP_PROP_FPS)
-            if not original_fps or original_fps == 0:
-                original_fps = 30  # fallback FPS
-            frame_time = 1 / original_fps
+            detector = self.detector_factory()
 
+            # Skipped frames are only grabbed; analysis_fps thins out the analysed ones
+            sampler = FrameSampler(cap, self.analysis_fps)
+            original_fps = sampler.fps  # 30 if the file does not say
 
-            frame_count = 0
             start_time = time.time()
             last_update_time = start_time
 
             update_interval = 0.1  # Update display every 100ms
 
-            while cap.isOpened():
-                current_time = time.time()
-                elapsed_time = current_time - start_time
-
-                # Determine how many frames should have been processed by now
-                target_frame = int(elapsed_time * original_fps)
-
-                # Process frames until we catch up to where we should be
-                while frame_count < target_frame:
-                    ret, frame = cap.read()
-                    if not ret:
-                        print("End of video.")
-                        return
-
-                    frame_count += 1
-
-                    # Process the last frame we read
-                    if frame_count == target_frame:
-                        img = detector.find_person(frame)
-                        landmark_list = detector.find_landmarks(img, draw=False)
-
+            def read(buffer):
+                # Waits until the next frame is due, catching up to where we should be
+                while cap.isOpened():
+                    # Determine how many frames should have been processed by now
+                    target_frame = int((time.time() - start_time) * original_fps)
+                    frame_number = sampler.snap(target_frame - 1)
+                    if frame_number is not None:
+                        with metrics.span("capture"):
+                            return sampler.read_at(frame_number, buffer)
+                    # Small sleep to prevent busy-waiting
+                    time.sleep(0.001)
+                return False, None
+
+            # The pose worker infers one frame while the next ones are decoded
+            with contextlib.closing(self.pose_stream(detector, read, live=False)) as frames:
+                for img, landmark_list, pose_seconds in frames:
+                    self.adapt_quality(detector, pose_seconds)
+                    with metrics.span("draw"):
+                        detector.draw_person(img)
+
+                    with metrics.span("count"):
                         if len(landmark_list) != 0:
                             if multi_stage:
                                 stage_right, stage_left, counter = count_repetition_function(detector, img, landmark_list, stage_right, stage_left, counter, self)
                             else:
-                                stage, counter = count_repetition_function(detector, img, landmark_list, stage, counter, self)
+                                stage, counter = count_repetition_function(detector, img, landmark_list, stage, counter, self, self.reps)
 
                             if self.are_hands_joined(landmark_list, stop=False, is_video=is_video):
                                 return
+                    self.record_frame(landmark_list, stage, counter)
 
+                    with metrics.span("draw"):
                         self.repetitions_counter(img, counter)
+                        metrics.draw_overlay(img)
+                    metrics.tick()
 
-                # Update display at regular intervals
-                if current_time - last_update_time >= update_interval:
-                    stframe.image(img, channels='BGR', use_container_width=True)
-                    last_update_time = current_time
-
-                # Small sleep to prevent busy-waiting
-                time.sleep(0.001)
+                    # Update display at regular intervals
+                    current_time = time.time()
+                    if current_time - last_update_time >= update_interval:
+                        with metrics.span("display"):
+                            stframe.image(img, channels='BGR', use_container_width=True)
+                        last_update_time = current_time
 
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
+                        break
+                else:
+                    print("End of video.")
 
             cap.release()
             cv2.destroyAllWindows()
+            return counter
         else:
             # Original webcam exercise code
             stframe = st.empty()
-            cap = cv2.VideoCapture(0)
-            detector = pm.posture_detector()
+            exercise_label = next((label for label, function in COUNT_FUNCTIONS.items()
+                                   if function is count_repetition_function), None)
+            if cap is None or not cap.isOpened():
+                cap = cv2.VideoCapture(0)
+            detector = self.detector_factory()
+
+            def read(buffer):
+                with metrics.span("capture"):
+                    ret, frame = cap.read(buffer)
+                while ret and self.skip_idle_frame(frame, stframe):
+                    with metrics.span("capture"):
+                        ret, frame = cap.read(buffer)
+                return ret, frame
+
+            # The camera's next frame is captured while the pose worker infers this one;
+            # when inference falls behind, the oldest waiting frame is dropped
+            with contextlib.closing(self.pose_stream(detector, read, live=True)) as frames:
+                for img, landmark_list, pose_seconds in frames:
+                    self.adapt_quality(detector, pose_seconds)
+                    self.observe_presence(landmark_list)
+                    with metrics.span("draw"):
+                        detector.draw_person(img)
+
+                    with metrics.span("count"):
+                        if len(landmark_list) != 0:
+                            if multi_stage:
+                                stage_right, stage_left, counter = count_repetition_function(detector, img, landmark_list, stage_right, stage_left, counter, self)
+                            else:
+                                stage, counter = count_repetition_function(detector, img, landmark_list, stage, counter, self, self.reps)
 
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
+                            if self.are_hands_joined(landmark_list, stop=False):
+                                break
+                    self.record_frame(landmark_list, stage, counter)
+                    self.publish_state(exercise_label, stage, counter)
 
-                img = detector.find_person(frame)
-                landmark_list = detector.find_landmarks(img, draw=False)
+                    with metrics.span("draw"):
+                        self.repetitions_counter(img, counter)
+                        metrics.draw_overlay(img)
 
-                if len(landmark_list) != 0:
-                    if multi_stage:
-                        stage_right, stage_left, counter = count_repetition_function(detector, img, landmark_list, stage_right, stage_left, counter, self)
-                    else:
-                        stage, counter = count_repetition_function(detector, img, landmark_list, stage, counter, self)
+                    with metrics.span("display"):
+                        stframe.image(img, channels='BGR', use_container_width=True)
+                    metrics.tick()
 
-                    if self.are_hands_joined(landmark_list, stop=False):
+                    if cv2.waitKey(1) & 0xFF == ord('q'):
                         break
 
-                self.repetitions_counter(img, counter)
-                stframe.image(img, channels='BGR', use_container_width=True)
-
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-
             cap.release()
             cv2.destroyAllWindows()
-            return counter
+            return counter
\ No newline at end of file
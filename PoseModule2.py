@@ -2,49 +2,151 @@ import mediapipe as mp
 import math
 import cv2
 import time
+import numpy as np
+
+NUM_LANDMARKS = 33
+
+
+# Landmarks of one frame: a preallocated (33, 4) float32 array of normalized
+# x, y, z and visibility. Pixel coordinates are computed on demand from the frame size.
+class PoseLandmarks():
+    def __init__(self):
+        self.data = np.zeros((NUM_LANDMARKS, 4), dtype=np.float32)
+        self.width = 0
+        self.height = 0
+        self.detected = False
+
+    # Empty when no person was found, so `len(landmark_list) != 0` checks keep working
+    def __len__(self):
+        return NUM_LANDMARKS if self.detected else 0
+
+    def pixel(self, idx):
+        return int(self.data[idx, 0].item() * self.width), int(self.data[idx, 1].item() * self.height)
+
+    def pixels(self):
+        return (self.data[:, :2].astype(np.float64) * (self.width, self.height)).astype(np.int64)
+
+# Same look as mp_draw.draw_landmarks, drawn from a PoseLandmarks array
+def draw_landmark_array(img, landmarks, connections):
+    if not landmarks.detected:
+        return img
+    points = landmarks.pixels().tolist()
+    visible = (landmarks.data[:, 3] >= 0.5).tolist()
+    for start, end in connections:
+        if visible[start] and visible[end]:
+            cv2.line(img, points[start], points[end], (224, 224, 224), 2)
+    for point, is_visible in zip(points, visible):
+        if is_visible:
+            cv2.circle(img, point, 2, (0, 0, 255), 2)
+    return img
 
 # ADD THE MACHINE LEARNING MECHANIOSM TO MAKE THE CALCULATION OF THE EXERCISE EIN AN AUTOMATIC WAY
 class posture_detector():
-    def __init__(self, mode=False, up_body=1, smooth=True,
+    def __init__(self, mode=False, model_complexity=1, smooth=True,
                  detection_con=0.5, track_con=0.5):
         self.mode = mode
-        self.up_body = up_body
+        # 0 = lite, 1 = full, 2 = heavy landmark model
+        self.model_complexity = model_complexity
         self.smooth = smooth
         self.detection_con = detection_con
         self.track_con = track_con
 
         self.mp_draw = mp.solutions.drawing_utils
         self.mp_pose = mp.solutions.pose
-        self.pose = self.mp_pose.Pose(self.mode, self.up_body, self.smooth,
-                                     min_detection_confidence=self.detection_con, min_tracking_confidence= self.track_con)
+        # The pose graph is built on first use, so detectors that only replay stored
+        # landmarks (see set_landmarks) never pay for it
+        self._pose = None
+        # Reused for every frame instead of building a new list of landmarks
+        self.landmarks = PoseLandmarks()
+        self.landmark_list = self.landmarks
+
+    def build_pose(self):
+        return self.mp_pose.Pose(static_image_mode=self.mode,
+                                 model_complexity=self.model_complexity,
+                                 smooth_landmarks=self.smooth,
+                                 min_detection_confidence=self.detection_con,
+                                 min_tracking_confidence=self.track_con)
+
+    @property
+    def pose(self):
+        if self._pose is None:
+            self._pose = self.build_pose()
+        return self._pose
+
+    @pose.setter
+    def pose(self, pose):
+        self._pose = pose
+
+    # Switch to another landmark model / confidence setting. The new graph is built
+    # before the old one is dropped, so a model that fails to load leaves the detector as it was.
+    def set_quality(self, model_complexity=None, detection_con=None, track_con=None):
+        previous = (self.model_complexity, self.detection_con, self.track_con)
+        if model_complexity is not None:
+            self.model_complexity = model_complexity
+        if detection_con is not None:
+            self.detection_con = detection_con
+        if track_con is not None:
+            self.track_con = track_con
+        try:
+            pose = self.build_pose()
+        except Exception:
+            self.model_complexity, self.detection_con, self.track_con = previous
+            raise
+        if self._pose is not None:
+            self._pose.close()
+        self._pose = pose
+
     def find_person(self, img, draw=True):
         # Recolor image to RGB
         img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
         self.results = self.pose.process(img_rgb)
+        self.update_landmarks(img)
+
+        if draw:
+            self.draw_person(img)
+        return img
+
+    # Array the next frame can be decoded into (cap.read(buffer)); None means allocate a new one
+    def frame_buffer(self):
+        return None
 
-        if self.results.pose_landmarks and draw:
+    def draw_person(self, img):
+        if self.results.pose_landmarks:
             self.mp_draw.draw_landmarks(
                 img, self.results.pose_landmarks, self.mp_pose.POSE_CONNECTIONS)
         return img
 
-    def find_landmarks(self, img, draw=True):
-        self.landmark_list = []
-        if self.results.pose_landmarks:
+    # Copy the pose results into the preallocated landmark array
+    def update_landmarks(self, img):
+        landmarks = self.landmarks
+        landmarks.height, landmarks.width = img.shape[:2]
+        landmarks.detected = self.results.pose_landmarks is not None
+        if landmarks.detected:
+            data = landmarks.data
             for id, lm in enumerate(self.results.pose_landmarks.landmark):
-                h, w, c = img.shape
-                # print(id, lm)
-                cx, cy = int(lm.x * w), int(lm.y * h)
-                self.landmark_list.append([id, cx, cy])
-                if draw:
-                    cv2.circle(img, (cx, cy), 5, (255, 0, 0), cv2.FILLED)
-        return self.landmark_list
+                data[id] = (lm.x, lm.y, lm.z, lm.visibility)
+
+    # Load previously extracted landmarks instead of running inference
+    def set_landmarks(self, data, width, height):
+        landmarks = self.landmarks
+        landmarks.width, landmarks.height = width, height
+        landmarks.detected = data is not None
+        if landmarks.detected:
+            landmarks.data[:] = data
+        return landmarks
+
+    def find_landmarks(self, img, draw=True):
+        if draw and self.landmarks.detected:
+            for cx, cy in self.landmarks.pixels().tolist():
+                cv2.circle(img, (cx, cy), 5, (255, 0, 0), cv2.FILLED)
+        return self.landmarks
 
     # Given any three points/co-ordinates, it gives us an angle(joint)
     def find_angle(self, img, p1, p2, p3, draw=True):
         # Get the landmarks
-        x1, y1 = self.landmark_list[p1][1:]
-        x2, y2 = self.landmark_list[p2][1:]
-        x3, y3 = self.landmark_list[p3][1:]
+        x1, y1 = self.landmarks.pixel(p1)
+        x2, y2 = self.landmarks.pixel(p2)
+        x3, y3 = self.landmarks.pixel(p3)
         # Calculate the Angle
         angle = math.degrees(math.atan2(y3 - y2, x3 - x2) -
                              math.atan2(y1 - y2, x1 - x2))
@@ -53,7 +155,7 @@ class posture_detector():
 
 
         # Draw
-        if draw:
+        if draw and img is not None:
             cv2.line(img, (x1, y1), (x2, y2), (255, 255, 255), 5)
             cv2.line(img, (x3, y3), (x2, y2), (255, 255, 255), 5)
             cv2.circle(img, (x1, y1), 11, (0, 0, 255), cv2.FILLED)
@@ -72,10 +174,11 @@ class posture_detector():
 def main():
     cap = cv2.VideoCapture(0)
     detector = posture_detector()
+    pTime = time.perf_counter()
     while True:
         ret, frame = cap.read()
-
-        pTime = 0
+        if not ret:
+            break
 
         img = detector.find_person(frame)
         landmark_list = detector.find_landmarks(img, draw=True)
@@ -84,9 +187,9 @@ def main():
         if len(landmark_list) != 0:
 
             cv2.circle(
-                img, (landmark_list[14][1], landmark_list[14][2]), 15, (0, 0, 255), cv2.FILLED)
+                img, landmark_list.pixel(14), 15, (0, 0, 255), cv2.FILLED)
 
-        cTime = time.time()
+        cTime = time.perf_counter()
         fps = 1 / (cTime - pTime)
         pTime = cTime
 
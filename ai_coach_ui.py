@@ -1,10 +1,174 @@
 import streamlit as st
 import cv2
-import tempfile
 import ExerciseAiTrainer as exercise
-from chatbot import chat_ui
+from chatbot import chat_ui, get_session_resources
 from datetime import date
+import json
+import os
+import re
 import time
+import pandas as pd
+from perf_metrics import FrameMetrics
+from pose_pool import PosePool, PoolSaturated
+from upload_spool import UploadSpool
+from quality_controller import AdaptiveQualityController
+from keyframe_pose import KeyframePostureDetector
+from presence_gate import PresenceGate
+from analysis_jobs import ACTIVE, AUTO_DETECT, DONE, AnalysisJobQueue, JobLimitExceeded
+from session_recorder import SessionRecorder
+from rep_events import RepEventWriter, RepTracker
+from form_score import FormScorer
+from telemetry_bus import TelemetryPublisher, make_bus
+
+VIDEO_EXERCISES = {'Auto-detect': AUTO_DETECT, 'Push Up': 'push-up', 'Squat': 'squat', 'Shoulder Press': 'shoulder press'}
+
+@st.cache_resource
+def get_pose_pool():
+    # One pool of pre-initialized pose graphs shared by every session of this server
+    return PosePool(size=int(os.getenv("POSE_POOL_SIZE", "2")))
+
+@st.cache_resource
+def get_upload_spool():
+    # Uploaded videos, stored once per content and cleaned up by age and total size;
+    # videos of analyses still waiting or running are kept
+    return UploadSpool(os.getenv("UPLOAD_SPOOL_DIR"),
+                       max_total_bytes=int(float(os.getenv("UPLOAD_SPOOL_MAX_GB", "2")) * 1024 ** 3),
+                       in_use=lambda: get_job_queue().active_video_paths())
+
+def spooled_upload_path(video_file_buffer):
+    # Spool each upload once; reruns reuse the file until it is replaced or cleaned up
+    spool = get_upload_spool()
+    cached = st.session_state.get("spooled_upload")
+    if cached and cached[0] == video_file_buffer.file_id and spool.touch(cached[1]):
+        return cached[1]
+    path = spool.spool(video_file_buffer)
+    st.session_state.spooled_upload = (video_file_buffer.file_id, path)
+    return path
+
+@st.cache_resource
+def get_rep_writer():
+    # Per-rep events of every session, written in batches by one background thread
+    return RepEventWriter("elderly_fitness.db")
+
+@st.cache_resource
+def get_form_scorer():
+    # Reference rep trajectories every rep is scored against
+    return FormScorer.load()
+
+@st.cache_resource
+def get_telemetry_bus():
+    # Live session state for the doctor dashboard; TELEMETRY_BUS_URL=redis://... to use a local broker
+    return make_bus(os.getenv("TELEMETRY_BUS_URL"))
+
+@st.cache_resource
+def get_job_queue():
+    # Uploaded videos are analysed by a few background workers shared by all sessions
+    queue = AnalysisJobQueue("elderly_fitness.db", workers=int(os.getenv("ANALYSIS_WORKERS", "1")),
+                             pose_pool=get_pose_pool(), rep_writer=get_rep_writer(), form_scorer=get_form_scorer())
+    queue.start()
+    return queue
+
+@st.fragment(run_every=2)
+def render_analysis_jobs():
+    jobs = get_job_queue().list_jobs(st.session_state.user_email, limit=5)
+    if not jobs:
+        return
+    st.write("### Your video analyses")
+    for job in jobs:
+        name = "Auto-detect" if job["exercise"] == AUTO_DETECT else job["exercise"]
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            if job["status"] in ACTIVE:
+                st.progress(job["progress"] or 0.0, text=f"{name}: {job['status']} · {job['reps']} reps so far")
+            elif job["status"] == DONE:
+                counts = job["result"]["counts"]
+                saved = ", ".join(f"{reps} {label}" for label, reps in counts.items()) or "no reps"
+                st.success(f"{name}: done · saved {saved} to your history")
+            else:
+                st.caption(f"{name}: {job['status']}{' · ' + job['error'] if job['error'] else ''}")
+        with col2:
+            if job["status"] in ACTIVE and st.button("Cancel", key=f"cancel_{job['job_id']}"):
+                get_job_queue().cancel(job["job_id"], st.session_state.user_email)
+                st.rerun(scope="fragment")
+        timeline = job["result"] and job["result"].get("timeline")
+        if timeline:
+            with st.expander("Exercise timeline"):
+                st.dataframe(pd.DataFrame([
+                    {"From": f"{s['start_time']:.1f}s", "To": f"{s['end_time']:.1f}s", "Exercise": s["exercise"],
+                     "Confidence": f"{s['confidence']:.0%}", "Reps": "-" if s["reps"] is None else s["reps"]}
+                    for s in timeline
+                ]), use_container_width=True, hide_index=True)
+
+def get_session_metrics():
+    # Fresh stage timings for each analysis run; near-zero cost while the panel is off
+    debug = st.session_state.get("perf_debug", False)
+    st.session_state.perf_metrics = FrameMetrics(
+        enabled=debug, overlay=debug and st.session_state.get("perf_overlay", False))
+    return st.session_state.perf_metrics
+
+def get_quality_controller():
+    # Fresh controller for each run, holding POSE_TARGET_FPS by trading pose model quality
+    controller = None
+    if st.session_state.get("adaptive_quality", True):
+        controller = AdaptiveQualityController(target_fps=float(os.getenv("POSE_TARGET_FPS", "15")))
+    st.session_state.quality_controller = controller
+    return controller
+
+def session_detector_factory(lease):
+    # Optionally run pose inference on keyframes only and predict the frames in between
+    if st.session_state.get("keyframe_pose", False):
+        return lambda: KeyframePostureDetector(lease.detector())
+    return lease.detector
+
+def new_session_recorder(exercise_name, cap):
+    # Landmarks only, no video: kept for the doctor's review when the patient opts in
+    if not st.session_state.get("record_session", False):
+        return None
+    user = re.sub(r"[^\w.@-]", "_", st.session_state.user_email)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{exercise_name.replace(' ', '-').lower()}.lmrec"
+    metadata = {"patient_email": st.session_state.user_email, "exercise": exercise_name, "started": time.time(),
+                "fps": cap.get(cv2.CAP_PROP_FPS), "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}
+    return SessionRecorder(os.path.join(os.getenv("RECORDINGS_DIR", "recordings"), user, name), metadata)
+
+def render_debug_panel():
+    with st.expander("🛠 Performance debug panel"):
+        st.checkbox("Record stage timings", key="perf_debug")
+        st.checkbox("Show timings on the video", key="perf_overlay")
+        metrics = st.session_state.get("perf_metrics")
+        if metrics is None or not metrics.frames:
+            st.caption("Run a session with timings enabled to see per-stage latency.")
+            return
+        summary = metrics.summary()
+        st.metric("Frames per second", f"{summary['fps']:.1f}")
+        rows = [{"Stage": stage, **{k: round(v, 2) for k, v in stats.items()}}
+                for stage, stats in summary["stages"].items() if stats]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True)
+        st.download_button("Download metrics (JSON)", json.dumps(summary, indent=2),
+                           file_name="session_metrics.json", mime="application/json")
+
+        pool = get_pose_pool().metrics()
+        st.caption(f"Pose workers: {pool['leased']}/{pool['workers']} in use · "
+                   f"average utilization {pool['average_utilization']:.0%} · "
+                   f"wait p50/p95 {pool['wait_p50_s']:.2f}/{pool['wait_p95_s']:.2f}s · "
+                   f"{pool['rejected']} turned away")
+
+        resources = get_session_resources()
+        stats = resources.stats()
+        rss = f", {stats['rss_bytes'] / 1024 ** 2:.0f} MB resident in this process" if stats["rss_bytes"] else ""
+        st.caption(f"Session resources: {stats['sessions']} sessions hold {stats['tracked_bytes'] / 1024 ** 2:.1f} MB of chat text"
+                   f"{rss} · evicted {stats['ttl_evictions']} idle, {stats['memory_evictions']} under memory "
+                   f"pressure · {stats['restores']} restored")
+        rows = [{"Session": s["session"][:8], "Resources": ", ".join(s["resources"]),
+                 "Text MB": round(s["bytes"] / 1024 ** 2, 2), "Idle (s)": round(s["idle_seconds"])}
+                for s in resources.report()]
+        if rows:
+            st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+        controller = st.session_state.get("quality_controller")
+        if controller is not None and controller.decisions:
+            st.caption(f"Pose quality level {controller.level} of {len(controller.levels) - 1}")
+            st.dataframe(pd.DataFrame(controller.decisions), use_container_width=True, hide_index=True)
 
 def render_ai_coach_ui():
     """
@@ -52,17 +216,42 @@ def render_ai_coach_ui():
             st.rerun()
         
         exercise_options = st.selectbox('Select Exercise', ('Push Up', 'Squat', 'Shoulder Press'), key="webcam_ex")
+        st.checkbox("Adapt pose quality to this computer", value=True, key="adaptive_quality")
+        st.checkbox("Skip pose inference while moving slowly", value=False, key="keyframe_pose",
+                    help="Runs the pose model on keyframes only and predicts the frames in between.")
+        st.checkbox("Record my movements for my doctor", value=False, key="record_session",
+                    help="Keeps the body landmarks of this session, not the video.")
+        st.checkbox("Rest the tracker when nobody is in front of the camera", value=True, key="presence_gate",
+                    help="Checks for a person a few times a second while the room is empty.")
         if st.button('Start Exercise'):
-            exer = exercise.Exercise()
-            cap = cv2.VideoCapture(0)
-            final_count = 0
-            if exercise_options == 'Push Up': final_count = exer.push_up(cap)
-            elif exercise_options == 'Squat': final_count = exer.squat(cap)
-            elif exercise_options == 'Shoulder Press': final_count = exer.shoulder_press(cap)
-            
-            st.session_state.final_count = final_count
-            st.session_state.exercise_name = exercise_options
-            st.rerun()
+            try:
+                # The pose worker stays with this session until the exercise ends
+                with get_pose_pool().lease() as lease:
+                    cap = cv2.VideoCapture(0)
+                    recorder = new_session_recorder(exercise_options, cap)
+                    reps = RepTracker(VIDEO_EXERCISES[exercise_options], st.session_state.user_email,
+                                      sink=get_rep_writer().submit, scorer=get_form_scorer())
+                    telemetry = TelemetryPublisher(get_telemetry_bus(), st.session_state.user_email,
+                                                   session_id=reps.session_id)
+                    exer = exercise.Exercise(metrics=get_session_metrics(), detector_factory=session_detector_factory(lease),
+                                             quality=get_quality_controller(), recorder=recorder, reps=reps,
+                                             presence=PresenceGate() if st.session_state.get("presence_gate", True) else None,
+                                             telemetry=telemetry)
+                    final_count = 0
+                    try:
+                        if exercise_options == 'Push Up': final_count = exer.push_up(cap)
+                        elif exercise_options == 'Squat': final_count = exer.squat(cap)
+                        elif exercise_options == 'Shoulder Press': final_count = exer.shoulder_press(cap)
+                    finally:
+                        telemetry.close()
+                        if recorder is not None:
+                            recorder.close()
+            except PoolSaturated:
+                st.warning("All exercise trackers are busy right now. Please try again in a minute.")
+            else:
+                st.session_state.final_count = final_count
+                st.session_state.exercise_name = exercise_options
+                st.rerun()
 
     # --- Upload Video Page ---
     elif st.session_state.coach_page == "video":
@@ -73,29 +262,30 @@ def render_ai_coach_ui():
         
         st.write('## Upload your video to count repetitions')
         exercise_options = st.selectbox(
-            'Select Exercise', ('Push Up', 'Squat', 'Shoulder Press'), key="video_ex"
+            'Select Exercise', ('Auto-detect', 'Push Up', 'Squat', 'Shoulder Press'), key="video_ex"
         )
+        analysis_rate = st.select_slider(
+            'Analysis rate (frames per second)', options=('Full rate', 30, 15, 10), value='Full rate',
+            help="Lower rates skip decoding work on high frame rate phone videos.", key="video_rate"
+        )
+        st.checkbox("Skip pose inference while moving slowly", value=False, key="keyframe_pose",
+                    help="Runs the pose model on keyframes only and predicts the frames in between.")
         video_file_buffer = st.file_uploader("Upload a video", type=["mp4", "mov", 'avi'])
 
         if video_file_buffer is not None:
-            tfflie = tempfile.NamedTemporaryFile(delete=False)
-            tfflie.write(video_file_buffer.read())
-            
+            video_path = spooled_upload_path(video_file_buffer)
+
             if st.button("Analyze Video"):
-                cap = cv2.VideoCapture(tfflie.name)
-                st.info("Analyzing video... Please wait.")
-                exer = exercise.Exercise()
-                final_count = 0
-                if exercise_options == 'Push Up':
-                    final_count = exer.push_up(cap, is_video=True)
-                elif exercise_options == 'Squat':
-                    final_count = exer.squat(cap, is_video=True)
-                elif exercise_options == 'Shoulder Press':
-                    final_count = exer.shoulder_press(cap, is_video=True)
+                # Runs in the background; results are saved to the history when the job finishes
+                options = {"analysis_fps": None if analysis_rate == 'Full rate' else analysis_rate,
+                           "keyframes": st.session_state.get("keyframe_pose", False)}
+                try:
+                    get_job_queue().submit(st.session_state.user_email, video_path,
+                                           VIDEO_EXERCISES[exercise_options], options)
+                except JobLimitExceeded as e:
+                    st.warning(str(e))
 
-                st.session_state.final_count = final_count
-                st.session_state.exercise_name = exercise_options
-                st.rerun()
+        render_analysis_jobs()
 
     # --- Chatbot Page ---
     elif st.session_state.coach_page == "chatbot":
@@ -105,6 +295,9 @@ def render_ai_coach_ui():
             st.rerun()
         chat_ui()
 
+    if st.session_state.coach_page in ("webcam", "video"):
+        render_debug_panel()
+
     # --- SAVE EXERCISE FORM (appears after a session) ---
     if 'final_count' in st.session_state and 'exercise_name' in st.session_state:
         final_count = st.session_state.get('final_count', 0)
@@ -0,0 +1,361 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import date
+
+import cv2
+
+import ExerciseAiTrainer as exercise
+import PoseModule2 as pm
+from frame_sampler import FrameSampler
+from keyframe_pose import KeyframePostureDetector
+from pose_pool import PoolSaturated
+from rep_events import RepTracker
+
+# Job states
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+ACTIVE = (QUEUED, RUNNING)
+AUTO_DETECT = "auto"
+# Seconds a job waits for a pose worker to come free before it is tried again
+POOL_RETRY_SECONDS = 10
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def connect(db_path):
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+class AnalysisJobQueue:
+    """
+    Persistent queue of uploaded-video analyses in the app database, run by a fixed
+    number of worker threads. Each user has at most max_running_per_user jobs running
+    and max_pending_per_user queued or running. Failed jobs are retried with backoff
+    up to max_attempts; finished reps go straight into the exercises table, and their
+    per-rep events (form-scored by form_scorer, if given) to rep_writer when one is given.
+    """
+
+    def __init__(self, db_path="elderly_fitness.db", workers=1, max_running_per_user=1, max_pending_per_user=3,
+                 max_attempts=3, pose_pool=None, progress_interval=0.5, rep_writer=None, form_scorer=None):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_running_per_user = max_running_per_user
+        self.max_pending_per_user = max_pending_per_user
+        self.max_attempts = max_attempts
+        self.pose_pool = pose_pool
+        self.progress_interval = progress_interval
+        self.rep_writer = rep_writer
+        self.form_scorer = form_scorer
+
+        self.conn = connect(db_path)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition()
+        self.stopped = False
+        self.threads = []
+        self.create_tables()
+        self.recover()
+
+    def create_tables(self):
+        with self.lock:
+            self.conn.execute("""CREATE TABLE IF NOT EXISTS analysis_jobs (
+                            job_id TEXT PRIMARY KEY,
+                            user_email TEXT,
+                            video_path TEXT,
+                            exercise TEXT,
+                            options TEXT,
+                            status TEXT,
+                            progress REAL,
+                            reps INTEGER,
+                            result TEXT,
+                            error TEXT,
+                            attempts INTEGER,
+                            cancel_requested INTEGER,
+                            not_before REAL,
+                            created_at REAL,
+                            started_at REAL,
+                            finished_at REAL
+                        )""")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_status ON analysis_jobs (status, created_at)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_analysis_jobs_user ON analysis_jobs (user_email, status)")
+            self.conn.commit()
+
+    def recover(self):
+        # Jobs that were running when the server stopped go back to the queue
+        with self.lock:
+            self.conn.execute("UPDATE analysis_jobs SET status=?, progress=0, reps=0 WHERE status=?", (QUEUED, RUNNING))
+            self.conn.commit()
+
+    # --- API used by the pages ---
+    def submit(self, user_email, video_path, exercise_label=AUTO_DETECT, options=None):
+        now = time.time()
+        with self.lock:
+            pending = self.conn.execute(
+                "SELECT COUNT(*) FROM analysis_jobs WHERE user_email=? AND status IN (?, ?)",
+                (user_email, *ACTIVE)).fetchone()[0]
+            if pending >= self.max_pending_per_user:
+                raise JobLimitExceeded(f"You already have {pending} videos waiting to be analysed.")
+            job_id = uuid.uuid4().hex
+            self.conn.execute(
+                """INSERT INTO analysis_jobs (job_id, user_email, video_path, exercise, options, status, progress,
+                   reps, attempts, cancel_requested, not_before, created_at) VALUES (?, ?, ?, ?, ?, ?, 0, 0, 0, 0, 0, ?)""",
+                (job_id, user_email, video_path, exercise_label, json.dumps(options or {}), QUEUED, now))
+            self.conn.commit()
+        with self.wakeup:
+            self.wakeup.notify()
+        return job_id
+
+    def cancel(self, job_id, user_email):
+        # Queued jobs are cancelled at once, running ones at their next progress update
+        with self.lock:
+            self.conn.execute("UPDATE analysis_jobs SET status=?, finished_at=? WHERE job_id=? AND user_email=? AND status=?",
+                              (CANCELLED, time.time(), job_id, user_email, QUEUED))
+            self.conn.execute("UPDATE analysis_jobs SET cancel_requested=1 WHERE job_id=? AND user_email=? AND status=?",
+                              (job_id, user_email, RUNNING))
+            self.conn.commit()
+
+    def get(self, job_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM analysis_jobs WHERE job_id=?", (job_id,)).fetchone()
+        return self.job_dict(row) if row else None
+
+    def list_jobs(self, user_email, limit=10):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM analysis_jobs WHERE user_email=? ORDER BY created_at DESC LIMIT ?",
+                                     (user_email, limit)).fetchall()
+        return [self.job_dict(row) for row in rows]
+
+    def active_video_paths(self):
+        # Videos that queued or running jobs will still read
+        with self.lock:
+            rows = self.conn.execute("SELECT DISTINCT video_path FROM analysis_jobs WHERE status IN (?, ?)",
+                                     ACTIVE).fetchall()
+        return [row[0] for row in rows]
+
+    @staticmethod
+    def job_dict(row):
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    # --- Workers ---
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f"analysis-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def stop(self):
+        self.stopped = True
+        with self.wakeup:
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+    def claim(self, conn):
+        # Atomically takes the oldest runnable job of a user below the running limit
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                """SELECT * FROM analysis_jobs AS job WHERE status=? AND not_before<=?
+                   AND (SELECT COUNT(*) FROM analysis_jobs AS other
+                        WHERE other.user_email=job.user_email AND other.status=?) < ?
+                   ORDER BY created_at LIMIT 1""",
+                (QUEUED, now, RUNNING, self.max_running_per_user)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE analysis_jobs SET status=?, started_at=?, attempts=attempts+1 WHERE job_id=?",
+                             (RUNNING, now, row["job_id"]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return self.job_dict(row) if row else None
+
+    def work(self):
+        conn = connect(self.db_path)
+        conn.isolation_level = None  # transactions are explicit in claim()
+        exer = None
+        while not self.stopped:
+            job = self.claim(conn)
+            if job is None:
+                # Also polls, so retries come due and jobs submitted by other processes get picked up
+                with self.wakeup:
+                    self.wakeup.wait(1.0)
+                continue
+            if exer is None:
+                exer = exercise.Exercise()  # each worker keeps its own copy of the classifier
+            try:
+                result = self.run_job(conn, job, exer)
+                self.finish(conn, job, result)
+            except JobCancelled:
+                self.settle(conn, job, "UPDATE analysis_jobs SET status=?, finished_at=? WHERE job_id=?",
+                            (CANCELLED, time.time(), job["job_id"]))
+            except PoolSaturated:
+                # Webcam sessions hold every pose worker: wait for one without using up an attempt
+                self.settle(conn, job, "UPDATE analysis_jobs SET status=?, progress=0, reps=0, attempts=attempts-1, "
+                                       "not_before=? WHERE job_id=?",
+                            (QUEUED, time.time() + POOL_RETRY_SECONDS, job["job_id"]))
+            except Exception as e:
+                print(f"❌ Analysis job {job['job_id']} failed: {e}")
+                if job["attempts"] + 1 < self.max_attempts:
+                    backoff = 2 ** (job["attempts"] + 1)
+                    self.settle(conn, job, "UPDATE analysis_jobs SET status=?, error=?, progress=0, reps=0, "
+                                           "not_before=? WHERE job_id=?",
+                                (QUEUED, str(e), time.time() + backoff, job["job_id"]))
+                else:
+                    self.settle(conn, job, "UPDATE analysis_jobs SET status=?, error=?, finished_at=? WHERE job_id=?",
+                                (FAILED, str(e), time.time(), job["job_id"]))
+        conn.close()
+
+    @staticmethod
+    def settle(conn, job, sql, parameters):
+        # Moves a job out of RUNNING; if even that fails the worker carries on and
+        # recover() requeues the job on the next start
+        try:
+            conn.execute(sql, parameters)
+        except sqlite3.Error as e:
+            print(f"❌ Could not update analysis job {job['job_id']}: {e}")
+
+    def run_job(self, conn, job, exer):
+        if not exer.is_ready():
+            raise RuntimeError("Model components not fully loaded.")
+        if not os.path.exists(job["video_path"]):
+            raise RuntimeError("The uploaded video is no longer available.")
+
+        last_report = [0.0]
+
+        def report(progress, reps=0):
+            now = time.monotonic()
+            if now - last_report[0] < self.progress_interval and progress < 1.0:
+                return
+            last_report[0] = now
+            conn.execute("UPDATE analysis_jobs SET progress=?, reps=? WHERE job_id=?", (progress, reps, job["job_id"]))
+            cancelled = conn.execute("SELECT cancel_requested FROM analysis_jobs WHERE job_id=?",
+                                     (job["job_id"],)).fetchone()[0]
+            if cancelled:
+                raise JobCancelled()
+
+        if self.pose_pool is None:
+            return self.analyze(job, exer, pm.posture_detector, report)
+        with self.pose_pool.lease() as lease:
+            return self.analyze(job, exer, lease.detector, report)
+
+    def analyze(self, job, exer, detector_factory, report):
+        options = job["options"]
+        if options.get("keyframes"):
+            base_factory = detector_factory
+            detector_factory = lambda: KeyframePostureDetector(base_factory())
+        # Rep times are video times from the job's creation, so a retry rewrites the same rows
+        reps = None
+        if self.rep_writer is not None:
+            reps = RepTracker(job["exercise"], job["user_email"], session_id=job["job_id"], origin=job["created_at"],
+                              scorer=self.form_scorer)
+        cap = cv2.VideoCapture(job["video_path"])
+        try:
+            if job["exercise"] == AUTO_DETECT:
+                exer.detector_factory = detector_factory
+                segments = exer.classify_video(cap, progress=report, rep_tracker=reps)
+                counts = {}
+                for segment in segments:
+                    if segment["reps"]:
+                        counts[segment["exercise"]] = counts.get(segment["exercise"], 0) + segment["reps"]
+                return {"counts": counts, "timeline": segments, "rep_events": reps.events if reps else []}
+
+            count_function = exercise.COUNT_FUNCTIONS[job["exercise"]]
+            detector = detector_factory()
+            sampler = FrameSampler(cap, options.get("analysis_fps"))
+            total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or 1
+            stage, counter = None, 0
+            for frame_number, frame in sampler.frames(buffer=detector.frame_buffer()):
+                detector.find_person(frame, draw=False)
+                landmark_list = detector.find_landmarks(frame, draw=False)
+                if len(landmark_list) != 0:
+                    if reps is not None:
+                        reps.frame_time = frame_number / sampler.fps
+                    stage, counter = count_function(detector, None, landmark_list, stage, counter, None, reps)
+                report(min((frame_number + 1) / total_frames, 1.0), counter)
+            return {"counts": {job["exercise"]: counter} if counter else {},
+                    "rep_events": reps.events if reps else []}
+        finally:
+            cap.release()
+
+    def finish(self, conn, job, result):
+        # The job and the exercise history are updated together, under the names the webcam page saves
+        rep_events = result.pop("rep_events", [])
+        result["counts"] = {exercise.EXERCISE_NAMES.get(label, label): count
+                            for label, count in result["counts"].items()}
+        today = date.today().isoformat()
+        result["exercise_ids"] = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for ex_name, count in result["counts"].items():
+                ex_id = uuid.uuid4().hex
+                conn.execute("INSERT INTO exercises (id, patient_email, ex_name, ex_date, count) VALUES (?, ?, ?, ?, ?)",
+                             (ex_id, job["user_email"], ex_name, today, count))
+                result["exercise_ids"].append(ex_id)
+            conn.execute("UPDATE analysis_jobs SET status=?, progress=1, reps=?, result=?, error=NULL, finished_at=? "
+                         "WHERE job_id=?", (DONE, sum(result["counts"].values()), json.dumps(result), time.time(),
+                                            job["job_id"]))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        # Only the reps of a finished job are kept
+        for event in rep_events:
+            self.rep_writer.submit(event)
+
+
+def main():
+    from benchmark import CLIPS
+    from form_score import FormScorer
+    from rep_events import RepEventWriter, session_summary
+
+    parser = argparse.ArgumentParser(description="Run the bundled clips through the analysis job queue.")
+    parser.add_argument("--db", default="analysis_jobs_demo.db")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    conn.execute("""CREATE TABLE IF NOT EXISTS exercises (
+                    id TEXT PRIMARY KEY, patient_email TEXT, ex_name TEXT, ex_date TEXT, count INTEGER)""")
+    conn.commit()
+
+    rep_writer = RepEventWriter(args.db)
+    queue = AnalysisJobQueue(args.db, workers=args.workers, max_pending_per_user=10, rep_writer=rep_writer,
+                             form_scorer=FormScorer.load())
+    jobs = [queue.submit("demo@example.com", name, label or AUTO_DETECT) for name, label in CLIPS.items()]
+    # A second user's job is cancelled while it waits
+    cancelled = queue.submit("other@example.com", "demo_2.mp4", AUTO_DETECT)
+    queue.cancel(cancelled, "other@example.com")
+
+    start = time.perf_counter()
+    queue.start()
+    while any(queue.get(job_id)["status"] in ACTIVE for job_id in jobs):
+        print("  ".join(f"{queue.get(job_id)['status']} {queue.get(job_id)['progress']:.0%}" for job_id in jobs))
+        time.sleep(2)
+    queue.stop()
+    rep_writer.close()
+    print(f"Finished in {time.perf_counter() - start:.1f}s")
+    for job_id, name in zip(jobs + [cancelled], list(CLIPS) + ["demo_2.mp4 (cancelled)"]):
+        job = queue.get(job_id)
+        print(f"{name}: {job['status']}, {job['reps']} reps, {job['result'] and job['result']['counts']}")
+    print(conn.execute("SELECT patient_email, ex_name, count FROM exercises").fetchall())
+    for row in session_summary(conn, "demo@example.com", 0, time.time() + 86400):
+        print(f"Rep events: {row}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,11 @@ from datetime import date
 import uuid
 import pandas as pd
 import sqlite3
-from ai_coach_ui import render_ai_coach_ui # <--- MODIFICATION 1: IMPORT ADDED
+from ai_coach_ui import render_ai_coach_ui, get_telemetry_bus # <--- MODIFICATION 1: IMPORT ADDED
+import time
+import rep_events
+from chatbot import get_session_resources
+from telemetry_bus import patient_channel
 
 # --- Database setup ---
 conn = sqlite3.connect("elderly_fitness.db", check_same_thread=False)
@@ -44,6 +48,9 @@ c.execute("""CREATE TABLE IF NOT EXISTS exercises (
             )""")
 conn.commit()
 
+# Per-rep events (tempo, range of motion) written by the AI coach
+rep_events.create_tables(conn)
+
 # --- Page config ---
 st.set_page_config(page_title="Elderly Fitness Tracker", page_icon="❤", layout="wide")
 
@@ -67,6 +74,9 @@ def logout():
     st.session_state.patient_feature_page = None
     st.session_state.selected_patient = None
     st.session_state.doctor_page = "dashboard"
+    # The next user of this browser starts without the previous user's chat
+    if "resource_session_id" in st.session_state:
+        get_session_resources().release(st.session_state.pop("resource_session_id"))
     st.rerun()
 
 def get_user(email):
@@ -120,6 +130,44 @@ def get_exercises(patient_email):
         data[ex_date][ex_name] = count
     return data
 
+def get_rep_sessions(patient_email, days=30):
+    now = time.time()
+    rows = rep_events.session_summary(conn, patient_email, now - days * 86400, now)
+    return pd.DataFrame([{
+        "Started": time.strftime("%Y-%m-%d %H:%M", time.localtime(started)),
+        "Exercise": exercise, "Reps": reps, "Seconds per rep": round(avg_duration, 1),
+        "Range of motion (°)": round(avg_range), "Slowdown (2nd half / 1st half)": None if fatigue is None else round(fatigue, 2),
+        "Form score": None if form_score is None else round(form_score),
+    } for _, exercise, started, reps, avg_duration, avg_range, fatigue, form_score in rows])
+
+@st.fragment(run_every=2)
+def live_patients_panel(patients):
+    # Reads the telemetry bus only: refreshing the panel costs the database nothing
+    channels = {patient_channel(email): email for email in patients}
+    subscription = st.session_state.get("live_subscription")
+    if subscription is None or subscription.channels != set(channels):
+        if subscription is not None:
+            subscription.close()
+        subscription = st.session_state.live_subscription = get_telemetry_bus().subscribe(channels)
+        st.session_state.live_states = {}
+    live_states = st.session_state.live_states
+    live_states.update(subscription.poll())
+
+    now = time.time()
+    rows = []
+    for channel, state in sorted(live_states.items(), key=lambda item: -item[1]["updated"]):
+        ago = now - state["updated"]
+        if not state["active"] and ago > 600:
+            continue  # ended more than ten minutes ago
+        status = "Ended" if not state["active"] else ("Live" if ago < 15 else "No signal")
+        rows.append({"Patient": patients[channels[channel]], "Status": status,
+                     "Exercise": state["exercise"] or "Detecting…", "Stage": state["stage"] or "",
+                     "Reps": state["counter"], "Updated": f"{ago:.0f}s ago"})
+    if rows:
+        st.table(pd.DataFrame(rows))
+    else:
+        st.caption("None of your patients is exercising right now.")
+
 def find_doctor(patient_email):
     c.execute("SELECT doctor_email FROM doctor_patients WHERE patient_email=?", (patient_email,))
     res = c.fetchone()
@@ -213,6 +261,10 @@ elif st.session_state.logged_in and st.session_state.role == "doctor":
             st.session_state.doctor_page = "add_patient"
             st.rerun()
 
+        if patients:
+            st.subheader("🟢 Exercising Now")
+            live_patients_panel(patients)
+
         if patients:
             st.subheader("Select Patient to Manage")
             options = ["-- Select a patient --"] + [f"{name} — {email}" for email, name in patients.items()]
@@ -278,6 +330,11 @@ elif st.session_state.logged_in and st.session_state.role == "doctor":
                     else:
                         st.info("No exercise data yet.")
 
+                    rep_df = get_rep_sessions(sp)
+                    if not rep_df.empty:
+                        st.markdown("#### Rep Details (last 30 days)")
+                        st.dataframe(rep_df, hide_index=True)
+
 
     elif doc_patients_page == "add_patient":
         with st.container(border=True):
@@ -394,6 +451,10 @@ elif st.session_state.logged_in and st.session_state.role == "patient":
             st.dataframe(df_all.sort_values(by=["Date", "Count"], ascending=[False, False]))
         else:
             st.info("No exercise data has been recorded yet.")
+        rep_df = get_rep_sessions(st.session_state.user_email)
+        if not rep_df.empty:
+            st.markdown("#### Rep Details (last 30 days)")
+            st.dataframe(rep_df, hide_index=True)
         if st.button("⬅ Back to Main Menu"):
             st.session_state.patient_feature_page = None
             st.rerun()
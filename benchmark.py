@@ -0,0 +1,199 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+import cv2
+
+import ExerciseAiTrainer as exercise
+import PoseModule2 as pm
+from perf_metrics import FrameMetrics
+
+# Bundled clips and the exercise whose counter is applied to them.
+# None means the counter follows the LSTM prediction, as in auto_classify_and_count.
+CLIPS = {
+    "push-up_1.mp4": "push-up",
+    "squat_17.mp4": "squat",
+    "squat_19.mp4": "squat",
+    "demo_2.mp4": None,
+}
+
+# Rep counts checked by watching each clip frame by frame, kept apart from the timing
+# baseline so --update-baseline can never turn a miscount into the expected value.
+# A rep counts when its bottom position is reached, as the counters do.
+EXPECTED_REPS = {
+    "push-up_1.mp4": 3,  # two full push-ups, the clip ends at the bottom of the third
+    "squat_17.mp4": 1,   # side view, one deep squat
+    "squat_19.mp4": 2,   # front view, two shallow squats
+    "demo_2.mp4": 0,     # barbell curls, none of the supported exercises
+}
+
+WINDOW_SIZE = 30
+STAGE_SLACK_MS = 0.05
+
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def run_clip(path, exercise_label, exer):
+    # Keep every sample of the clip instead of a rolling window
+    metrics = FrameMetrics(enabled=True, window=None)
+    detector = pm.posture_detector()
+    cap = cv2.VideoCapture(path)
+
+    window = []
+    prediction = exercise_label
+    stage, counter = None, 0
+    start = time.perf_counter()
+
+    while True:
+        with metrics.span("decode"):
+            ret, frame = cap.read()
+        if not ret:
+            break
+
+        with metrics.span("color"):
+            img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        with metrics.span("pose"):
+            detector.results = detector.pose.process(img_rgb)
+            detector.update_landmarks(frame)
+            landmark_list = detector.find_landmarks(frame, draw=False)
+
+        if landmark_list:
+            with metrics.span("features"):
+                window.append(exer.extract_features(landmark_list))
+
+            if len(window) == WINDOW_SIZE:
+                with metrics.span("classify"):
+                    label = exer.classify_window(window, WINDOW_SIZE)
+                if exercise_label is None and label is not None:
+                    prediction = label
+                window = []
+
+            with metrics.span("count"):
+                count_function = exercise.COUNT_FUNCTIONS.get(prediction)
+                if count_function is not None:
+                    stage, counter = count_function(detector, frame, landmark_list, stage, counter, exer)
+
+        with metrics.span("draw"):
+            detector.draw_person(frame)
+            exer.repetitions_counter(frame, counter)
+        metrics.tick()
+
+    elapsed = time.perf_counter() - start
+    cap.release()
+    summary = metrics.summary()
+    return {
+        "exercise": exercise_label,
+        "frames": summary["frames"],
+        "reps": counter,
+        "fps": summary["frames"] / elapsed if elapsed else 0.0,
+        "stages": summary["stages"],
+    }
+
+
+def check_reps(results):
+    failures = []
+    for name, clip in results["clips"].items():
+        expected = EXPECTED_REPS.get(name)
+        if expected is not None and clip["reps"] != expected:
+            failures.append(f"{name}: counted {clip['reps']} reps, expected {expected}")
+        elif expected is None and clip["exercise"] is not None and clip["reps"] == 0:
+            # An unchecked clip of a known exercise still has to count something
+            failures.append(f"{name}: counted no {clip['exercise']} reps")
+    return failures
+
+
+def compare(results, baseline, threshold):
+    failures = []
+    for name, clip in results["clips"].items():
+        reference = baseline.get("clips", {}).get(name)
+        if reference is None:
+            continue
+        if clip["fps"] < reference["fps"] * (1 - threshold):
+            failures.append(f"{name}: {clip['fps']:.1f} fps, baseline {reference['fps']:.1f} fps")
+        for stage, stats in clip["stages"].items():
+            base_stats = reference["stages"].get(stage)
+            # Stages that take microseconds are all timer noise, hence the absolute slack
+            if stats and base_stats and stats["p50_ms"] > base_stats["p50_ms"] * (1 + threshold) + STAGE_SLACK_MS:
+                failures.append(f"{name}/{stage}: p50 {stats['p50_ms']:.2f} ms, "
+                                f"baseline {base_stats['p50_ms']:.2f} ms")
+    return failures
+
+
+def print_report(results):
+    for name, clip in results["clips"].items():
+        print(f"\n{name}: {clip['frames']} frames, {clip['reps']} reps, {clip['fps']:.1f} fps")
+        for stage, stats in clip["stages"].items():
+            if stats:
+                print(f"  {stage:<9} p50 {stats['p50_ms']:7.2f} ms  p90 {stats['p90_ms']:7.2f} ms  "
+                      f"p99 {stats['p99_ms']:7.2f} ms  (n={stats['count']})")
+    print(f"\nOverall: {results['fps']:.1f} fps, peak RSS {results['peak_rss_mb']:.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless performance benchmark over the bundled demo videos.")
+    parser.add_argument("--clips", nargs="*", default=list(CLIPS), help="clips to run (default: all bundled clips)")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown before failing (0.2 = 20%%)")
+    parser.add_argument("--update-baseline", action="store_true", help="store these results as the new baseline")
+    parser.add_argument("--classifier", choices=list(exercise.CLASSIFIER_MODELS), default=None,
+                        help="exercise classifier to load (default: EXERCISE_CLASSIFIER or bilstm)")
+    args = parser.parse_args()
+
+    exer = exercise.Exercise(classifier=args.classifier)
+    if not exer.is_ready():
+        print("🚫 Model components not fully loaded. Cannot benchmark.")
+        return 1
+    if args.classifier and exer.classifier != args.classifier:
+        # Timings of the fallback model must not pass for the requested one
+        print(f"🚫 The {args.classifier} classifier could not be loaded. Cannot benchmark it.")
+        return 1
+
+    results = {"clips": {}}
+    total_frames, start = 0, time.perf_counter()
+    for name in args.clips:
+        results["clips"][name] = run_clip(name, CLIPS.get(name), exer)
+        total_frames += results["clips"][name]["frames"]
+    results["fps"] = total_frames / (time.perf_counter() - start)
+    results["peak_rss_mb"] = peak_rss_mb()
+
+    print_report(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    failures = check_reps(results)
+    if args.update_baseline:
+        if failures:
+            for failure in failures:
+                print(f"❌ {failure}")
+            print("Baseline not written: fix the rep counts first.")
+            return 1
+        timings = {"clips": {name: {key: value for key, value in clip.items() if key != "reps"}
+                             for name, clip in results["clips"].items()},
+                   "fps": results["fps"], "peak_rss_mb": results["peak_rss_mb"]}
+        with open(args.baseline, "w") as f:
+            json.dump(timings, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            failures += compare(results, json.load(f), args.threshold)
+    else:
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one.")
+    for failure in failures:
+        print(f"❌ {failure}")
+    if not failures:
+        print("✅ Rep counts match the hand-checked counts and no stage regressed beyond the threshold.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,262 @@
+import json
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Same wording as langchain's ConversationChain default prompt, so answers do not change
+CONVERSATION_PROMPT = """The following is a friendly conversation between a human and an AI. The AI is talkative and provides lots of specific details from its context. If the AI does not know the answer to a question, it truthfully says it does not know.
+
+Current conversation:
+{history}
+Human: {input}
+AI:"""
+
+SUMMARY_PROMPT = """Progressively summarize the lines of conversation provided, adding onto the previous summary and returning a new summary.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+
+def count_tokens(text):
+    # Rough word-based estimate, the same unit used for st.session_state.token_count
+    return len(text.split())
+
+
+def call_llm(llm, prompt):
+    result = llm.invoke(prompt)
+    # Chat models return a message object, plain LLMs return a string
+    return getattr(result, "content", result)
+
+
+class LLMCallCounter:
+    """Counts LLM calls, split into answer and summary calls, per user turn."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.turns = 0
+        self.answer_calls = 0
+        self.summary_calls = 0
+        self.calls_by_turn = []
+
+    def start_turn(self):
+        with self.lock:
+            self.turns += 1
+            self.calls_by_turn.append(0)
+            return self.turns - 1
+
+    def record(self, kind, turn=None):
+        with self.lock:
+            if kind == "summary":
+                self.summary_calls += 1
+            else:
+                self.answer_calls += 1
+            if self.calls_by_turn:
+                index = len(self.calls_by_turn) - 1 if turn is None else turn
+                self.calls_by_turn[index] += 1
+
+    @property
+    def total_calls(self):
+        return self.answer_calls + self.summary_calls
+
+    def calls_last_turn(self):
+        with self.lock:
+            return self.calls_by_turn[-1] if self.calls_by_turn else 0
+
+    def calls_per_turn(self):
+        with self.lock:
+            return self.total_calls / self.turns if self.turns else 0.0
+
+
+class BudgetedSummaryMemory:
+    """
+    Keeps recent turns verbatim within a token budget. When the budget is exceeded,
+    the oldest turns are summarized as one batch on a background thread instead of
+    re-summarizing the whole history on every turn.
+    """
+
+    def __init__(self, llm, max_token_limit=800, preamble="", counter=None, background=True):
+        self.llm = llm
+        self.max_token_limit = max_token_limit
+        self.preamble = preamble
+        self.counter = counter
+        self.background = background
+
+        self.summary = ""
+        self.turns = []
+        self.pending = []  # turns handed to the summarizer, still shown verbatim until it finishes
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=1) if background else None
+        self.future = None
+
+    @staticmethod
+    def format_turns(turns):
+        return "\n".join(f"Human: {human}\nAI: {ai}" for human, ai in turns)
+
+    def buffer_tokens(self):
+        return sum(count_tokens(human) + count_tokens(ai) for human, ai in self.turns)
+
+    def history(self):
+        with self.lock:
+            lines = []
+            if self.preamble:
+                lines.append(f"System: {self.preamble}")
+            if self.summary:
+                lines.append(f"System: Summary of the earlier conversation: {self.summary}")
+            if self.pending or self.turns:
+                lines.append(self.format_turns(self.pending + self.turns))
+            return "\n".join(lines)
+
+    def save_turn(self, human, ai):
+        with self.lock:
+            self.turns.append((human, ai))
+            if self.buffer_tokens() <= self.max_token_limit or self.pending:
+                return  # within budget, or a batch is already being summarized
+            # Move the oldest turns out until only half of the budget is left,
+            # so the next summary is only needed after several more turns
+            batch = []
+            while self.turns and self.buffer_tokens() > self.max_token_limit // 2:
+                batch.append(self.turns.pop(0))
+            self.pending = batch
+            summary = self.summary
+
+        turn = self.counter.turns - 1 if self.counter else None
+        if self.executor:
+            self.future = self.executor.submit(self.summarize, summary, batch, turn)
+        else:
+            self.summarize(summary, batch, turn)
+
+    def summarize(self, summary, batch, turn=None):
+        try:
+            prompt = SUMMARY_PROMPT.format(summary=summary, new_lines=self.format_turns(batch))
+            new_summary = call_llm(self.llm, prompt).strip()
+            if self.counter:
+                self.counter.record("summary", turn)
+        except Exception as e:
+            # Keep the turns verbatim and try again on the next overflow
+            print(f"❌ Error summarizing conversation: {e}")
+            with self.lock:
+                self.turns = self.pending + self.turns
+                self.pending = []
+            return
+        with self.lock:
+            self.summary = new_summary
+            self.pending = []
+
+    def wait(self):
+        if self.future is not None:
+            self.future.result()
+
+    def state(self):
+        # Summary and verbatim turns: all that is needed to rebuild this memory
+        with self.lock:
+            return {"summary": self.summary, "turns": [list(turn) for turn in self.pending + self.turns]}
+
+    def restore(self, state):
+        with self.lock:
+            self.summary = state.get("summary", "")
+            self.turns = [tuple(turn) for turn in state.get("turns", [])]
+            self.pending = []
+
+    def size(self):
+        # Rough bytes held by the text of the memory
+        with self.lock:
+            return len(self.summary) + sum(len(human) + len(ai) for human, ai in self.pending + self.turns)
+
+
+class ChatStateStore:
+    """
+    Compact chat state (memory summary, recent turns, messages on screen) of evicted
+    sessions in SQLite, keyed by session. Rows older than max_age_seconds are removed.
+    """
+
+    def __init__(self, db_path="elderly_fitness.db", max_age_seconds=7 * 24 * 3600):
+        self.db_path = db_path
+        self.max_age_seconds = max_age_seconds
+        conn = sqlite3.connect(db_path, timeout=30)
+        conn.execute("""CREATE TABLE IF NOT EXISTS chat_sessions (
+                        session_id TEXT PRIMARY KEY,
+                        user_email TEXT,
+                        state TEXT,
+                        updated_at REAL
+                    )""")
+        conn.commit()
+        conn.close()
+
+    def save(self, session_id, user_email, state):
+        now = time.time()
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO chat_sessions (session_id, user_email, state, updated_at) "
+                         "VALUES (?, ?, ?, ?)", (session_id, user_email, json.dumps(state), now))
+            conn.execute("DELETE FROM chat_sessions WHERE updated_at < ?", (now - self.max_age_seconds,))
+        conn.close()
+
+    def load(self, session_id):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        row = conn.execute("SELECT state FROM chat_sessions WHERE session_id=?", (session_id,)).fetchone()
+        conn.close()
+        return json.loads(row[0]) if row else None
+
+
+class SummaryWindowConversation:
+    """Drop-in replacement for ConversationChain: one LLM call per turn for the answer."""
+
+    def __init__(self, llm, memory, counter=None, prompt=CONVERSATION_PROMPT):
+        self.llm = llm
+        self.memory = memory
+        self.counter = counter
+        self.prompt = prompt
+
+    def run(self, human_input):
+        if self.counter:
+            self.counter.start_turn()
+        prompt = self.prompt.format(history=self.memory.history(), input=human_input)
+        response = call_llm(self.llm, prompt).strip()
+        if self.counter:
+            self.counter.record("answer")
+        self.memory.save_turn(human_input, response)
+        return response
+
+
+def main():
+    # Compare LLM calls per turn against summarizing on every turn, using a local stand-in LLM
+    class StandInLLM:
+        def invoke(self, prompt):
+            return "Try two sets of ten slow squats holding on to a sturdy chair for balance."
+
+    questions = ["How many squats should I do?", "Is my knee pain normal?", "How often should I exercise?"] * 10
+
+    def run(memory_kwargs):
+        counter = LLMCallCounter()
+        llm = StandInLLM()
+        memory = BudgetedSummaryMemory(llm, counter=counter, **memory_kwargs)
+        conversation = SummaryWindowConversation(llm, memory, counter=counter)
+        for question in questions:
+            conversation.run(question)
+            memory.wait()
+        return counter
+
+    per_turn = run({"max_token_limit": 0, "background": False})  # old behaviour
+    budgeted = run({"max_token_limit": 200})
+    print(f"Summarize every turn: {per_turn.calls_per_turn():.2f} LLM calls per turn")
+    print(f"Budgeted window:      {budgeted.calls_per_turn():.2f} LLM calls per turn "
+          f"({budgeted.summary_calls} summary calls over {budgeted.turns} turns)")
+    # One answer call every turn, and summaries only on some turns
+    checks = {
+        "one answer call per turn": budgeted.answer_calls == budgeted.turns == len(questions),
+        "summaries batched": 0 < budgeted.summary_calls < budgeted.turns / 2,
+        "fewer calls per turn than summarizing every turn": budgeted.calls_per_turn() < per_turn.calls_per_turn(),
+    }
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return 0 if all(checks.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,61 +1,148 @@
+import json
 import os
+import time
+import uuid
+from collections import deque
 from dotenv import load_dotenv
 import streamlit as st
 from typing import Literal
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.chains import ConversationChain
-from langchain.chains.conversation.memory import ConversationSummaryMemory
 from dataclasses import dataclass
+from chat_memory import BudgetedSummaryMemory, ChatStateStore, LLMCallCounter, SummaryWindowConversation
+from response_cache import ResponseCache
+from session_resources import SessionResourceManager
 
 # Load environment variables from .env file
 load_dotenv()
 api_key = os.getenv("GOOGLE_API_KEY")
 
+# Prompts whose word sequences match at least this closely reuse a cached answer
+NEAR_DUPLICATE_THRESHOLD = 0.9
+# Messages kept on screen; older ones live on in the conversation summary
+MAX_HISTORY_MESSAGES = 100
+
 @dataclass
 class Message:
     origin: Literal["human", "ai"]
     message: str
 
+@st.cache_resource
+def get_response_cache():
+    # Shared by every session; answers that depend on a conversation are scoped to its user
+    return ResponseCache("elderly_fitness.db", similarity_threshold=NEAR_DUPLICATE_THRESHOLD)
+
+@st.cache_resource
+def get_session_resources():
+    # Heavy per-session objects, let go after SESSION_TTL_MINUTES idle or under memory pressure.
+    # Sessions only report the text they hold (SESSION_RESOURCE_BUDGET_MB); the LLM clients
+    # are not counted, so the process RSS limit (SESSION_MEMORY_LIMIT_MB, 0 turns it off)
+    # is what bounds the real footprint. The models alone take about 1.2 GB.
+    max_rss_mb = float(os.getenv("SESSION_MEMORY_LIMIT_MB", "2048"))
+    return SessionResourceManager(ttl_seconds=float(os.getenv("SESSION_TTL_MINUTES", "30")) * 60,
+                                  max_bytes=int(float(os.getenv("SESSION_RESOURCE_BUDGET_MB", "64")) * 1024 ** 2),
+                                  max_rss_bytes=int(max_rss_mb * 1024 ** 2) if max_rss_mb else None)
+
+@st.cache_resource
+def get_chat_store():
+    return ChatStateStore("elderly_fitness.db")
+
+class ChatSession:
+    # What an idle session gives up: the LLM client, the conversation memory and the messages on screen
+    def __init__(self, conversation, history=()):
+        self.conversation = conversation
+        self.history = deque(history, maxlen=MAX_HISTORY_MESSAGES)
+
+    def state(self):
+        self.conversation.memory.wait()
+        return {"memory": self.conversation.memory.state(),
+                "history": [[chat.origin, chat.message] for chat in self.history]}
+
+    def size(self):
+        # Characters of text held, not the memory behind the LLM client
+        return self.conversation.memory.size() + sum(len(chat.message) for chat in self.history)
+
+def new_chat_session(state=None):
+    st.write(f"API Key Loaded: {api_key}")
+    llm = ChatGoogleGenerativeAI(
+        google_api_key=api_key,
+        model="models/gemini-1.5-flash-latest",
+        temperature = 0
+    )
+
+    # Recent turns are kept verbatim; older ones are summarized in batches in the background
+    conversation_memory = BudgetedSummaryMemory(
+        llm=llm,
+        max_token_limit=800,
+        preamble="You are a chatbot inserted in a web app that uses AI to classify and count the repetitions of home exercises. Act as an expert in fitness and respond to the user as their personal AI trainer.",
+        counter=st.session_state.llm_calls
+    )
+    history = []
+    if state:
+        # An evicted chat comes back from its saved summary and recent turns
+        conversation_memory.restore(state["memory"])
+        history = [Message(origin, message) for origin, message in state["history"]]
+
+    conversation = SummaryWindowConversation(
+        llm=llm,
+        memory=conversation_memory,
+        counter=st.session_state.llm_calls
+    )
+    return ChatSession(conversation, history)
+
+def get_chat_session():
+    # None without an API key; rebuilt transparently if the resource manager evicted it
+    if not api_key:
+        return None
+    if "resource_session_id" not in st.session_state:
+        st.session_state.resource_session_id = uuid.uuid4().hex
+    session_id = st.session_state.resource_session_id
+    user_email = st.session_state.get("user_email")
+    store = get_chat_store()
+    return get_session_resources().get(
+        session_id, "chat", lambda: new_chat_session(store.load(session_id)),
+        persist=lambda chat: store.save(session_id, user_email, chat.state()), size=ChatSession.size)
+
 def initialize_session_state():
     if "token_count" not in st.session_state:
         st.session_state.token_count = 0
-    if "history" not in st.session_state:
-        st.session_state.history = []
-
-    if "conversation" not in st.session_state:
-        st.write(f"API Key Loaded: {api_key}")
-        if not api_key:
-            st.error("Gemini API key not found. Please check your .env file.")
-            return
-
-        llm = ChatGoogleGenerativeAI(
-            google_api_key=api_key,
-            model="models/gemini-1.5-flash-latest",
-            temperature = 0
-        )
-
-        conversation_memory = ConversationSummaryMemory(llm=llm)
-        conversation_memory.save_context(
-            {"human": ""},
-            {"ai": "You are a chatbot inserted in a web app that uses AI to classify and count the repetitions of home exercises. Act as an expert in fitness and respond to the user as their personal AI trainer."}
-        )
-
-        st.session_state.conversation = ConversationChain(
-            llm=llm,
-            memory=conversation_memory
-        )
+    if "llm_calls" not in st.session_state:
+        st.session_state.llm_calls = LLMCallCounter()
+
+    if not api_key:
+        st.error("Gemini API key not found. Please check your .env file.")
+
+def cache_context(memory):
+    # A first question has no context and is shared by everyone. Follow-ups depend on the
+    # summary and the verbatim recent turns, so those are keyed on the whole memory state
+    # and kept to this user (or this session when nobody is logged in)
+    state = memory.state()
+    if not state["summary"] and not state["turns"]:
+        return "", ""
+    scope = st.session_state.get("user_email") or st.session_state.resource_session_id
+    return json.dumps(state, sort_keys=True), scope
 
 def on_click_callback():
     human_prompt = st.session_state.get('human_prompt', '')
 
-    if "conversation" not in st.session_state:
+    chat = get_chat_session()
+    if chat is None:
         st.error("Conversation not initialized. Please reload the app.")
         return
 
     if human_prompt:
-        llm_response = st.session_state.conversation.run(human_prompt)
-        st.session_state.history.append(Message("human", human_prompt))
-        st.session_state.history.append(Message("ai", llm_response))
+        conversation = chat.conversation
+        cache = get_response_cache()
+        context, scope = cache_context(conversation.memory)
+        llm_response = cache.get(human_prompt, context, scope)
+        if llm_response is not None:
+            # Cache hit: no API call, but keep the turn in the conversation memory
+            conversation.memory.save_turn(human_prompt, llm_response)
+        else:
+            start = time.perf_counter()
+            llm_response = conversation.run(human_prompt)
+            cache.put(human_prompt, context, llm_response, time.perf_counter() - start, scope)
+        chat.history.append(Message("human", human_prompt))
+        chat.history.append(Message("ai", llm_response))
         st.session_state.token_count += len(llm_response.split())
         st.session_state.human_prompt = ""
 
@@ -93,8 +180,9 @@ def chat_ui():
     chat_placeholder = st.container()
     prompt_placeholder = st.form("chat-form")
 
+    chat_session = get_chat_session()
     with chat_placeholder:
-        for chat in st.session_state.history:
+        for chat in (chat_session.history if chat_session else []):
             div = f"""
             <div class="chat-row {'row-reverse' if chat.origin == 'human' else ''}">
                 <div class="chat-bubble {'user-bubble' if chat.origin == 'human' else 'ai-bubble'}">
@@ -108,5 +196,15 @@ def chat_ui():
         st.text_input("Chat", key="human_prompt")
         st.form_submit_button("Submit", on_click=on_click_callback)
 
+    llm_calls = st.session_state.llm_calls
+    if llm_calls.turns:
+        st.caption(f"LLM calls last turn: {llm_calls.calls_last_turn()} · "
+                   f"average per turn: {llm_calls.calls_per_turn():.2f}")
+
+    cache_stats = get_response_cache().stats()
+    if cache_stats["hits"] or cache_stats["misses"]:
+        st.caption(f"Answer cache hit rate: {cache_stats['hit_rate']:.0%} · "
+                   f"latency saved: {cache_stats['latency_saved_seconds']:.1f}s")
+
 if __name__ == "__main__":
     chat_ui()
\ No newline at end of file
@@ -0,0 +1,203 @@
+import argparse
+import time
+
+import numpy as np
+
+WINDOW_SIZE = 30
+NUM_FEATURES = 22
+
+
+def feature_scale(scaler, window_size=WINDOW_SIZE):
+    # Per-feature scale of the classifier's StandardScaler, averaged over window positions
+    return np.asarray(scaler.scale_, dtype=np.float64).reshape(window_size, NUM_FEATURES).mean(axis=0)
+
+
+class ClassificationGate:
+    """
+    Decides, window by window, whether auto_classify_and_count needs the classifier.
+
+    Each full window is summarised by the mean and standard deviation of its 22
+    features, in units of the classifier's scaler. The classifier runs when the mean
+    has drifted more than drift_threshold (RMS over features) from the last classified
+    window, when the spread changed by more than spread_threshold, or after
+    max_skipped windows in a row were skipped; otherwise the current label is kept.
+    After the movement changes, the classifier keeps running until confirm_windows
+    windows in a row agree, so one misread window at a transition is not kept.
+    """
+
+    def __init__(self, drift_threshold=1.0, spread_threshold=0.5, max_skipped=4, confirm_windows=2,
+                 feature_scale=None):
+        self.drift_threshold = drift_threshold
+        self.spread_threshold = spread_threshold
+        self.max_skipped = max_skipped
+        self.confirm_windows = confirm_windows
+        self.feature_scale = feature_scale
+
+        self.reference = None  # (mean, std) of the last classified window
+        self.label = None
+        self.agreeing = 0
+        self.skipped_in_row = 0
+        self.drift = 0.0
+        self.spread_change = 0.0
+
+        self.windows = 0
+        self.classified = 0
+        self.skipped = 0
+        self.switches = 0
+
+    def window_stats(self, window):
+        window = np.asarray(window, dtype=np.float64)
+        return window.mean(axis=0) / self.feature_scale, window.std(axis=0) / self.feature_scale
+
+    def check(self, stats):
+        # (classify?, movement changed?) for a window's stats
+        if self.reference is None:
+            return True, True
+        mean, std = stats
+        self.drift = float(np.sqrt(np.mean((mean - self.reference[0]) ** 2)))
+        self.spread_change = float(np.sqrt(np.mean((std - self.reference[1]) ** 2)))
+        changed = self.drift > self.drift_threshold or self.spread_change > self.spread_threshold
+        settled = self.agreeing >= self.confirm_windows
+        return changed or not settled or self.skipped_in_row >= self.max_skipped, changed
+
+    def classify(self, window, exer, window_size=WINDOW_SIZE):
+        # The label for a full window: the classifier's, or the current one when the movement is unchanged
+        if self.feature_scale is None:
+            self.feature_scale = feature_scale(exer.scaler, window_size)
+        self.windows += 1
+        stats = self.window_stats(window)
+        needed, changed = self.check(stats)
+        if not needed:
+            self.skipped += 1
+            self.skipped_in_row += 1
+            return self.label
+
+        label = exer.classify_window(window, window_size)
+        self.classified += 1
+        if label is None:
+            return None
+        self.agreeing = 1 if changed or label != self.label else self.agreeing + 1
+        if self.label is not None and label != self.label:
+            self.switches += 1
+        self.label = label
+        self.reference = stats
+        self.skipped_in_row = 0
+        return label
+
+    def stats(self):
+        return {"windows": self.windows, "classified": self.classified, "skipped": self.skipped,
+                "skipped_ratio": self.skipped / self.windows if self.windows else 0.0, "switches": self.switches}
+
+
+# --- Validation: gated against ungated classification on the demo clips ---
+def clip_landmarks(path):
+    # (33, 4) landmark arrays of the frames where a person was found, and the frame size
+    import cv2
+
+    import PoseModule2 as pm
+
+    detector = pm.posture_detector()
+    cap = cv2.VideoCapture(path)
+    frames, size = [], (640, 480)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        size = (frame.shape[1], frame.shape[0])
+        detector.find_person(frame, draw=False)
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        if len(landmark_list) != 0:
+            frames.append(landmark_list.data.copy())
+    cap.release()
+    return frames, size
+
+
+def replay(frames, size, exer, gate=None):
+    # auto_classify_and_count over recorded landmarks: labels of each window, reps per label
+    import ExerciseAiTrainer as exercise
+    import PoseModule2 as pm
+
+    detector = pm.posture_detector()
+    window, labels = [], []
+    prediction = None
+    stages, counters = {}, {}
+    classify_seconds = 0.0
+    for data in frames:
+        landmark_list = detector.set_landmarks(data, *size)
+        window.append(exer.extract_features(landmark_list))
+        if len(window) == WINDOW_SIZE:
+            start = time.perf_counter()
+            if gate is not None:
+                label = gate.classify(window, exer, WINDOW_SIZE)
+            else:
+                label = exer.classify_window(window, WINDOW_SIZE)
+            classify_seconds += time.perf_counter() - start
+            if label is not None:
+                prediction = label
+            labels.append(prediction)
+            window = []
+        count_function = exercise.COUNT_FUNCTIONS.get(prediction)
+        if count_function is not None:
+            stages[prediction], counters[prediction] = count_function(
+                detector, None, landmark_list, stages.get(prediction), counters.get(prediction, 0), None)
+    return {"labels": labels, "counts": {label: count for label, count in counters.items() if count},
+            "classify_s": classify_seconds}
+
+
+def switch_latencies(reference, gated):
+    # Windows until the gated labels follow each label switch of the ungated ones (None: never did)
+    latencies = []
+    for i in range(1, len(reference)):
+        if reference[i] == reference[i - 1]:
+            continue
+        late = next((j - i for j in range(i, len(gated)) if gated[j] == reference[i]), None)
+        latencies.append(late)
+    return latencies
+
+
+def main():
+    import ExerciseAiTrainer as exercise
+    from benchmark import CLIPS
+
+    parser = argparse.ArgumentParser(description="Motion-gated exercise classification against the ungated path.")
+    parser.add_argument("--clips", nargs="*", default=list(CLIPS))
+    parser.add_argument("--repeat", type=int, default=3, help="play each clip this many times in a row, as a longer set")
+    parser.add_argument("--drift", type=float, default=1.0)
+    parser.add_argument("--spread", type=float, default=0.5)
+    parser.add_argument("--max-skipped", type=int, default=4)
+    args = parser.parse_args()
+
+    exer = exercise.Exercise()
+    if not exer.is_ready():
+        print("🚫 Model components not fully loaded. Cannot validate.")
+        return 1
+
+    recorded = {name: clip_landmarks(name) for name in args.clips}
+    # Each clip as a longer set, then all of them in one session for the switches between exercises
+    sessions = {name: [name] * args.repeat for name in args.clips}
+    sessions["all clips in a row"] = [name for name in args.clips for _ in range(args.repeat)]
+
+    for session, parts in sessions.items():
+        frames = [data for name in parts for data in recorded[name][0]]
+        size = recorded[parts[0]][1]
+        gate = ClassificationGate(args.drift, args.spread, args.max_skipped)
+        ungated = replay(frames, size, exer)
+        gated = replay(frames, size, exer, gate)
+        stats = gate.stats()
+        agreement = np.mean([a == b for a, b in zip(ungated["labels"], gated["labels"])]) if stats["windows"] else 1.0
+        latencies = switch_latencies(ungated["labels"], gated["labels"])
+        followed = [late for late in latencies if late is not None]
+        status = "✅" if gated["counts"] == ungated["counts"] else "⚠️"
+        print(f"{status} {session}: {len(frames)} frames, {stats['windows']} windows, "
+              f"{stats['skipped_ratio']:.0%} of classifications skipped, labels agree on {agreement:.0%} of windows")
+        print(f"   ungated: {ungated['counts']}, classifier {ungated['classify_s'] * 1000:.0f} ms")
+        print(f"   gated:   {gated['counts']}, classifier {gated['classify_s'] * 1000:.0f} ms")
+        if latencies:
+            worst = max(followed) if followed else None
+            print(f"   {len(latencies)} label switches, {len(followed)} followed, "
+                  f"{sum(late == 0 for late in followed)} at once; latest {worst} windows "
+                  f"(~{(worst or 0) * WINDOW_SIZE} frames) behind")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import time
+
+import numpy as np
+from sklearn.preprocessing import LabelEncoder, StandardScaler
+
+import extract_features
+
+WINDOW_SIZE = 30
+NUM_FEATURES = extract_features.NUM_FEATURES
+
+
+class WindowDataset:
+    """
+    Classifier windows over the memory-mapped shards written by extract_features.py.
+
+    A window is WINDOW_SIZE consecutive frames in which a person was detected, the
+    same frames the live path collects before calling the model. Only an index is
+    kept in memory: for every shard the row numbers of its detected frames, and for
+    every window the shard and position of its first frame. Windows are gathered
+    from the shards one batch at a time.
+    """
+
+    def __init__(self, feature_dir, window_size=WINDOW_SIZE, stride=1, label_encoder=None, videos=None):
+        self.feature_dir = feature_dir
+        self.window_size = window_size
+        entries = extract_features.load_manifest(feature_dir)
+        if videos is not None:
+            entries = [entry for entry in entries if entry["video"] in videos]
+        self.entries = entries
+
+        if label_encoder is None:
+            label_encoder = LabelEncoder().fit(sorted({entry["label"] for entry in entries}))
+        self.label_encoder = label_encoder
+        known = set(label_encoder.classes_)
+
+        self.shards = {}
+        rows_per_shard = {}
+        window_shard, window_position, window_label = [], [], []
+        for entry in entries:
+            if entry["label"] not in known:
+                print(f"⚠️ Skipping {entry['video']}: label '{entry['label']}' is not in the label encoder")
+                continue
+            shard = entry["shard"]
+            if shard not in self.shards:
+                self.shards[shard] = extract_features.open_shard(feature_dir, shard)
+                rows_per_shard[shard] = []
+            detected = self.shards[shard][1][entry["start"]:entry["start"] + entry["length"]]
+            rows = np.flatnonzero(detected) + entry["start"]
+            offset = sum(len(r) for r in rows_per_shard[shard])
+            rows_per_shard[shard].append(rows)
+            starts = np.arange(0, len(rows) - window_size + 1, stride)
+            window_shard.append(np.full(len(starts), shard, dtype=np.int32))
+            window_position.append(starts + offset)
+            window_label.append(np.full(len(starts), label_encoder.transform([entry["label"]])[0], dtype=np.int32))
+
+        self.rows = {shard: np.concatenate(rows).astype(np.int64) for shard, rows in rows_per_shard.items()}
+        self.window_shard = np.concatenate(window_shard) if window_shard else np.empty(0, dtype=np.int32)
+        self.window_position = np.concatenate(window_position) if window_position else np.empty(0, dtype=np.int64)
+        self.labels = np.concatenate(window_label) if window_label else np.empty(0, dtype=np.int32)
+        self.offsets = np.arange(window_size)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def gather(self, indices):
+        # (len(indices), window_size, 22) float64 copies of the requested windows
+        windows = np.empty((len(indices), self.window_size, NUM_FEATURES), dtype=np.float64)
+        shards = self.window_shard[indices]
+        for shard in np.unique(shards):
+            selected = np.flatnonzero(shards == shard)
+            positions = self.window_position[indices[selected]]
+            rows = self.rows[shard][positions[:, None] + self.offsets]
+            windows[selected] = self.shards[shard][0][rows]
+        return windows
+
+    def fit_scaler(self, scaler=None, batch_size=4096):
+        # StandardScaler over the flattened window, fitted one batch at a time
+        scaler = scaler or StandardScaler()
+        indices = np.arange(len(self))
+        for start in range(0, len(indices), batch_size):
+            batch = self.gather(indices[start:start + batch_size])
+            scaler.partial_fit(batch.reshape(len(batch), -1))
+        return scaler
+
+    def batches(self, scaler, batch_size=64, shuffle=True, seed=None, targets=None):
+        # Scaled float32 windows and labels (or rows of `targets`, one per window); a new
+        # order every pass when shuffling. Sorting each batch by shard and row keeps the
+        # reads from the mapped files local.
+        targets = self.labels if targets is None else targets
+        rng = np.random.default_rng(seed)
+        while True:
+            order = rng.permutation(len(self)) if shuffle else np.arange(len(self))
+            for start in range(0, len(order), batch_size):
+                indices = np.sort(order[start:start + batch_size])
+                windows = self.gather(indices)
+                scaled = scaler.transform(windows.reshape(len(indices), -1))
+                yield scaled.reshape(windows.shape).astype(np.float32), targets[indices]
+            if not shuffle:
+                return
+
+    def tf_dataset(self, scaler, batch_size=64, shuffle=True, seed=None, prefetch=4, one_hot=True):
+        # Batches are produced on a background thread, at most `prefetch` ahead of training
+        import tensorflow as tf
+
+        classes = len(self.label_encoder.classes_)
+        dataset = tf.data.Dataset.from_generator(
+            lambda: self.batches(scaler, batch_size, shuffle, seed),
+            output_signature=(
+                tf.TensorSpec((None, self.window_size, NUM_FEATURES), tf.float32),
+                tf.TensorSpec((None,), tf.int32),
+            ),
+        )
+        if one_hot:
+            dataset = dataset.map(lambda x, y: (x, tf.one_hot(y, classes)))
+        return dataset.prefetch(prefetch)
+
+    def steps(self, batch_size):
+        return (len(self) + batch_size - 1) // batch_size
+
+
+def split_videos(feature_dir, validation_fraction=0.2, seed=0):
+    # Splits by video so that overlapping windows of one clip never end up on both sides
+    videos = sorted({entry["video"] for entry in extract_features.load_manifest(feature_dir)})
+    rng = np.random.default_rng(seed)
+    rng.shuffle(videos)
+    validation = max(1, int(round(len(videos) * validation_fraction))) if len(videos) > 1 else 0
+    return set(videos[validation:]), set(videos[:validation])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Window statistics and loader throughput for extracted features.")
+    parser.add_argument("feature_dir")
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    dataset = WindowDataset(args.feature_dir, stride=args.stride)
+    print(f"{len(dataset.entries)} videos, {len(dataset)} windows of {dataset.window_size} frames")
+    for index, label in enumerate(dataset.label_encoder.classes_):
+        print(f"  {label}: {int((dataset.labels == index).sum())} windows")
+
+    start = time.perf_counter()
+    scaler = dataset.fit_scaler()
+    print(f"Scaler fitted on {scaler.n_samples_seen_} windows in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    windows = sum(len(labels) for _, labels in dataset.batches(scaler, args.batch_size, shuffle=False))
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {windows} scaled windows in {elapsed:.2f}s ({windows / elapsed if elapsed else 0:.0f} windows/s)")
+
+
+if __name__ == "__main__":
+    main()
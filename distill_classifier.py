@@ -0,0 +1,200 @@
+import argparse
+import multiprocessing as mp_proc
+import os
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+from create_sequence_of_features import NUM_FEATURES, WINDOW_SIZE, WindowDataset, split_videos
+from ExerciseAiTrainer import CLASSIFIER_MODELS
+from session_resources import process_rss
+from train_bidirectionallstm import LABEL_ENCODER_FILE, SCALER_FILE
+
+FRAME_BUDGET_MS = 1000 / 15
+
+
+def build_student(kind, classes, width=32, learning_rate=1e-3):
+    """
+    Small classifiers with the teacher's input and output: 'cnn' is two dilated
+    temporal convolutions and an average over time, 'gru' a single unidirectional GRU.
+    """
+    from tensorflow.keras import layers, models, optimizers
+
+    if kind == "cnn":
+        body = [
+            layers.Conv1D(width, 5, padding="same", activation="relu"),
+            layers.Conv1D(width, 5, padding="same", dilation_rate=2, activation="relu"),
+            layers.GlobalAveragePooling1D(),
+        ]
+    elif kind == "gru":
+        body = [layers.GRU(width)]
+    else:
+        raise ValueError(f"Unknown student kind: {kind}")
+    model = models.Sequential([
+        layers.Input((WINDOW_SIZE, NUM_FEATURES)),
+        *body,
+        layers.Dropout(0.2),
+        layers.Dense(classes, activation="softmax"),
+    ])
+    model.compile(optimizer=optimizers.Adam(learning_rate), loss="categorical_crossentropy", metrics=["accuracy"])
+    return model
+
+
+def predict_all(model, dataset, scaler, batch_size=512):
+    # Class probabilities for every window of the dataset, in index order
+    probabilities = [model.predict_on_batch(x) for x, _ in dataset.batches(scaler, batch_size, shuffle=False)]
+    return np.concatenate(probabilities) if probabilities else np.empty((0, len(dataset.label_encoder.classes_)))
+
+
+def distillation_targets(teacher_probabilities, labels, classes, alpha=0.7, temperature=2.0):
+    # Teacher probabilities softened by the temperature, mixed with the one-hot labels
+    soft = np.power(np.clip(teacher_probabilities, 1e-8, 1.0), 1.0 / temperature)
+    soft /= soft.sum(axis=1, keepdims=True)
+    return (alpha * soft + (1 - alpha) * np.eye(classes)[labels]).astype(np.float32)
+
+
+def distill(student, dataset, scaler, targets, epochs=30, batch_size=64, seed=0):
+    import tensorflow as tf
+
+    data = tf.data.Dataset.from_generator(
+        lambda: dataset.batches(scaler, batch_size, seed=seed, targets=targets),
+        output_signature=(
+            tf.TensorSpec((None, dataset.window_size, NUM_FEATURES), tf.float32),
+            tf.TensorSpec((None, targets.shape[1]), tf.float32),
+        ),
+    ).prefetch(4)
+    student.fit(data, steps_per_epoch=dataset.steps(batch_size), epochs=epochs, verbose=2)
+    return student
+
+
+def measure_latency(model, repeats=300):
+    # One window at a time, as the live classifier runs; the first calls warm the graph up
+    window = np.random.default_rng(0).standard_normal((1, WINDOW_SIZE, NUM_FEATURES)).astype(np.float32)
+    for _ in range(10):
+        model.predict_on_batch(window)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict_on_batch(window)
+        times.append(time.perf_counter() - start)
+    times = np.array(times) * 1000
+    return float(np.percentile(times, 50)), float(np.percentile(times, 99))
+
+
+def model_memory(path, repeats=300):
+    # Runs in a fresh process: the most resident memory loading the model and classifying
+    # windows with it adds, after TensorFlow itself has been set up by a throwaway model
+    from tensorflow.keras import layers, models
+    from tensorflow.keras.models import load_model
+
+    window = np.zeros((1, WINDOW_SIZE, NUM_FEATURES), dtype=np.float32)
+    models.Sequential([layers.Input((WINDOW_SIZE, NUM_FEATURES)), layers.Flatten(), layers.Dense(1)]) \
+        .predict_on_batch(window)
+    before = peak = process_rss()
+    if before is None:
+        return float("nan")  # no /proc on this platform
+    model = load_model(path)
+    for _ in range(repeats):
+        model.predict_on_batch(window)
+        peak = max(peak, process_rss())
+    return (peak - before) / 1024 ** 2
+
+
+def measure_memory(path):
+    with mp_proc.get_context("spawn").Pool(1) as pool:
+        return pool.apply(model_memory, (path,))
+
+
+def report(name, model, path, dataset=None, scaler=None, teacher_labels=None):
+    # Accuracy needs held-out windows; latency, size and memory only need the model
+    p50, p99 = measure_latency(model)
+    weights_kb = sum(w.size * w.dtype.itemsize for w in model.get_weights()) / 1024
+    row = {
+        "model": name,
+        "accuracy": float("nan"),
+        "teacher_agreement": float("nan"),
+        "p50_ms": p50,
+        "p99_ms": p99,
+        "params": int(model.count_params()),
+        "weights_kb": weights_kb,
+        "peak_rss_mb": measure_memory(path),
+    }
+    quality = ""
+    if dataset is not None and len(dataset):
+        predicted = predict_all(model, dataset, scaler).argmax(axis=1)
+        row["accuracy"] = float((predicted == dataset.labels).mean())
+        row["teacher_agreement"] = float((predicted == teacher_labels).mean())
+        quality = f"accuracy {row['accuracy']:.1%}, agrees with teacher {row['teacher_agreement']:.1%}, "
+    print(f"{name:8s} {quality}latency p50 {p50:.2f} ms p99 {p99:.2f} ms ({p50 / FRAME_BUDGET_MS:.1%} of a 15 fps "
+          f"frame), {row['params']} parameters, {weights_kb:.0f} KB of weights, "
+          f"peak RSS +{row['peak_rss_mb']:.1f} MB to load and run")
+    return row
+
+
+def main():
+    from tensorflow.keras.models import load_model
+
+    parser = argparse.ArgumentParser(description="Distill the BiLSTM exercise classifier into a small CPU model.")
+    parser.add_argument("feature_dir", nargs="?", help="output directory of extract_features.py")
+    parser.add_argument("--kind", choices=("cnn", "gru"), default="cnn")
+    parser.add_argument("--width", type=int, default=32)
+    parser.add_argument("--epochs", type=int, default=30)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--alpha", type=float, default=0.7, help="weight of the teacher's soft targets")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--validation", type=float, default=0.2, help="fraction of videos held out")
+    parser.add_argument("--output", default=CLASSIFIER_MODELS["student"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--measure-only", action="store_true",
+                        help="compare latency, size and memory of an untrained student with the teacher; no data needed")
+    args = parser.parse_args()
+
+    # The student reuses the deployed scaler and label encoder, so it is a drop-in replacement
+    teacher = load_model(CLASSIFIER_MODELS["bilstm"])
+    scaler = joblib.load(SCALER_FILE)
+    label_encoder = joblib.load(LABEL_ENCODER_FILE)
+    classes = len(label_encoder.classes_)
+
+    if args.measure_only:
+        student = build_student(args.kind, classes, args.width)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "student.h5")
+            student.save(path)
+            report("bilstm", teacher, CLASSIFIER_MODELS["bilstm"])
+            report(args.kind, student, path)
+        return 0
+    if args.feature_dir is None:
+        parser.error("feature_dir is required unless --measure-only is given")
+
+    train_videos, validation_videos = split_videos(args.feature_dir, args.validation, args.seed)
+    train = WindowDataset(args.feature_dir, stride=args.stride, label_encoder=label_encoder, videos=train_videos)
+    validation = WindowDataset(args.feature_dir, stride=args.stride, label_encoder=label_encoder,
+                               videos=validation_videos)
+    if len(train) == 0:
+        print(f"❌ No training windows: videos need at least {WINDOW_SIZE} frames with a detected person")
+        return 1
+    print(f"Distilling a {args.kind} student on {len(train)} windows, evaluating on {len(validation)}")
+
+    targets = distillation_targets(predict_all(teacher, train, scaler), train.labels, classes,
+                                   args.alpha, args.temperature)
+    student = build_student(args.kind, classes, args.width)
+    distill(student, train, scaler, targets, args.epochs, args.batch_size, args.seed)
+
+    evaluation = validation if len(validation) else train
+    if not len(validation):
+        print("⚠️ No held-out videos; reporting on the training windows")
+    teacher_labels = predict_all(teacher, evaluation, scaler).argmax(axis=1)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    student.save(args.output)
+    report("bilstm", teacher, CLASSIFIER_MODELS["bilstm"], evaluation, scaler, teacher_labels)
+    report(args.kind, student, args.output, evaluation, scaler, teacher_labels)
+    print(f"✅ Saved the student to {args.output}; run with EXERCISE_CLASSIFIER=student to use it")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+import argparse
+import json
+import multiprocessing as mp_proc
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+VIDEO_EXTENSIONS = (".mp4", ".mov", ".avi", ".mkv")
+NUM_FEATURES = 22
+MANIFEST = "manifest.jsonl"
+
+
+def video_label(path, data_dir):
+    # data_dir/<label>/clip.mp4, or data_dir/<label>_<n>.mp4 like the bundled clips
+    relative = os.path.relpath(path, data_dir)
+    parent = os.path.dirname(relative)
+    if parent:
+        return parent.split(os.sep)[0]
+    return os.path.splitext(os.path.basename(path))[0].rsplit("_", 1)[0]
+
+
+def find_videos(data_dir):
+    videos = []
+    for root, _, files in os.walk(data_dir):
+        for name in sorted(files):
+            if name.lower().endswith(VIDEO_EXTENSIONS):
+                videos.append(os.path.join(root, name))
+    return sorted(videos)
+
+
+def extract_video(path):
+    # Runs in a pool process. Same values as Exercise.extract_features for every frame:
+    # landmark_features when a person is found, the -1.0 placeholder row otherwise.
+    import ExerciseAiTrainer as exercise
+    import PoseModule2 as pm
+
+    start = time.perf_counter()
+    detector = pm.posture_detector()  # fresh tracking state for every video
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise RuntimeError(f"Could not open {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    features, detected = [], []
+    while True:
+        ret, frame = cap.read(detector.frame_buffer())
+        if not ret:
+            break
+        detector.find_person(frame, draw=False)
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        found = len(landmark_list) != 0
+        features.append(exercise.landmark_features(landmark_list) if found else np.full(NUM_FEATURES, -1.0))
+        detected.append(found)
+    cap.release()
+    features = np.array(features, dtype=np.float64).reshape(-1, NUM_FEATURES)
+    return features, np.array(detected, dtype=bool), fps, time.perf_counter() - start
+
+
+class ShardWriter:
+    """
+    Packs per-video feature arrays into fixed-capacity shards
+    (features-NNNNN.npy, float64 (rows, 22), and detected-NNNNN.npy, bool (rows,)).
+    A video never spans two shards. Its manifest line is appended only after its
+    shard is on disk, so after a crash only the videos of the unfinished shard are redone.
+    """
+
+    def __init__(self, out_dir, shard_frames=20000):
+        self.out_dir = out_dir
+        self.shard_frames = shard_frames
+        self.manifest_path = os.path.join(out_dir, MANIFEST)
+        entries = load_manifest(out_dir)
+        self.shard = max((entry["shard"] for entry in entries), default=-1) + 1
+        self.features = np.empty((shard_frames, NUM_FEATURES), dtype=np.float64)
+        self.detected = np.empty(shard_frames, dtype=bool)
+        self.rows = 0
+        self.pending = []
+
+    def add(self, entry, features, detected):
+        n = len(features)
+        if self.rows + n > self.shard_frames:
+            self.flush()
+        if n > self.shard_frames:
+            # A video longer than a shard gets a shard of its own
+            self.write_shard(features, detected, [dict(entry, start=0, length=n)])
+            return
+        self.features[self.rows:self.rows + n] = features
+        self.detected[self.rows:self.rows + n] = detected
+        self.pending.append(dict(entry, start=self.rows, length=n))
+        self.rows += n
+
+    def flush(self):
+        if self.pending:
+            self.write_shard(self.features[:self.rows], self.detected[:self.rows], self.pending)
+        self.rows = 0
+        self.pending = []
+
+    def write_shard(self, features, detected, entries):
+        for name, array in (("features", features), ("detected", detected)):
+            path = os.path.join(self.out_dir, f"{name}-{self.shard:05d}.npy")
+            np.save(path + ".tmp.npy", array)
+            os.replace(path + ".tmp.npy", path)
+        with open(self.manifest_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps(dict(entry, shard=self.shard)) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.shard += 1
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def open_shard(out_dir, shard):
+    # Memory-mapped (features, detected) of one shard
+    features = np.load(os.path.join(out_dir, f"features-{shard:05d}.npy"), mmap_mode="r")
+    detected = np.load(os.path.join(out_dir, f"detected-{shard:05d}.npy"), mmap_mode="r")
+    return features, detected
+
+
+def iter_videos(out_dir):
+    # (manifest entry, features, detected) per video, as views into the mapped shards
+    shards = {}
+    for entry in load_manifest(out_dir):
+        if entry["shard"] not in shards:
+            shards[entry["shard"]] = open_shard(out_dir, entry["shard"])
+        features, detected = shards[entry["shard"]]
+        rows = slice(entry["start"], entry["start"] + entry["length"])
+        yield entry, features[rows], detected[rows]
+
+
+def extract_directory(data_dir, out_dir, workers=None, shard_frames=20000):
+    os.makedirs(out_dir, exist_ok=True)
+    done = {(entry["video"], entry["size"]) for entry in load_manifest(out_dir)}
+    todo = []
+    for path in find_videos(data_dir):
+        key = (os.path.relpath(path, data_dir), os.path.getsize(path))
+        if key not in done:
+            todo.append((path, key))
+    skipped = len(done)
+    print(f"{len(todo)} videos to extract, {skipped} already in {out_dir}")
+
+    writer = ShardWriter(out_dir, shard_frames)
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    frames = failed = 0
+    # spawn: TensorFlow and MediaPipe state must not be forked
+    with ProcessPoolExecutor(workers, mp_context=mp_proc.get_context("spawn")) as pool:
+        queue = list(reversed(todo))
+        running = {}
+        while queue or running:
+            # A bounded number of videos in flight keeps results streaming into the shards
+            while queue and len(running) < 2 * workers:
+                path, key = queue.pop()
+                running[pool.submit(extract_video, path)] = (path, key)
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                path, (relative, size) = running.pop(future)
+                try:
+                    features, detected, fps, seconds = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"❌ {relative}: {e}")
+                    continue
+                writer.add({"video": relative, "size": size, "label": video_label(path, data_dir),
+                            "fps": fps, "frames": len(features), "detected": int(detected.sum())},
+                           features, detected)
+                frames += len(features)
+                print(f"✅ {relative}: {len(features)} frames in {seconds:.1f}s")
+    writer.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f"Extracted {frames} frames from {len(todo) - failed} videos in {elapsed:.1f}s "
+          f"({frames / elapsed if elapsed else 0:.1f} frames/s on {workers} workers), {failed} failed")
+    return failed
+
+
+def verify(out_dir, data_dir, videos=1):
+    # Recomputes a few videos serially with Exercise.extract_features and compares bit for bit
+    import ExerciseAiTrainer as exercise
+    import PoseModule2 as pm
+
+    exer = exercise.Exercise()
+    for entry, features, _ in list(iter_videos(out_dir))[:videos]:
+        detector = pm.posture_detector()
+        cap = cv2.VideoCapture(os.path.join(data_dir, entry["video"]))
+        expected = []
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            expected.append(exer.extract_features(exer.preprocess_frame(frame, detector)))
+        cap.release()
+        same = np.array_equal(np.array(expected), features)
+        print(f"{'✅' if same else '❌'} {entry['video']}: features {'match' if same else 'differ from'} "
+              f"Exercise.extract_features")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extract classifier features from a directory of labeled videos.")
+    parser.add_argument("data_dir", help="videos in <label>/ subdirectories, or named <label>_<n>.mp4")
+    parser.add_argument("out_dir")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--shard-frames", type=int, default=20000)
+    parser.add_argument("--verify", type=int, default=0, metavar="N",
+                        help="re-extract the first N videos serially and compare")
+    args = parser.parse_args()
+
+    failed = extract_directory(args.data_dir, args.out_dir, args.workers, args.shard_frames)
+    if args.verify:
+        verify(args.out_dir, args.data_dir, args.verify)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,256 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+TEMPLATE_FILE = "form_templates.json"
+TRAJECTORY_LENGTH = 32
+# Template files record how reps were cut; older ones stopped each rep at the count threshold
+TEMPLATE_CYCLE = "full"
+
+
+def resample(trajectory, length=TRAJECTORY_LENGTH):
+    # A rep's angle trajectory stretched or squeezed to `length` evenly spaced samples
+    trajectory = np.asarray(trajectory, dtype=np.float64)
+    if len(trajectory) == 1:
+        return np.full(length, trajectory[0])
+    return np.interp(np.linspace(0, len(trajectory) - 1, length), np.arange(len(trajectory)), trajectory)
+
+
+def envelope(series, radius):
+    # Running max and min over +-radius samples: the LB_Keogh envelope of a query
+    padded = np.pad(series, radius, mode="edge")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, 2 * radius + 1)
+    return windows.max(axis=1), windows.min(axis=1)
+
+
+def lb_keogh(upper, lower, templates):
+    # Lower bound of the banded DTW distance from the query to every template (rows)
+    above = np.maximum(templates - upper, 0)
+    below = np.maximum(lower - templates, 0)
+    return (above * above + below * below).sum(axis=1)
+
+
+def dtw_batch(query, templates, radius, best=np.inf):
+    """
+    Squared-difference DTW from the query to each template row, constrained to a
+    Sakoe-Chiba band of +-radius samples. All templates advance one query sample at a
+    time; those whose best partial path already exceeds `best` are dropped, and come
+    back as inf.
+    """
+    count, length = templates.shape
+    distances = np.full(count, np.inf)
+    alive = np.arange(count)
+    columns = np.ascontiguousarray(templates.T)  # (template sample j, candidate)
+    previous = np.full((length + 1, count), np.inf)
+    previous[0] = 0.0
+    for i in range(1, length + 1):
+        current = np.full((length + 1, len(alive)), np.inf)
+        for j in range(max(1, i - radius), min(length, i + radius) + 1):
+            difference = columns[j - 1] - query[i - 1]
+            current[j] = difference * difference + np.minimum(np.minimum(previous[j - 1], previous[j]), current[j - 1])
+        keep = current.min(axis=0) < best
+        if not keep.all():
+            alive, current, columns = alive[keep], current[:, keep], columns[:, keep]
+            if not len(alive):
+                return distances
+        previous = current
+    distances[alive] = previous[length]
+    return distances
+
+
+class FormScorer:
+    """
+    Scores a rep by how closely its joint-angle trajectory follows the nearest
+    reference trajectory of the same exercise under dynamic time warping.
+
+    Trajectories are resampled to `length` samples. Templates are visited in order
+    of their LB_Keogh lower bound in blocks (the first of `block` templates, each next
+    one twice as large), and the search stops as soon as the next bound cannot beat
+    the best distance found; within a block, candidates are abandoned once their
+    partial path is already worse. The score is
+    100 * exp(-rms / tolerance), rms being the matched path's per-sample error in degrees.
+    Exercises with fewer than min_templates reference reps are not scored (None).
+    """
+
+    def __init__(self, templates=None, radius=3, length=TRAJECTORY_LENGTH, tolerance=20.0, block=64,
+                 min_templates=3):
+        self.radius = radius
+        self.length = length
+        self.tolerance = tolerance
+        self.block = block
+        self.min_templates = min_templates
+        self.templates = {}
+        for exercise, trajectories in (templates or {}).items():
+            for trajectory in trajectories:
+                self.add_template(exercise, trajectory)
+        self.last_stats = {}
+
+    @classmethod
+    def load(cls, path=TEMPLATE_FILE, **kwargs):
+        if not os.path.exists(path):
+            print(f"❌ No form templates at {path}; form scores are disabled")
+            return cls(**kwargs)
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("cycle") != TEMPLATE_CYCLE:
+            print(f"❌ {path} was not built from full rep cycles; form scores are disabled until "
+                  f"it is rebuilt with `python form_score.py --build`")
+            return cls(**kwargs)
+        scorer = cls(data["templates"], **kwargs)
+        for exercise in exercise_labels():
+            count = len(scorer.templates.get(exercise, ()))
+            if count < scorer.min_templates:
+                print(f"⚠️ {exercise} reps are not scored: {count} reference reps in {path}, "
+                      f"{scorer.min_templates} needed")
+        return scorer
+
+    def add_template(self, exercise, trajectory):
+        row = resample(trajectory, self.length)[None, :]
+        existing = self.templates.get(exercise)
+        self.templates[exercise] = row if existing is None else np.vstack([existing, row])
+
+    def match(self, exercise, trajectory, prune=True):
+        # (distance, template index) of the nearest template, or (inf, None) without templates
+        templates = self.templates.get(exercise)
+        if templates is None or len(trajectory) == 0:
+            return np.inf, None
+        query = resample(trajectory, self.length)
+        if not prune:
+            distances = dtw_batch(query, templates, self.radius)
+            self.last_stats = {"templates": len(templates), "dtw": len(templates)}
+            return float(distances.min()), int(distances.argmin())
+
+        upper, lower = envelope(query, self.radius)
+        bounds = lb_keogh(upper, lower, templates)
+        order = np.argsort(bounds)
+        best, best_index, computed = np.inf, None, 0
+        start, block = 0, self.block
+        while start < len(order):
+            candidates = order[start:start + block]
+            start, block = start + block, block * 2
+            candidates = candidates[bounds[candidates] < best]
+            if not len(candidates):
+                break
+            distances = dtw_batch(query, templates[candidates], self.radius, best)
+            computed += len(candidates)
+            i = int(distances.argmin())
+            if distances[i] < best:
+                best, best_index = float(distances[i]), int(candidates[i])
+        self.last_stats = {"templates": len(templates), "dtw": computed}
+        return best, best_index
+
+    def score(self, exercise, trajectory):
+        # None where there is no reference good enough to compare against
+        templates = self.templates.get(exercise)
+        if templates is None or len(templates) < self.min_templates:
+            return None
+        distance, index = self.match(exercise, trajectory)
+        if index is None:
+            return None
+        rms = np.sqrt(distance / self.length)
+        return float(100 * np.exp(-rms / self.tolerance))
+
+
+# --- Templates from the bundled clips, and the scoring benchmark ---
+def rep_trajectories(path, exercise_label):
+    import cv2
+
+    import ExerciseAiTrainer as exercise
+    import PoseModule2 as pm
+    from rep_events import RepTracker
+
+    detector = pm.posture_detector()
+    count_function = exercise.COUNT_FUNCTIONS[exercise_label]
+    reps = RepTracker(exercise_label)
+    cap = cv2.VideoCapture(path)
+    stage, counter = None, 0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        detector.find_person(frame, draw=False)
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        if len(landmark_list) != 0:
+            stage, counter = count_function(detector, None, landmark_list, stage, counter, None, reps)
+    cap.release()
+    return [event["trajectory"] for event in reps.events]
+
+
+def exercise_labels():
+    import ExerciseAiTrainer as exercise
+    return list(exercise.COUNT_FUNCTIONS)
+
+
+def synthetic_templates(trajectories, count, rng):
+    # Variations of the real reps: random time warps, offsets, scaling and noise
+    templates = []
+    for i in range(count):
+        base = resample(trajectories[i % len(trajectories)], 64)
+        warp = np.cumsum(rng.uniform(0.5, 1.5, len(base)))
+        warped = np.interp(np.linspace(warp[0], warp[-1], len(base)), warp, base)
+        mean = warped.mean()
+        templates.append((warped - mean) * rng.uniform(0.8, 1.2) + mean + rng.normal(0, 8)
+                         + rng.normal(0, 2, len(base)))
+    return templates
+
+
+def main():
+    from benchmark import CLIPS
+
+    parser = argparse.ArgumentParser(description="Form scoring: build reference templates and benchmark the search.")
+    parser.add_argument("--build", action="store_true", help=f"rebuild {TEMPLATE_FILE} from the bundled clips")
+    parser.add_argument("--clip", action="append", default=[], metavar="PATH:LABEL",
+                        help="more reference clips for --build, e.g. press.mp4:'shoulder press'")
+    parser.add_argument("--templates", type=int, nargs="*", default=[100, 1000, 10000])
+    args = parser.parse_args()
+
+    if args.build:
+        clips = [(name, label) for name, label in CLIPS.items() if label]
+        clips += [tuple(clip.rsplit(":", 1)) for clip in args.clip]
+        templates = {}
+        for name, label in clips:
+            for trajectory in rep_trajectories(name, label):
+                templates.setdefault(label, []).append([round(float(a), 2) for a in trajectory])
+        with open(TEMPLATE_FILE, "w") as f:
+            json.dump({"cycle": TEMPLATE_CYCLE, "templates": templates}, f)
+        print(f"✅ {TEMPLATE_FILE}: " + ", ".join(f"{len(t)} {label}" for label, t in templates.items()))
+        for label in exercise_labels():
+            if len(templates.get(label, ())) < FormScorer().min_templates:
+                print(f"❌ Too few {label} reps to score its form; add clips with --clip")
+
+    if not os.path.exists(TEMPLATE_FILE):
+        print(f"❌ No {TEMPLATE_FILE}; build it with --build")
+        return
+    with open(TEMPLATE_FILE) as f:
+        reference = json.load(f).get("templates", {})
+    rng = np.random.default_rng(0)
+    for exercise, trajectories in reference.items():
+        # Each reference rep against the others; against itself it would always score 100
+        scores = [FormScorer({exercise: trajectories[:i] + trajectories[i + 1:]}, min_templates=1)
+                  .score(exercise, t) for i, t in enumerate(trajectories)]
+        print(f"\n{exercise}: reference reps score "
+              + ", ".join("-" if score is None else f"{score:.0f}" for score in scores) + " against the others")
+        queries = synthetic_templates(trajectories, 20, rng)
+        for count in args.templates:
+            scorer = FormScorer({exercise: synthetic_templates(trajectories, count, rng)})
+            timings, exact_timings, computed = [], [], []
+            for query in queries:
+                start = time.perf_counter()
+                distance, _ = scorer.match(exercise, query)
+                timings.append(time.perf_counter() - start)
+                computed.append(scorer.last_stats["dtw"])
+                start = time.perf_counter()
+                exact, _ = scorer.match(exercise, query, prune=False)
+                exact_timings.append(time.perf_counter() - start)
+                if not np.isclose(distance, exact):
+                    print(f"❌ Pruned search missed the nearest template: {distance} vs {exact}")
+            print(f"  {count:6d} templates: {np.median(timings) * 1000:7.2f} ms per rep "
+                  f"(p99 {np.percentile(timings, 99) * 1000:.2f}), full DTW {np.median(exact_timings) * 1000:7.2f} ms, "
+                  f"{np.mean(computed) / count:.1%} of templates reached DTW")
+
+
+if __name__ == "__main__":
+    main()
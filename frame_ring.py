@@ -0,0 +1,261 @@
+import argparse
+import multiprocessing as mp_proc
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+NUM_LANDMARKS = 33
+
+# Per-slot header fields and slot states
+STATE, SEQ, DETECTED, ELAPSED_US = 0, 1, 2, 3
+HEADER_FIELDS = 4
+EMPTY, WRITING, FILLED, CLAIMED, DONE = 0, 1, 2, 3, 4
+FAILED = -1  # DETECTED of a frame whose inference raised
+
+
+class FrameRing:
+    """
+    Ring of fixed-shape frame slots in shared memory, each with a (33, 4) float32
+    landmark slot for the result. Capture writes (or decodes) straight into a slot and
+    inference reads it in place, so pixels are never pickled or copied between processes.
+
+    Slots carry a state and a sequence number; put/take/complete/collect coordinate the
+    producer and the consumer process through a shared condition. overwrite=True reuses
+    the oldest frame inference has not started on when the ring is full (live cameras),
+    overwrite=False makes the producer wait for a free slot (files).
+    """
+
+    def __init__(self, shape, slots=4, overwrite=True, condition=None, name=None):
+        self.shape = tuple(shape)
+        self.slots = slots
+        self.overwrite = overwrite
+        self.condition = condition
+        self.owner = name is None
+
+        header_bytes = slots * HEADER_FIELDS * 8
+        landmark_bytes = slots * NUM_LANDMARKS * 4 * 4
+        frame_bytes = slots * int(np.prod(self.shape))
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=header_bytes + landmark_bytes + frame_bytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        buf = self.shm.buf
+        self.header = np.ndarray((slots, HEADER_FIELDS), dtype=np.int64, buffer=buf)
+        self.landmarks = np.ndarray((slots, NUM_LANDMARKS, 4), dtype=np.float32, buffer=buf, offset=header_bytes)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf,
+                                 offset=header_bytes + landmark_bytes)
+        if self.owner:
+            self.header[:] = 0
+        self.next_seq = 1
+        self.dropped = 0
+
+    def spec(self):
+        # Everything another process needs to attach to this ring
+        return {"name": self.shm.name, "shape": self.shape, "slots": self.slots, "overwrite": self.overwrite}
+
+    @classmethod
+    def attach(cls, spec, condition=None):
+        return cls(spec["shape"], spec["slots"], spec["overwrite"], condition, name=spec["name"])
+
+    def close(self):
+        # Views must go before the mapping can be closed: results are handed out as copies,
+        # so a BufferError here means a frame view someone took is still alive
+        if self.shm is None:
+            return
+        del self.header, self.landmarks, self.frames
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+        self.shm = None
+
+    def oldest(self, state):
+        slots = np.flatnonzero(self.header[:, STATE] == state)
+        if not slots.size:
+            return None
+        return int(slots[np.argmin(self.header[slots, SEQ])])
+
+    def busy(self):
+        # Slots holding a frame or a result nobody has collected yet
+        with self.condition:
+            return int((self.header[:, STATE] != EMPTY).sum())
+
+    def wait_for(self, find, timeout):
+        # Runs find() under the condition until it returns something, or None on timeout
+        with self.condition:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                found = find()
+                if found is not None:
+                    return found
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                self.condition.wait(remaining)
+
+    # --- Producer ---
+    def reserve(self, timeout=None):
+        # Returns a slot to write the next frame into, or None on timeout
+        def find():
+            slot = self.oldest(EMPTY)
+            if slot is None and self.overwrite:
+                # Live sources: drop the oldest frame nobody has started on, else the oldest unread result
+                slot = self.oldest(FILLED)
+                if slot is None:
+                    slot = self.oldest(DONE)
+                if slot is not None:
+                    self.dropped += 1
+            if slot is not None:
+                self.header[slot, STATE] = WRITING
+                self.header[slot, SEQ] = self.next_seq
+                self.next_seq += 1
+            return slot
+
+        return self.wait_for(find, timeout)
+
+    def commit(self, slot):
+        with self.condition:
+            self.header[slot, STATE] = FILLED
+            self.condition.notify_all()
+        return int(self.header[slot, SEQ])
+
+    def cancel(self, slot):
+        # A reserved slot that got no frame (end of the video)
+        with self.condition:
+            self.header[slot, STATE] = EMPTY
+            self.condition.notify_all()
+
+    def put(self, frame, timeout=None):
+        slot = self.reserve(timeout)
+        if slot is None:
+            return None
+        np.copyto(self.frames[slot], frame)
+        return self.commit(slot)
+
+    def collect(self, timeout=None, frame=False):
+        """
+        Oldest finished result, or None on timeout: a dict with the frame's seq, a copy of
+        its landmarks (None if nobody was detected), the inference time, whether inference
+        failed and, with frame=True, a copy of the pixels. Frees the slot.
+        """
+        def find():
+            slot = self.oldest(DONE)
+            if slot is None:
+                return None
+            detected = int(self.header[slot, DETECTED])
+            result = {
+                "seq": int(self.header[slot, SEQ]),
+                "landmarks": self.landmarks[slot].copy() if detected == 1 else None,
+                "seconds": self.header[slot, ELAPSED_US] / 1e6,
+                "failed": detected == FAILED,
+                "frame": self.frames[slot].copy() if frame else None,
+            }
+            self.header[slot, STATE] = EMPTY
+            self.condition.notify_all()
+            return result
+
+        return self.wait_for(find, timeout)
+
+    def clear(self, timeout=None):
+        # Drops every frame and result, after the frame being inferred (if any) is done.
+        # False if that did not happen within the timeout
+        with self.condition:
+            self.header[self.header[:, STATE] == FILLED, STATE] = EMPTY
+            claimed = self.wait_for(lambda: None if (self.header[:, STATE] == CLAIMED).any() else True, timeout)
+            self.header[:, STATE] = EMPTY
+            self.condition.notify_all()
+            return claimed is not None
+
+    # --- Consumer ---
+    def take(self, timeout=None):
+        # Oldest waiting frame: (slot, seq, frame view), or None on timeout
+        def find():
+            slot = self.oldest(FILLED)
+            if slot is None:
+                return None
+            self.header[slot, STATE] = CLAIMED
+            return slot, int(self.header[slot, SEQ]), self.frames[slot]
+
+        return self.wait_for(find, timeout)
+
+    def complete(self, slot, landmarks=None, seconds=0.0, failed=False):
+        with self.condition:
+            self.header[slot, DETECTED] = FAILED if failed else landmarks is not None
+            self.header[slot, ELAPSED_US] = int(seconds * 1e6)
+            if landmarks is not None:
+                self.landmarks[slot] = landmarks
+            self.header[slot, STATE] = DONE
+            self.condition.notify_all()
+
+
+# --- Throughput benchmark: shared-memory ring vs pickling frames through a queue ---
+def ring_consumer(spec, condition, frames):
+    ring = FrameRing.attach(spec, condition)
+    for _ in range(frames):
+        slot, _, frame = ring.take()
+        # Stand-in for inference: touch the pixels, return a landmark-sized result
+        ring.complete(slot, np.full((NUM_LANDMARKS, 4), frame[::64, ::64].mean(), dtype=np.float32))
+        del frame
+    ring.close()
+
+
+def queue_consumer(frame_queue, result_queue, frames):
+    for _ in range(frames):
+        frame = frame_queue.get()
+        result_queue.put(np.full((NUM_LANDMARKS, 4), frame[::64, ::64].mean(), dtype=np.float32))
+
+
+def benchmark_ring(context, frame, frames):
+    # As PoseWorker.stream for files: up to slots-1 frames in flight, then wait for a result
+    condition = context.Condition()
+    ring = FrameRing(frame.shape, slots=4, overwrite=False, condition=condition)
+    consumer = context.Process(target=ring_consumer, args=(ring.spec(), condition, frames))
+    consumer.start()
+    start = time.perf_counter()
+    sent = received = 0
+    while received < frames:
+        while sent < frames and sent - received < ring.slots - 1:
+            ring.put(frame)
+            sent += 1
+        ring.collect()
+        received += 1
+    elapsed = time.perf_counter() - start
+    consumer.join()
+    ring.close()
+    return frames / elapsed
+
+
+def benchmark_queue(context, frame, frames):
+    frame_queue, result_queue = context.Queue(maxsize=3), context.Queue()
+    consumer = context.Process(target=queue_consumer, args=(frame_queue, result_queue, frames))
+    consumer.start()
+    start = time.perf_counter()
+    sent = received = 0
+    while received < frames:
+        while sent < frames and sent - received < 3:
+            frame_queue.put(frame)
+            sent += 1
+        result_queue.get()
+        received += 1
+    elapsed = time.perf_counter() - start
+    consumer.join()
+    return frames / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frame transport throughput: shared-memory ring vs queue pickling.")
+    parser.add_argument("--frames", type=int, default=500)
+    args = parser.parse_args()
+
+    context = mp_proc.get_context("spawn")
+    for height, width in [(480, 640), (720, 1280), (1080, 1920)]:
+        frame = np.random.randint(0, 255, (height, width, 3), dtype=np.uint8)
+        ring_fps = benchmark_ring(context, frame, args.frames)
+        queue_fps = benchmark_queue(context, frame, args.frames)
+        print(f"{width}x{height}: ring {ring_fps:8.0f} frames/s   queue {queue_fps:8.0f} frames/s   "
+              f"({ring_fps / queue_fps:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import time
+
+import cv2
+
+
+class FrameSampler:
+    """
+    Reads only the frames that are analysed. Skipped frames are grab()bed (demuxed and
+    decoded, but never converted to BGR or copied out); analysed frames are retrieve()d.
+    Jumps longer than seek_threshold frames seek instead of grabbing every frame between.
+    """
+
+    def __init__(self, cap, analysis_fps=None, seek_threshold=None):
+        self.cap = cap
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        # Analyse every step-th frame, e.g. 15 of 60 fps -> step 4
+        self.step = max(1, round(self.fps / analysis_fps)) if analysis_fps else 1
+        # Seeking lands on the previous keyframe and decodes forward, so it only pays off for long jumps
+        self.seek_threshold = seek_threshold if seek_threshold is not None else int(self.fps * 2)
+        self.position = 0  # index of the frame the next grab() returns
+
+        self.grabbed = 0
+        self.retrieved = 0
+        self.seeks = 0
+        self.grab_seconds = 0.0
+        self.retrieve_seconds = 0.0
+
+    def snap(self, frame_number):
+        # Latest analysed frame at or before frame_number, or None if it was already read
+        frame_number -= frame_number % self.step
+        return frame_number if frame_number >= self.position else None
+
+    def read_at(self, frame_number, buffer=None):
+        # Frame frame_number (>= position) as (ret, frame); frames before it are skipped
+        gap = frame_number - self.position
+        if gap > self.seek_threshold:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+            self.seeks += 1
+            gap = 0
+        start = time.perf_counter()
+        for _ in range(gap + 1):
+            ret = self.cap.grab()
+            if not ret:
+                self.grab_seconds += time.perf_counter() - start
+                return False, None
+            self.grabbed += 1
+        self.grab_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        ret, frame = self.cap.retrieve(buffer)
+        self.retrieve_seconds += time.perf_counter() - start
+        self.retrieved += ret
+        self.position = frame_number + 1
+        return ret, frame
+
+    def frames(self, start=0, end=None, buffer=None):
+        # Yields (frame_number, frame) for every analysed frame in [start, end)
+        frame_number = start + (-start) % self.step
+        while end is None or frame_number < end:
+            ret, frame = self.read_at(frame_number, buffer)
+            if not ret:
+                return
+            yield frame_number, frame
+            frame_number += self.step
+
+    def stats(self):
+        skipped = self.grabbed - self.retrieved
+        retrieve_ms = self.retrieve_seconds / self.retrieved * 1000 if self.retrieved else 0.0
+        return {
+            "step": self.step,
+            "analysed": self.retrieved,
+            "skipped": skipped,
+            "seeks": self.seeks,
+            "grab_s": self.grab_seconds,
+            "retrieve_s": self.retrieve_seconds,
+            # Every skipped frame would otherwise have been retrieved as well
+            "decode_saved_s": skipped * retrieve_ms / 1000,
+        }
+
+
+# --- Benchmark: decode time and rep counts across analysis rates ---
+def decode_seconds(path, analysis_fps, sampled=True, repeats=3):
+    # Best of a few runs of decoding alone, so pose inference does not disturb the timing.
+    # sampled=False is the old path: cap.read() of every frame.
+    best = None
+    for _ in range(repeats):
+        cap = cv2.VideoCapture(path)
+        start = time.perf_counter()
+        if sampled:
+            for _ in FrameSampler(cap, analysis_fps).frames():
+                pass
+        else:
+            while cap.read()[0]:
+                pass
+        elapsed = time.perf_counter() - start
+        cap.release()
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def count_sampled(path, exercise_label, analysis_fps):
+    # Imported here: ExerciseAiTrainer itself imports this module
+    import ExerciseAiTrainer as exercise
+    import PoseModule2 as pm
+
+    cap = cv2.VideoCapture(path)
+    sampler = FrameSampler(cap, analysis_fps)
+    detector = pm.posture_detector()
+    count_function = exercise.COUNT_FUNCTIONS[exercise_label]
+    stage, counter = None, 0
+    for _, frame in sampler.frames():
+        detector.find_person(frame, draw=False)
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        if len(landmark_list) != 0:
+            stage, counter = count_function(detector, None, landmark_list, stage, counter, None)
+    cap.release()
+    return counter, sampler.stats()
+
+
+def main():
+    from benchmark import CLIPS
+
+    parser = argparse.ArgumentParser(description="Decode time and rep-count accuracy across analysis frame rates.")
+    parser.add_argument("--clips", nargs="*", default=[name for name, label in CLIPS.items() if label])
+    parser.add_argument("--rates", nargs="*", type=float, default=[0, 15, 10, 7.5, 5],
+                        help="analysis fps to compare (0 = every frame)")
+    args = parser.parse_args()
+
+    for name in args.clips:
+        full_read = decode_seconds(name, None, sampled=False)
+        print(f"\n{name} ({CLIPS[name]}): cap.read() of every frame {full_read * 1000:.0f} ms")
+        reference = None
+        for rate in args.rates:
+            reps, stats = count_sampled(name, CLIPS[name], rate or None)
+            if reference is None:
+                reference = reps
+            decode = decode_seconds(name, rate or None)
+            label = "every frame" if not rate else f"{rate:g} fps"
+            print(f"  {label:<12} {stats['analysed']:4d} analysed, decode {decode * 1000:5.0f} ms "
+                  f"({(full_read - decode) / full_read:4.0%} saved), "
+                  f"{reps} reps{'' if reps == reference else f' (every frame: {reference})'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import PoseModule2 as pm
+
+# Joints whose motion decides the keyframe interval (shoulders to ankles)
+TRACKED_JOINTS = [11, 12, 13, 14, 15, 16, 23, 24, 25, 26, 27, 28]
+THUMBNAIL_SIZE = (64, 36)
+
+
+class KeyframePostureDetector(pm.posture_detector):
+    """
+    posture_detector that runs pose inference only on keyframes and predicts the
+    landmarks in between with a constant-velocity (alpha-beta) filter.
+
+    The keyframe interval follows the landmark speed: slow movement allows up to
+    max_interval frames between inferences, as long as no tracked joint is expected
+    to move more than max_displacement (in image-size units). A sudden change in the
+    picture (frame-difference energy of a small grey thumbnail) forces a keyframe.
+    """
+
+    def __init__(self, detector=None, min_interval=1, max_interval=6, max_displacement=0.01,
+                 motion_threshold=6.0, beta=0.5):
+        self.detector = detector or pm.posture_detector()
+        self.mp_draw = pm.mp.solutions.drawing_utils
+        self.mp_pose = pm.mp.solutions.pose
+        self.landmarks = pm.PoseLandmarks()
+        self.landmark_list = self.landmarks
+
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_displacement = max_displacement
+        self.motion_threshold = motion_threshold
+        self.beta = beta
+
+        self.key_data = np.zeros_like(self.landmarks.data)
+        self.velocity = np.zeros_like(self.landmarks.data)
+        self.interval = min_interval
+        self.since_key = 0
+        self.has_key = False
+        self.thumbnail = None
+        self.motion = 0.0
+
+        self.frames = 0
+        self.keyframes = 0
+
+    def frame_buffer(self):
+        return self.detector.frame_buffer()
+
+    def set_quality(self, **quality):
+        self.detector.set_quality(**quality)
+
+    def frame_motion(self, img):
+        # Mean absolute difference to the previous frame, on a 64x36 grey thumbnail
+        small = cv2.resize(img, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        motion = 0.0 if self.thumbnail is None else float(cv2.absdiff(small, self.thumbnail).mean())
+        self.thumbnail = small
+        return motion
+
+    def find_person(self, img, draw=True):
+        self.frames += 1
+        self.since_key += 1
+        self.motion += self.frame_motion(img)
+
+        if not self.has_key or self.since_key >= self.interval or self.motion > self.motion_threshold:
+            self.keyframe(img)
+        else:
+            self.predict(img)
+        if draw:
+            self.draw_person(img)
+        return img
+
+    def keyframe(self, img):
+        self.detector.find_person(img, draw=False)
+        measured = self.detector.landmarks
+        landmarks = self.landmarks
+        landmarks.width, landmarks.height = measured.width, measured.height
+        landmarks.detected = measured.detected
+        self.keyframes += 1
+
+        if measured.detected:
+            if self.has_key:
+                # Correct the velocity by the part of the movement the prediction missed
+                elapsed = self.since_key
+                residual = measured.data - (self.key_data + self.velocity * elapsed)
+                self.velocity += self.beta * residual / elapsed
+                speed = np.abs(self.velocity[TRACKED_JOINTS, :2]).max()
+                frames = int(self.max_displacement / speed) if speed > 0 else self.max_interval
+                self.interval = min(max(frames, self.min_interval), self.max_interval)
+            else:
+                self.velocity[:] = 0
+                self.interval = self.min_interval
+            self.key_data[:] = measured.data
+            landmarks.data[:] = measured.data
+            self.has_key = True
+        else:
+            # Lost the person: infer every frame until they are found again
+            self.has_key = False
+        self.since_key = 0
+        self.motion = 0.0
+
+    def predict(self, img):
+        landmarks = self.landmarks
+        landmarks.height, landmarks.width = img.shape[:2]
+        landmarks.detected = True
+        np.multiply(self.velocity, self.since_key, out=landmarks.data)
+        landmarks.data += self.key_data
+        landmarks.data[:, 3] = self.key_data[:, 3]  # visibility is not extrapolated
+
+    def draw_person(self, img):
+        return pm.draw_landmark_array(img, self.landmarks, self.mp_pose.POSE_CONNECTIONS)
+
+    def inferred_fraction(self):
+        return self.keyframes / self.frames if self.frames else 0.0
+
+
+# --- Validation: rep counts, angles and classifier labels against inference on every frame ---
+def run_clip(path, exercise_label, detector, exer):
+    import ExerciseAiTrainer as exercise
+
+    count_function = exercise.COUNT_FUNCTIONS.get(exercise_label)
+    cap = cv2.VideoCapture(path)
+    stage, counter = None, 0
+    angles, features = [], []
+    pose_seconds = 0.0
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        start = time.perf_counter()
+        detector.find_person(frame, draw=False)
+        pose_seconds += time.perf_counter() - start
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        if len(landmark_list) == 0:
+            angles.append(None)
+            continue
+        features.append(exer.extract_features(landmark_list))
+        angles.append([detector.find_angle(None, 12, 14, 16), detector.find_angle(None, 24, 26, 28)])
+        if count_function is not None:
+            stage, counter = count_function(detector, None, landmark_list, stage, counter, None)
+    cap.release()
+    labels = exer.classify_windows(np.asarray(features)).argmax(axis=1) if len(features) >= 30 else np.array([])
+    return counter, angles, labels, pose_seconds
+
+
+def main():
+    import ExerciseAiTrainer as exercise
+    from benchmark import CLIPS
+
+    parser = argparse.ArgumentParser(description="Keyframe pose inference vs. inference on every frame.")
+    parser.add_argument("--clips", nargs="*", default=list(CLIPS))
+    parser.add_argument("--max-interval", type=int, default=6)
+    parser.add_argument("--max-displacement", type=float, default=0.01)
+    args = parser.parse_args()
+
+    exer = exercise.Exercise()
+    for name in args.clips:
+        label = CLIPS[name]
+        reps, angles, labels, seconds = run_clip(name, label, pm.posture_detector(), exer)
+        detector = KeyframePostureDetector(max_interval=args.max_interval, max_displacement=args.max_displacement)
+        key_reps, key_angles, key_labels, key_seconds = run_clip(name, label, detector, exer)
+
+        errors = [abs(np.subtract(a, b)) for a, b in zip(angles, key_angles) if a is not None and b is not None]
+        # find_angle returns 0-360, so a wrap-around counts as a small difference
+        errors = np.minimum(np.array(errors), 360 - np.array(errors)) if errors else np.zeros((1, 2))
+        same_labels = (labels == key_labels).mean() if len(labels) and len(labels) == len(key_labels) else float("nan")
+        print(f"{name} ({label or 'classifier only'}): inferred {detector.inferred_fraction():.0%} of "
+              f"{detector.frames} frames, pose {key_seconds:.2f}s vs {seconds:.2f}s, "
+              f"reps {key_reps} vs {reps}{'' if key_reps == reps else ' ❌'}, "
+              f"angle error mean {errors.mean():.1f}° max {errors.max():.1f}°, "
+              f"window labels agree {same_labels:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,787 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import secrets
+import sqlite3
+import struct
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import deque
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+import PoseModule2 as pm
+
+NUM_LANDMARKS = pm.NUM_LANDMARKS
+AUTO_DETECT = "auto"
+WINDOW_SIZE = 30
+BATCH_MAGIC = b"LMB1"
+# magic, first frame, frames, frames with a person, timestamp of the first frame
+BATCH_HEADER = struct.Struct("<4sIHHd")
+MAX_BATCH_FRAMES = 300
+MAX_BATCH_BYTES = BATCH_HEADER.size + MAX_BATCH_FRAMES * (4 + 1 + NUM_LANDMARKS * 4 * 2)
+
+
+class Backpressure(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Server busy, retry in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class TooManySessions(Exception):
+    pass
+
+
+class Unauthorized(Exception):
+    pass
+
+
+class Forbidden(Exception):
+    pass
+
+
+# --- Kiosk tokens: each kiosk is registered by a doctor and may only stream that doctor's patients ---
+def create_token_table(conn):
+    conn.execute("""CREATE TABLE IF NOT EXISTS kiosk_tokens (
+                    token_hash TEXT PRIMARY KEY,
+                    doctor_email TEXT,
+                    kiosk_name TEXT,
+                    created_at REAL
+                )""")
+    conn.commit()
+
+
+def hash_token(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def issue_kiosk_token(conn, doctor_email, kiosk_name):
+    # Only the hash is stored; the token itself is shown once and configured on the kiosk
+    create_token_table(conn)
+    token = secrets.token_urlsafe(32)
+    conn.execute("INSERT INTO kiosk_tokens (token_hash, doctor_email, kiosk_name, created_at) VALUES (?, ?, ?, ?)",
+                 (hash_token(token), doctor_email, kiosk_name, time.time()))
+    conn.commit()
+    return token
+
+
+# --- Wire format: a batch of consecutive frames of one session ---
+# After the header: float32 offsets of each frame's timestamp from the first, a bitmap of
+# the frames with a person, then float16 33x4 landmarks of those frames only.
+def encode_batch(first_frame, timestamps, detected, landmarks):
+    detected = np.asarray(detected, dtype=bool)
+    header = BATCH_HEADER.pack(BATCH_MAGIC, first_frame, len(timestamps), int(detected.sum()), timestamps[0])
+    offsets = (np.asarray(timestamps, dtype=np.float64) - timestamps[0]).astype("<f4")
+    return (header + offsets.tobytes() + np.packbits(detected).tobytes()
+            + np.asarray(landmarks)[detected].astype("<f2").tobytes())
+
+
+def decode_batch(payload):
+    if len(payload) < BATCH_HEADER.size:
+        raise ValueError("Truncated batch")
+    magic, first_frame, frames, people, first_timestamp = BATCH_HEADER.unpack_from(payload)
+    if magic != BATCH_MAGIC:
+        raise ValueError("Not a landmark batch")
+    bitmap_bytes = (frames + 7) // 8
+    expected = BATCH_HEADER.size + frames * 4 + bitmap_bytes + people * NUM_LANDMARKS * 4 * 2
+    if len(payload) != expected or not 0 < frames <= MAX_BATCH_FRAMES:
+        raise ValueError(f"Batch of {len(payload)} bytes, expected {expected}")
+    position = BATCH_HEADER.size
+    offsets = np.frombuffer(payload, "<f4", frames, position)
+    position += frames * 4
+    detected = np.unpackbits(np.frombuffer(payload, np.uint8, bitmap_bytes, position), count=frames).astype(bool)
+    position += bitmap_bytes
+    if detected.sum() != people:
+        raise ValueError("Person bitmap does not match the header")
+    landmarks = np.zeros((frames, NUM_LANDMARKS, 4), dtype=np.float32)
+    landmarks[detected] = np.frombuffer(payload, "<f2", people * NUM_LANDMARKS * 4, position).reshape(-1, NUM_LANDMARKS, 4)
+    return first_frame, first_timestamp + offsets.astype(np.float64), detected, landmarks
+
+
+# --- Server: counting, classification and persistence of landmark streams ---
+class StreamSession:
+    """
+    One kiosk's exercise session on the server. Frames are counted with the counter
+    for the session's exercise, or, for AUTO_DETECT, with the counter of the label the
+    classifier gave the last window of WINDOW_SIZE frames (as auto_classify_and_count,
+    through the session's ClassificationGate if it has one).
+    Rep times are the kiosk's frame timestamps.
+    """
+
+    def __init__(self, session_id, patient_email, exercise_label, width, height, exer=None, rep_sink=None,
+                 scorer=None, recorder=None, telemetry=None, classification_gate=None, token_hash=None):
+        import ExerciseAiTrainer as exercise
+        from rep_events import RepTracker
+
+        self.session_id = session_id
+        self.patient_email = patient_email
+        self.token_hash = token_hash  # the kiosk that opened the session
+        self.exercise_label = exercise_label
+        self.width, self.height = width, height
+        self.exer = exer
+        self.recorder = recorder
+        self.telemetry = telemetry
+        self.classification_gate = classification_gate
+        self.count_functions = exercise.COUNT_FUNCTIONS
+        self.landmark_features = exercise.landmark_features
+        # Only set_landmarks is used, so the pose graph is never built
+        self.detector = pm.posture_detector()
+        self.reps = RepTracker(None if exercise_label == AUTO_DETECT else exercise_label, patient_email,
+                               session_id=session_id, sink=rep_sink, origin=0.0, scorer=scorer)
+        self.prediction = None if exercise_label == AUTO_DETECT else exercise_label
+        self.window = []
+        self.stages = {}
+        self.counters = {}
+
+        self.next_frame = 0
+        self.frames = 0
+        self.missing = 0
+        self.bytes = 0
+        self.pending = deque()
+        self.scheduled = False
+        self.closing = False
+        self.finishing = False
+        self.closed = threading.Event()
+        self.last_seen = time.monotonic()
+        self.cpu_seconds = 0.0
+
+    def process(self, first_frame, timestamps, detected, landmarks, classify_lock):
+        start = time.thread_time()
+        if first_frame > self.next_frame:
+            self.missing += first_frame - self.next_frame  # batches the kiosk had to drop
+        skip = max(self.next_frame - first_frame, 0)  # frames already seen (a resent batch)
+        for i in range(skip, len(timestamps)):
+            data = landmarks[i] if detected[i] else None
+            landmark_list = self.detector.set_landmarks(data, self.width, self.height)
+            if data is not None:
+                self.observe(timestamps[i], landmark_list, classify_lock)
+            if self.recorder is not None:
+                label = self.prediction
+                self.recorder.record(timestamps[i], landmark_list, self.stages.get(label), self.counters.get(label, 0))
+            self.frames += 1
+        self.next_frame = max(self.next_frame, first_frame + len(timestamps))
+        if self.telemetry is not None:
+            self.telemetry.update(exercise=self.prediction, stage=self.stages.get(self.prediction),
+                                  counter=self.counters.get(self.prediction, 0))
+        self.cpu_seconds += time.thread_time() - start
+
+    def observe(self, timestamp, landmark_list, classify_lock):
+        if self.exercise_label == AUTO_DETECT and self.exer is not None:
+            self.window.append(self.landmark_features(landmark_list))
+            if len(self.window) == WINDOW_SIZE:
+                with classify_lock:
+                    if self.classification_gate is not None:
+                        prediction = self.classification_gate.classify(self.window, self.exer, WINDOW_SIZE)
+                    else:
+                        prediction = self.exer.classify_window(self.window, WINDOW_SIZE)
+                self.window = []
+                if prediction is not None and prediction != self.prediction:
+                    self.prediction = prediction
+                    self.reps.begin(prediction)
+        count_function = self.count_functions.get(self.prediction)
+        if count_function is None:
+            return
+        self.reps.frame_time = timestamp
+        self.stages[self.prediction], self.counters[self.prediction] = count_function(
+            self.detector, None, landmark_list, self.stages.get(self.prediction),
+            self.counters.get(self.prediction, 0), None, self.reps)
+
+    def state(self):
+        return {"session_id": self.session_id, "exercise": self.prediction, "frames": self.frames,
+                "next_frame": self.next_frame, "missing_frames": self.missing,
+                "counter": self.counters.get(self.prediction, 0), "stage": self.stages.get(self.prediction),
+                "counts": {label: count for label, count in self.counters.items() if count},
+                "closed": self.closed.is_set()}
+
+
+class LandmarkStreamServer:
+    """
+    Runs the cheap stages of the exercise engine (counting, classification, rep events
+    and the exercise history) over landmark streams that kiosks upload in batches.
+
+    Batches wait in a per-session queue of at most max_pending_batches; beyond that
+    submit() raises Backpressure and the HTTP endpoint answers 429 with Retry-After, so
+    a slow server slows its kiosks down instead of buffering without bound. Worker
+    threads take one batch of a session at a time, which keeps a session's frames in
+    order while sessions are processed side by side.
+
+    Kiosks authenticate with a token from issue_kiosk_token(). A session can only be
+    opened for a patient of the doctor who registered the kiosk, and only that kiosk
+    can send it frames or close it.
+    """
+
+    def __init__(self, db_path="elderly_fitness.db", workers=1, max_sessions=32, max_pending_batches=8,
+                 idle_timeout=120.0, exer=None, rep_writer=None, form_scorer=None, recordings_dir=None,
+                 telemetry_bus=None, gate_classification=False, log=print):
+        self.db_path = db_path
+        self.max_sessions = max_sessions
+        self.max_pending_batches = max_pending_batches
+        self.idle_timeout = idle_timeout
+        self.exer = exer
+        self.rep_writer = rep_writer
+        self.form_scorer = form_scorer
+        self.recordings_dir = recordings_dir
+        self.telemetry_bus = telemetry_bus
+        self.gate_classification = gate_classification
+        self.log = log
+
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.classify_lock = threading.Lock()
+        self.ready = deque()
+        self.wakeup = threading.Condition(self.lock)
+        self.stopping = False
+        self.rejected = 0
+        conn = sqlite3.connect(db_path, timeout=30)
+        create_token_table(conn)
+        conn.close()
+        self.threads = [threading.Thread(target=self.work, name=f"landmark-stream-{i}", daemon=True)
+                        for i in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def authorize(self, token, patient_email):
+        # The token's hash if it belongs to a kiosk of one of the patient's doctors
+        if not token:
+            raise Unauthorized("A kiosk token is required")
+        token_hash = hash_token(token)
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            kiosk = conn.execute("SELECT doctor_email FROM kiosk_tokens WHERE token_hash=?", (token_hash,)).fetchone()
+            if kiosk is None:
+                raise Unauthorized("Unknown kiosk token")
+            allowed = conn.execute(
+                "SELECT 1 FROM doctor_patients JOIN users ON users.email=doctor_patients.patient_email "
+                "WHERE doctor_patients.doctor_email=? AND doctor_patients.patient_email=? AND users.role='patient'",
+                (kiosk[0], patient_email)).fetchone()
+        finally:
+            conn.close()
+        if allowed is None:
+            raise Forbidden("This kiosk may not record sessions for that patient")
+        return token_hash
+
+    def check_session(self, session_id, token):
+        # Only the kiosk that opened a session may use it
+        session = self.get(session_id)
+        if not token or not secrets.compare_digest(session.token_hash, hash_token(token)):
+            raise Forbidden("This session belongs to another kiosk")
+        return session
+
+    def open_session(self, patient_email, exercise_label, width, height, metadata=None, token_hash=None):
+        self.expire()
+        with self.lock:
+            if len(self.sessions) >= self.max_sessions:
+                raise TooManySessions(f"{len(self.sessions)} sessions are already streaming")
+        session_id = uuid.uuid4().hex
+        recorder = None
+        if self.recordings_dir:
+            from session_recorder import SessionRecorder
+
+            user = re.sub(r"[^\w.@-]", "_", patient_email)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{session_id[:8]}.lmrec"
+            recorder = SessionRecorder(os.path.join(self.recordings_dir, user, name),
+                                       dict(metadata or {}, patient_email=patient_email, exercise=exercise_label,
+                                            width=width, height=height))
+        telemetry = None
+        if self.telemetry_bus is not None:
+            from telemetry_bus import TelemetryPublisher
+
+            telemetry = TelemetryPublisher(self.telemetry_bus, patient_email, session_id=session_id)
+        gate = None
+        if self.gate_classification and exercise_label == AUTO_DETECT:
+            from classification_gate import ClassificationGate
+
+            gate = ClassificationGate()
+        session = StreamSession(session_id, patient_email, exercise_label, width, height, self.exer,
+                                self.rep_writer.submit if self.rep_writer else None, self.form_scorer, recorder,
+                                telemetry, gate, token_hash)
+        with self.lock:
+            self.sessions[session_id] = session
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def submit(self, session_id, payload):
+        batch = decode_batch(payload)
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None or session.closing:
+                raise KeyError(session_id)
+            if len(session.pending) >= self.max_pending_batches:
+                self.rejected += 1
+                # About the time the queue ahead needs, from the session's own processing rate
+                per_batch = session.cpu_seconds / max(session.frames, 1) * len(batch[1])
+                raise Backpressure(min(max(per_batch * len(session.pending), 0.05), 5.0))
+            session.pending.append(batch)
+            session.bytes += len(payload)
+            session.last_seen = time.monotonic()
+            self.schedule(session)
+            return session.state()
+
+    def schedule(self, session):
+        # Called with the lock held
+        if not session.scheduled:
+            session.scheduled = True
+            self.ready.append(session)
+            self.wakeup.notify()
+
+    def close_session(self, session_id, timeout=30.0):
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                raise KeyError(session_id)
+            session.closing = True
+            self.schedule(session)
+        session.closed.wait(timeout)
+        return session.state()
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.ready and not self.stopping:
+                    self.wakeup.wait()
+                if self.stopping:
+                    return
+                session = self.ready.popleft()
+                batch = session.pending.popleft() if session.pending else None
+            if batch is not None:
+                try:
+                    session.process(*batch, self.classify_lock)
+                except Exception as e:
+                    self.log(f"❌ Landmark batch of session {session.session_id} failed: {e}")
+            with self.lock:
+                session.scheduled = False
+                if session.pending:
+                    self.schedule(session)  # to the back of the line: sessions take turns
+                    continue
+                # Claimed under the lock, so a second close cannot finish (and save) the session again
+                finishing = session.closing and not session.finishing
+                session.finishing = session.finishing or finishing
+            if finishing:
+                self.finish(session)
+
+    def finish(self, session):
+        import ExerciseAiTrainer as exercise
+
+        # Saved under the names the webcam page uses, so the history has one column per exercise
+        counts = {exercise.EXERCISE_NAMES.get(label, label): count
+                  for label, count in session.counters.items() if count}
+        try:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            with conn:
+                for ex_name, count in counts.items():
+                    conn.execute("INSERT INTO exercises (id, patient_email, ex_name, ex_date, count) "
+                                 "VALUES (?, ?, ?, ?, ?)",
+                                 (uuid.uuid4().hex, session.patient_email, ex_name, date.today().isoformat(), count))
+            conn.close()
+        except sqlite3.Error as e:
+            self.log(f"❌ Could not save session {session.session_id}: {e}")
+        if session.recorder is not None:
+            session.recorder.close()
+        if session.telemetry is not None:
+            session.telemetry.close()
+        with self.lock:
+            self.sessions.pop(session.session_id, None)
+        session.closed.set()
+
+    def expire(self):
+        # Sessions whose kiosk went away without closing them are finished as they are
+        now = time.monotonic()
+        with self.lock:
+            stale = [s.session_id for s in self.sessions.values()
+                     if not s.closing and now - s.last_seen > self.idle_timeout]
+        for session_id in stale:
+            self.log(f"⚠️ Closing idle landmark stream {session_id}")
+            self.close_session(session_id, timeout=0)
+
+    def stop(self):
+        with self.lock:
+            self.stopping = True
+            self.wakeup.notify_all()
+        for thread in self.threads:
+            thread.join()
+
+
+def make_handler(server):
+    class LandmarkStreamHandler(BaseHTTPRequestHandler):
+        # POST /sessions (JSON) -> session id; POST /sessions/<id>/frames (a batch);
+        # POST /sessions/<id>/close; GET /sessions/<id>. Every request carries the
+        # kiosk's token as "Authorization: Bearer <token>"
+        protocol_version = "HTTP/1.1"
+
+        def token(self):
+            scheme, _, token = (self.headers.get("Authorization") or "").partition(" ")
+            return token.strip() if scheme.lower() == "bearer" else None
+
+        def log_message(self, format, *args):
+            pass
+
+        def reply(self, status, body, headers=None):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def body(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if length > MAX_BATCH_BYTES:
+                raise ValueError(f"Request of {length} bytes is too large")
+            return self.rfile.read(length)
+
+        def do_GET(self):
+            match = re.fullmatch(r"/sessions/(\w+)", self.path)
+            try:
+                if not match:
+                    return self.reply(404, {"error": "Not found"})
+                self.reply(200, server.check_session(match.group(1), self.token()).state())
+            except KeyError:
+                self.reply(404, {"error": "Unknown session"})
+            except Forbidden as e:
+                self.reply(403, {"error": str(e)})
+
+        def do_POST(self):
+            try:
+                payload = self.body()
+                if self.path == "/sessions":
+                    request = json.loads(payload)
+                    token_hash = server.authorize(self.token(), request["patient_email"])
+                    session = server.open_session(request["patient_email"], request.get("exercise", AUTO_DETECT),
+                                                  int(request["width"]), int(request["height"]), request, token_hash)
+                    return self.reply(201, {"session_id": session.session_id})
+                match = re.fullmatch(r"/sessions/(\w+)/(frames|close)", self.path)
+                if not match:
+                    return self.reply(404, {"error": "Not found"})
+                server.check_session(match.group(1), self.token())
+                if match.group(2) == "frames":
+                    return self.reply(202, server.submit(match.group(1), payload))
+                self.reply(200, server.close_session(match.group(1)))
+            except Backpressure as e:
+                self.reply(429, {"error": str(e)}, {"Retry-After": f"{e.retry_after:.2f}"})
+            except TooManySessions as e:
+                self.reply(503, {"error": str(e)}, {"Retry-After": "10"})
+            except Unauthorized as e:
+                self.reply(401, {"error": str(e)}, {"WWW-Authenticate": "Bearer"})
+            except Forbidden as e:
+                self.reply(403, {"error": str(e)})
+            except KeyError:
+                self.reply(404, {"error": "Unknown session"})
+            except (ValueError, json.JSONDecodeError) as e:
+                self.reply(400, {"error": str(e)})
+
+    return LandmarkStreamHandler
+
+
+def serve(server, host="127.0.0.1", port=8765):
+    httpd = ThreadingHTTPServer((host, port), make_handler(server))
+    httpd.daemon_threads = True
+    thread = threading.Thread(target=httpd.serve_forever, name="landmark-stream-http", daemon=True)
+    thread.start()
+    return httpd
+
+
+# --- Kiosk side: pose runs here, only landmarks go over the network ---
+class EdgeClient:
+    """
+    Sends a kiosk's landmark stream to a LandmarkStreamServer in batches of
+    batch_frames. add() only copies into the current batch; a sender thread posts full
+    batches. When the server answers 429 the sender waits Retry-After and resends,
+    while new batches queue behind it up to max_pending_batches; past that the oldest
+    are dropped and counted (the server sees the gap and counts on).
+    """
+
+    def __init__(self, server_url, patient_email, exercise_label=AUTO_DETECT, width=640, height=480, fps=30.0,
+                 batch_frames=10, max_pending_batches=60, timeout=10.0, token=None, log=print):
+        self.server_url = server_url.rstrip("/")
+        self.token = token
+        self.batch_frames = batch_frames
+        self.max_pending_batches = max_pending_batches
+        self.timeout = timeout
+        self.log = log
+        self.frames = 0
+        self.dropped = 0
+        self.bytes_sent = 0
+        self.requests = 0
+        self.throttled = 0
+        self.state = {}
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.closing = False
+
+        response = self.post("/sessions", json.dumps({"patient_email": patient_email, "exercise": exercise_label,
+                                                      "width": width, "height": height, "fps": fps}).encode())
+        self.session_id = response["session_id"]
+        self.new_batch()
+        self.sender = threading.Thread(target=self.send_batches, name="edge-client", daemon=True)
+        self.sender.start()
+
+    def post(self, path, data):
+        headers = {"Authorization": f"Bearer {self.token}"} if self.token else {}
+        request = urllib.request.Request(self.server_url + path, data=data, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())
+
+    def new_batch(self):
+        n = self.batch_frames
+        self.first_frame = self.frames
+        self.fill = 0
+        self.timestamps = np.zeros(n, dtype=np.float64)
+        self.detected = np.zeros(n, dtype=bool)
+        self.landmarks = np.zeros((n, NUM_LANDMARKS, 4), dtype=np.float32)
+
+    def add(self, timestamp, landmark_list):
+        i = self.fill
+        self.timestamps[i] = timestamp
+        self.detected[i] = landmark_list is not None and len(landmark_list) != 0
+        if self.detected[i]:
+            self.landmarks[i] = landmark_list.data
+        self.fill += 1
+        self.frames += 1
+        if self.fill == self.batch_frames:
+            self.hand_off()
+
+    def hand_off(self):
+        n = self.fill
+        payload = encode_batch(self.first_frame, self.timestamps[:n], self.detected[:n], self.landmarks[:n])
+        with self.condition:
+            if len(self.pending) >= self.max_pending_batches:
+                if not self.dropped:
+                    self.log("❌ The server is not keeping up; dropping landmark batches")
+                self.dropped += self.pending.popleft()[0]
+            self.pending.append((n, payload))
+            self.condition.notify()
+        self.new_batch()
+
+    def send_batches(self):
+        path = f"/sessions/{self.session_id}/frames"
+        while True:
+            with self.condition:
+                while not self.pending and not self.closing:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                _, payload = self.pending[0]
+            try:
+                self.state = self.post(path, payload)
+                self.requests += 1
+                self.bytes_sent += len(payload)
+            except urllib.error.HTTPError as e:
+                if e.code != 429:
+                    self.log(f"❌ Landmark upload failed: {e.code} {e.read()[:200]}")
+                    with self.condition:
+                        self.pending.popleft()
+                    continue
+                self.throttled += 1
+                time.sleep(float(e.headers.get("Retry-After") or 0.5))
+                continue
+            except OSError as e:
+                self.log(f"⚠️ Landmark upload failed ({e}); retrying")
+                time.sleep(1.0)
+                continue
+            with self.condition:
+                self.pending.popleft()
+
+    def close(self):
+        if self.fill:
+            self.hand_off()
+        with self.condition:
+            self.closing = True
+            self.condition.notify()
+        self.sender.join()
+        self.state = self.post(f"/sessions/{self.session_id}/close", b"")
+        return self.state
+
+    def stats(self):
+        return {"frames": self.frames, "dropped": self.dropped, "bytes_sent": self.bytes_sent,
+                "requests": self.requests, "throttled": self.throttled}
+
+
+def stream_capture(cap, client, detector=None, keep=None):
+    # Runs pose on every frame of cap and streams the landmarks; file sources are
+    # timed by their frame numbers, cameras by the clock
+    detector = detector or pm.posture_detector()
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    start = time.time()
+    is_file = cap.get(cv2.CAP_PROP_FRAME_COUNT) > 0
+    frame_number = 0
+    while True:
+        ret, frame = cap.read(detector.frame_buffer())
+        if not ret:
+            break
+        detector.find_person(frame, draw=False)
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        timestamp = start + frame_number / fps if is_file else time.time()
+        client.add(timestamp, landmark_list)
+        if keep is not None:
+            keep.append((timestamp, landmark_list.data.copy() if landmark_list.detected else None))
+        frame_number += 1
+    cap.release()
+    return client.close()
+
+
+def stream_landmarks(frames, client):
+    # Replays (timestamp, landmarks or None) frames as fast as the client accepts them
+    detector = pm.posture_detector()
+    for timestamp, data in frames:
+        client.add(timestamp, detector.set_landmarks(data, 640, 480) if data is not None else None)
+    return client.close()
+
+
+def encoded_batches(frames, batch_frames=10):
+    for first in range(0, len(frames), batch_frames):
+        batch = frames[first:first + batch_frames]
+        landmarks = np.zeros((len(batch), NUM_LANDMARKS, 4), dtype=np.float32)
+        for i, (_, data) in enumerate(batch):
+            if data is not None:
+                landmarks[i] = data
+        yield encode_batch(first, [t for t, _ in batch], [data is not None for _, data in batch], landmarks)
+
+
+def main():
+    import os
+    import tempfile
+
+    import ExerciseAiTrainer as exercise
+    from benchmark import CLIPS
+    from rep_events import RepEventWriter, session_summary
+    from telemetry_bus import make_bus
+
+    parser = argparse.ArgumentParser(description="Landmark streaming server, and a simulated kiosk over the demo clips.")
+    parser.add_argument("--serve", action="store_true", help="only run the server")
+    parser.add_argument("--issue-token", nargs=2, metavar=("DOCTOR_EMAIL", "KIOSK_NAME"),
+                        help="register a kiosk for a doctor's patients and print its token")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--db", default=None, help="app database (default for the simulation: a temporary one)")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--max-pending", type=int, default=8, help="batches queued per session before 429")
+    parser.add_argument("--recordings", default=None, help="also keep each stream as a session recording here")
+    parser.add_argument("--telemetry", default=None, help="publish live session state to this bus, e.g. redis://...")
+    parser.add_argument("--gate-classification", action="store_true",
+                        help="skip the classifier on auto-detect windows while the movement is unchanged")
+    parser.add_argument("--clips", nargs="*", default=list(CLIPS))
+    args = parser.parse_args()
+
+    db_path = args.db or ("elderly_fitness.db" if args.serve or args.issue_token
+                          else os.path.join(tempfile.mkdtemp(prefix="landmark-stream-"), "app.db"))
+    conn = sqlite3.connect(db_path)
+    if args.issue_token:
+        print(issue_kiosk_token(conn, *args.issue_token))
+        return
+    conn.execute("""CREATE TABLE IF NOT EXISTS exercises (
+                    id TEXT PRIMARY KEY, patient_email TEXT, ex_name TEXT, ex_date TEXT, count INTEGER)""")
+    token = None
+    if not args.serve:
+        # The simulated kiosk belongs to a demo doctor whose patients it streams
+        conn.execute("CREATE TABLE IF NOT EXISTS users (email TEXT PRIMARY KEY, name TEXT, password TEXT, role TEXT)")
+        conn.execute("""CREATE TABLE IF NOT EXISTS doctor_patients (
+                        doctor_email TEXT, patient_email TEXT, patient_name TEXT,
+                        PRIMARY KEY (doctor_email, patient_email))""")
+        for patient in ("kiosk@example.com", "flood@example.com"):
+            conn.execute("INSERT OR IGNORE INTO users VALUES (?, ?, '', 'patient')", (patient, patient))
+            conn.execute("INSERT OR IGNORE INTO doctor_patients VALUES ('doctor@example.com', ?, ?)", (patient, patient))
+        token = issue_kiosk_token(conn, "doctor@example.com", "simulated kiosk")
+    conn.commit()
+    rep_writer = RepEventWriter(db_path)
+    server = LandmarkStreamServer(db_path, workers=args.workers, max_pending_batches=args.max_pending,
+                                  exer=exercise.Exercise(), rep_writer=rep_writer, recordings_dir=args.recordings,
+                                  telemetry_bus=make_bus(args.telemetry) if args.telemetry else None,
+                                  gate_classification=args.gate_classification)
+    httpd = serve(server, args.host, 0 if not args.serve else args.port)
+    url = f"http://{args.host}:{httpd.server_address[1]}"
+    if args.serve:
+        print(f"✅ Landmark stream server on {url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+        httpd.shutdown()
+        server.stop()
+        rep_writer.close()
+        return
+
+    failures = 0
+    # Kiosks without a token, or streaming someone who is not their doctor's patient, are turned away
+    for patient, kiosk_token, expected in (("kiosk@example.com", None, 401),
+                                           ("stranger@example.com", token, 403)):
+        try:
+            EdgeClient(url, patient, token=kiosk_token).close()
+            code = 201
+        except urllib.error.HTTPError as e:
+            code = e.code
+        failures += code != expected
+        print(f"{'✅' if code == expected else '❌'} {patient} with {'a' if kiosk_token else 'no'} token: "
+              f"{code}, expected {expected}")
+
+    expected_history = {}
+    for name in args.clips:
+        label = CLIPS[name] or AUTO_DETECT
+        cap = cv2.VideoCapture(name)
+        width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        frames = []
+        client = EdgeClient(url, "kiosk@example.com", label, width, height, fps, token=token)
+        result = stream_capture(cap, client, keep=frames)
+        stats = client.stats()
+
+        # The same stream once more, as fast as possible, to push the server into backpressure
+        flood = EdgeClient(url, "flood@example.com", label, width, height, fps, token=token)
+        start = time.perf_counter()
+        flooded = stream_landmarks(frames, flood)
+        flood_seconds = time.perf_counter() - start
+        flood_stats = flood.stats()
+
+        # Reference: the same engine in-process, and its CPU cost per frame
+        local = StreamSession("local", "local", label, width, height, server.exer)
+        for payload in encoded_batches(frames):
+            local.process(*decode_batch(payload), threading.Lock())
+
+        seconds = len(frames) / fps
+        kbps = stats["bytes_sent"] * 8 / seconds / 1000
+        video_kbps = os.path.getsize(name) * 8 / seconds / 1000
+        matched = result["counts"] == flooded["counts"] == local.state()["counts"]
+        failures += not matched
+        status = "✅" if matched else "❌"
+        for ex_label, count in result["counts"].items():
+            ex_name = exercise.EXERCISE_NAMES.get(ex_label, ex_label)
+            expected_history[ex_name] = expected_history.get(ex_name, 0) + count
+        print(f"{status} {name} ({label}): counts streamed {result['counts']}, flooded {flooded['counts']}, "
+              f"in-process {local.state()['counts']}")
+        print(f"   {stats['frames']} frames in {stats['requests']} requests, {stats['bytes_sent'] / 1024:.0f} KB "
+              f"= {kbps:.0f} kbit/s at {fps:.0f} fps (the video file: {video_kbps:.0f} kbit/s)")
+        print(f"   flood: {flood_stats['frames']} frames in {flood_seconds:.2f}s, {flood_stats['throttled']} answered 429, "
+              f"{flood_stats['dropped']} frames dropped, server CPU {local.cpu_seconds / len(frames) * 1000:.3f} ms per frame")
+
+    httpd.shutdown()
+    server.stop()
+    rep_writer.close()
+    conn = sqlite3.connect(db_path)
+    # Each closed session is saved exactly once, under the history's exercise names
+    history = dict(conn.execute("SELECT ex_name, SUM(count) FROM exercises WHERE patient_email=? GROUP BY ex_name",
+                                ("kiosk@example.com",)).fetchall())
+    failures += history != expected_history
+    print(f"{'✅' if history == expected_history else '❌'} history saved {history}, expected {expected_history}")
+    for row in session_summary(conn, "kiosk@example.com", 0, time.time() + 86400):
+        print(f"Rep events: {row}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
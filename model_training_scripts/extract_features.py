@@ -0,0 +1,10 @@
+import os
+import sys
+
+# The pipeline lives next to ExerciseAiTrainer so the features come from the same code
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extract_features import main
+
+if __name__ == "__main__":
+    raise SystemExit(main())
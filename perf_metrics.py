@@ -0,0 +1,123 @@
+import json
+import time
+from collections import deque
+
+import cv2
+import numpy as np
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    # One reusable span per stage, so timing a stage does not allocate anything.
+    # Time spent in the stage is summed until the frame ends.
+    __slots__ = ("samples", "start", "total", "used")
+
+    def __init__(self, samples):
+        self.samples = samples
+        self.start = 0.0
+        self.total = 0.0
+        self.used = False
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total += time.perf_counter() - self.start
+        self.used = True
+        return False
+
+    def flush(self):
+        if self.used:
+            self.samples.append(self.total)
+            self.total = 0.0
+            self.used = False
+
+
+class FrameMetrics:
+    """
+    Per-session stage timings on the monotonic clock, kept in rolling windows of
+    per-frame totals (a stage entered twice in one frame is recorded once).
+    A session's loop is the only writer, so no locks are taken; when disabled,
+    span() returns a shared no-op context manager.
+    """
+
+    def __init__(self, enabled=True, window=300, overlay=False):
+        self.enabled = enabled
+        self.window = window
+        self.overlay = overlay
+        self.samples = {}
+        self.spans = {}
+        self.frame_ends = deque(maxlen=window)
+        self.frames = 0
+
+    def span(self, stage):
+        if not self.enabled:
+            return NULL_SPAN
+        span = self.spans.get(stage)
+        if span is None:
+            self.samples[stage] = deque(maxlen=self.window)
+            span = self.spans[stage] = _Span(self.samples[stage])
+        return span
+
+    def tick(self):
+        # Marks the end of a frame; the FPS comes from the spacing of these marks
+        if self.enabled:
+            for span in self.spans.values():
+                span.flush()
+            self.frame_ends.append(time.perf_counter())
+            self.frames += 1
+
+    def fps(self):
+        ends = list(self.frame_ends)
+        if len(ends) < 2 or ends[-1] == ends[0]:
+            return 0.0
+        return (len(ends) - 1) / (ends[-1] - ends[0])
+
+    def stage_summary(self, stage):
+        samples = self.samples.get(stage)
+        if not samples:
+            return None
+        ms = np.fromiter(samples, dtype=np.float64) * 1000.0
+        p50, p90, p99 = np.percentile(ms, [50, 90, 99])
+        return {
+            "count": int(ms.size),
+            "mean_ms": float(ms.mean()),
+            "p50_ms": float(p50),
+            "p90_ms": float(p90),
+            "p99_ms": float(p99),
+            "max_ms": float(ms.max()),
+        }
+
+    def summary(self):
+        return {
+            "frames": self.frames,
+            "fps": self.fps(),
+            "stages": {stage: self.stage_summary(stage) for stage in self.samples},
+        }
+
+    def dump(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def draw_overlay(self, img):
+        if not (self.enabled and self.overlay):
+            return
+        lines = [f"FPS {self.fps():.1f}"]
+        for stage, stats in self.summary()["stages"].items():
+            if stats:
+                lines.append(f"{stage} {stats['p50_ms']:.1f}/{stats['p99_ms']:.1f} ms")
+        x = img.shape[1] - 210
+        cv2.rectangle(img, (x - 10, 0), (img.shape[1], 22 * len(lines) + 10), (0, 0, 0), -1)
+        for i, line in enumerate(lines):
+            cv2.putText(img, line, (x, 22 * (i + 1)), cv2.FONT_HERSHEY_SIMPLEX, 0.5,
+                        (0, 255, 0), 1, cv2.LINE_AA)
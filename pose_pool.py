@@ -0,0 +1,434 @@
+import contextlib
+import multiprocessing as mp_proc
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+import PoseModule2 as pm
+from frame_ring import DONE, EMPTY, FrameRing
+
+# Up to three frames in flight: one being inferred while the next ones are decoded
+RING_SLOTS = 4
+# How often an idle worker looks for control messages between frames
+CONTROL_POLL_SECONDS = 0.05
+# How long the parent waits for a result before checking that the worker is still alive
+RESULT_POLL_SECONDS = 1.0
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def pose_worker_main(conn, condition, detector_kwargs):
+    # Runs in the worker process: the pose graph is built once and reused across leases.
+    # Frames arrive in a shared-memory ring and results go back into it; the pipe only
+    # carries control messages, read between frames.
+    detector = pm.posture_detector(**detector_kwargs)
+    detector.pose  # build the graph now rather than on the first frame
+    ring = None
+    conn.send(("ready", None))
+    while True:
+        if ring is not None and not conn.poll():
+            item = ring.take(timeout=CONTROL_POLL_SECONDS)
+            if item is None:
+                continue
+            slot, _, frame = item
+            start = time.perf_counter()
+            try:
+                detector.find_person(frame, draw=False)
+            except Exception as e:
+                # Keep the worker alive; the session sees the error and the lease is recycled
+                ring.complete(slot, failed=True)
+                conn.send(("failed", str(e)))
+            else:
+                landmarks = detector.landmarks
+                ring.complete(slot, landmarks.data if landmarks.detected else None, time.perf_counter() - start)
+            del item, frame  # no view may outlive the ring
+            continue
+
+        message, payload = conn.recv()
+        if message == "ring":
+            if ring is not None:
+                ring.close()
+            ring = FrameRing.attach(payload, condition)
+            conn.send(("ready", None))
+        elif message == "quality":
+            try:
+                detector.set_quality(**payload)
+            except Exception as e:
+                conn.send(("error", str(e)))
+            else:
+                conn.send(("ready", None))
+        elif message == "reset":
+            # A new session must not inherit the previous person's tracking state
+            detector = pm.posture_detector(**detector_kwargs)
+            detector.pose
+            conn.send(("ready", None))
+        elif message == "stop":
+            break
+    if ring is not None:
+        ring.close()
+    conn.close()
+
+
+class PoseWorker:
+    def __init__(self, context, detector_kwargs):
+        self.conn, child_conn = context.Pipe()
+        # Shared with every ring of this worker; it can only be handed over at start
+        self.condition = context.Condition()
+        self.process = context.Process(target=pose_worker_main, args=(child_conn, self.condition, detector_kwargs),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.frames = 0
+        self.lease_start_frames = 0
+        self.ring = None
+        self.failed = False
+        self.failures = deque()
+        self.pose_seconds = 0.0
+        self.wait_ready()
+
+    def receive(self):
+        # Next reply to a control message; inference failures reported meanwhile are kept
+        # for the frames they belong to
+        message, payload = self.conn.recv()
+        while message == "failed":
+            self.failures.append(payload)
+            message, payload = self.conn.recv()
+        return message, payload
+
+    def wait_ready(self):
+        message, error = self.receive()
+        if message != "ready":
+            raise RuntimeError(f"Pose worker failed to start: {error}")
+
+    def frame_buffer(self):
+        # Slot the next process_frame will use, to decode into once the frame size is known
+        if self.ring is None:
+            return None
+        slot = self.ring.oldest(EMPTY)
+        return None if slot is None else self.ring.frames[slot]
+
+    def process_frame(self, frame):
+        # One frame at a time: landmarks (a copy) or None
+        if self.ring is None or self.ring.shape != frame.shape:
+            self.attach_ring(frame.shape, overwrite=False)
+        slot = self.ring.reserve()
+        view = self.ring.frames[slot]
+        if not np.shares_memory(frame, view):
+            np.copyto(view, frame)  # frame was not decoded into the slot
+        del view
+        self.ring.commit(slot)
+        self.frames += 1
+        return self.result()["landmarks"]
+
+    def stream(self, read, live=True, metrics=None):
+        """
+        Yields (frame, landmarks or None) for every frame read(buffer) returns, in order,
+        while the worker already infers the next ones. read decodes into buffer when it
+        can. Live sources overwrite the oldest frame the worker has not started on when it
+        falls behind; files wait for a free slot instead. Frames and landmarks are copies,
+        so nothing the caller keeps points into the ring.
+        """
+        span = (lambda: metrics.span("pose")) if metrics is not None else contextlib.nullcontext
+        try:
+            while True:
+                slot = buffer = None
+                if self.ring is not None and self.ring.overwrite == live:
+                    if not live and self.ring.busy() >= self.ring.slots - 1:
+                        yield self.frame_result(span)
+                    slot = self.ring.reserve()
+                    buffer = self.ring.frames[slot]
+                ret, frame = read(buffer)
+                if not ret:
+                    if slot is not None:
+                        self.ring.cancel(slot)
+                    break
+                if slot is None or frame.shape != self.ring.shape:
+                    # First frame, or a new size or mode: finish the old ring before replacing it
+                    if slot is not None:
+                        self.ring.cancel(slot)
+                    buffer = None
+                    while self.ring is not None and self.ring.busy():
+                        yield self.frame_result(span)
+                    self.attach_ring(frame.shape, overwrite=live)
+                    slot = self.ring.reserve()
+                    np.copyto(self.ring.frames[slot], frame)
+                elif not np.shares_memory(frame, buffer):
+                    np.copyto(buffer, frame)
+                frame = buffer = None
+                self.ring.commit(slot)
+                self.frames += 1
+                if live:
+                    # Hand over whatever is finished; the camera paces the loop
+                    while self.ring.oldest(DONE) is not None:
+                        yield self.frame_result(span)
+            while self.ring is not None and self.ring.busy():
+                yield self.frame_result(span)
+        finally:
+            self.settle()
+
+    def frame_result(self, span):
+        with span():
+            result = self.result(frame=True)
+        return result["frame"], result["landmarks"]
+
+    def result(self, frame=False):
+        while True:
+            result = self.ring.collect(timeout=RESULT_POLL_SECONDS, frame=frame)
+            if result is not None:
+                break
+            if not self.process.is_alive():
+                self.failed = True
+                raise RuntimeError("Pose worker exited while inferring a frame")
+        if result["failed"]:
+            self.failed = True
+            error = self.failures.popleft() if self.failures else self.receive_failure()
+            raise RuntimeError(f"Pose worker failed on a frame: {error}")
+        self.pose_seconds = result["seconds"]
+        return result
+
+    def receive_failure(self):
+        # The worker sends the error right after marking the frame failed
+        message, payload = self.conn.recv()
+        return payload
+
+    def settle(self):
+        # Frames still in flight when a stream ends early are dropped; the ring is left empty
+        if self.ring is not None and not self.ring.clear(timeout=5):
+            self.failed = True
+
+    def attach_ring(self, shape, overwrite):
+        if self.ring is not None:
+            self.ring.close()
+        self.ring = FrameRing(shape, slots=RING_SLOTS, overwrite=overwrite, condition=self.condition)
+        self.conn.send(("ring", self.ring.spec()))
+        self.wait_ready()
+
+    def set_quality(self, quality):
+        self.conn.send(("quality", quality))
+        message, error = self.receive()
+        if message != "ready":
+            raise RuntimeError(error)
+
+    def reset(self):
+        # Also restores the pool's default quality settings
+        self.conn.send(("reset", None))
+        self.wait_ready()
+
+    def stop(self):
+        try:
+            self.conn.send(("stop", None))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        if self.ring is not None:
+            self.ring.close()
+            self.ring = None
+
+
+class PooledPostureDetector(pm.posture_detector):
+    """posture_detector whose pose inference runs in a leased pool worker."""
+
+    def __init__(self, worker):
+        # No local pose graph: only the landmark array and drawing helpers
+        self.worker = worker
+        self.mp_draw = pm.mp.solutions.drawing_utils
+        self.mp_pose = pm.mp.solutions.pose
+        self.landmarks = pm.PoseLandmarks()
+        self.landmark_list = self.landmarks
+
+    def frame_buffer(self):
+        return self.worker.frame_buffer()
+
+    @property
+    def pose_seconds(self):
+        # Inference time of the last frame, measured in the worker
+        return self.worker.pose_seconds
+
+    def find_person(self, img, draw=True):
+        self.set_result(img, self.worker.process_frame(img))
+        if draw:
+            self.draw_person(img)
+        return img
+
+    def stream(self, read, live=True, metrics=None):
+        # As PoseWorker.stream, yielding (frame, landmark list) with capture and inference overlapping
+        for frame, data in self.worker.stream(read, live, metrics):
+            yield frame, self.set_result(frame, data)
+
+    def set_result(self, img, data):
+        landmarks = self.landmarks
+        landmarks.height, landmarks.width = img.shape[:2]
+        landmarks.detected = data is not None
+        if landmarks.detected:
+            landmarks.data[:] = data
+        return landmarks
+
+    def set_quality(self, **quality):
+        self.worker.set_quality(quality)
+
+    def draw_person(self, img):
+        return pm.draw_landmark_array(img, self.landmarks, self.mp_pose.POSE_CONNECTIONS)
+
+
+class PoseLease:
+    def __init__(self, pool, worker):
+        self.pool = pool
+        self.worker = worker
+
+    def detector(self):
+        # Every detector created during the lease talks to the same worker, which keeps
+        # tracking-mode affinity for the whole session
+        return PooledPostureDetector(self.worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.pool.release(self.worker)
+        return False
+
+
+class PosePool:
+    """
+    Long-lived pose worker processes with pre-initialized graphs, shared by all
+    sessions. A session leases one worker for its duration; when every worker is
+    leased, up to max_waiting sessions queue and the rest are turned away.
+    Workers are replaced after recycle_after frames to contain leaks, and when they
+    crash.
+    """
+
+    def __init__(self, size=2, max_waiting=8, recycle_after=20000, detector_kwargs=None):
+        # spawn keeps TensorFlow and Streamlit state of the parent out of the workers
+        self.context = mp_proc.get_context("spawn")
+        self.size = size
+        self.max_waiting = max_waiting
+        self.recycle_after = recycle_after
+        self.detector_kwargs = detector_kwargs or {}
+
+        self.condition = threading.Condition()
+        self.idle = deque(PoseWorker(self.context, self.detector_kwargs) for _ in range(size))
+        self.leased = 0
+        self.missing = 0
+        self.waiting = 0
+        self.leases = 0
+        self.rejected = 0
+        self.recycled = 0
+        self.frames_done = 0
+        self.wait_times = deque(maxlen=500)
+        self.busy_since = None
+        self.busy_seconds = 0.0
+        self.created = time.monotonic()
+
+    def lease(self, timeout=30):
+        if self.missing:
+            self.replace_missing()
+        start = time.monotonic()
+        with self.condition:
+            if not self.idle and self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise PoolSaturated("All pose workers are busy and the queue is full.")
+            self.waiting += 1
+            try:
+                deadline = start + timeout
+                while not self.idle:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self.condition.wait(remaining):
+                        if not self.idle:
+                            self.rejected += 1
+                            raise PoolSaturated(f"No pose worker became free within {timeout}s.")
+            finally:
+                self.waiting -= 1
+            worker = self.idle.popleft()
+            worker.lease_start_frames = worker.frames
+            self.update_busy_time()
+            self.leased += 1
+            self.leases += 1
+            self.wait_times.append(time.monotonic() - start)
+        return PoseLease(self, worker)
+
+    def release(self, worker):
+        # The lease always ends, even when the worker is broken: a worker that cannot be
+        # reset or replaced is dropped, and replace_missing() starts it again later
+        frames = worker.frames - worker.lease_start_frames
+        replacement, recycled = None, False
+        try:
+            # A worker whose inference raised is replaced rather than trusted again
+            if worker.frames < self.recycle_after and worker.process.is_alive() and not worker.failed:
+                try:
+                    worker.reset()
+                    replacement = worker
+                except (EOFError, OSError, RuntimeError) as e:
+                    print(f"❌ Pose worker could not be reset, replacing it: {e}")
+            if replacement is None:
+                recycled = True
+                worker.stop()
+                replacement = PoseWorker(self.context, self.detector_kwargs)
+        except Exception as e:
+            print(f"❌ Could not start a replacement pose worker: {e}")
+        finally:
+            with self.condition:
+                self.recycled += recycled
+                self.frames_done += frames
+                self.update_busy_time()
+                self.leased -= 1
+                if replacement is not None:
+                    self.idle.append(replacement)
+                else:
+                    self.missing += 1
+                self.condition.notify()
+
+    def replace_missing(self):
+        # Starts workers that were dropped on release; they stay missing while starting fails
+        with self.condition:
+            missing, self.missing = self.missing, 0
+        for _ in range(missing):
+            try:
+                worker = PoseWorker(self.context, self.detector_kwargs)
+            except Exception as e:
+                print(f"❌ Could not start a pose worker: {e}")
+                with self.condition:
+                    self.missing += 1
+                continue
+            with self.condition:
+                self.idle.append(worker)
+                self.condition.notify()
+
+    def update_busy_time(self):
+        # Called with the condition held, before the leased count changes
+        now = time.monotonic()
+        if self.busy_since is not None:
+            self.busy_seconds += self.leased * (now - self.busy_since)
+        self.busy_since = now
+
+    def metrics(self):
+        with self.condition:
+            self.update_busy_time()
+            waits = np.array(self.wait_times) if self.wait_times else np.zeros(1)
+            elapsed = max(time.monotonic() - self.created, 1e-9)
+            return {
+                "workers": self.size,
+                "missing": self.missing,
+                "leased": self.leased,
+                "utilization": self.leased / self.size,
+                "average_utilization": self.busy_seconds / (elapsed * self.size),
+                "waiting": self.waiting,
+                "leases": self.leases,
+                "rejected": self.rejected,
+                "recycled": self.recycled,
+                "frames": self.frames_done,
+                "wait_p50_s": float(np.percentile(waits, 50)),
+                "wait_p95_s": float(np.percentile(waits, 95)),
+            }
+
+    def close(self):
+        with self.condition:
+            workers = list(self.idle)
+            self.idle.clear()
+        for worker in workers:
+            worker.stop()
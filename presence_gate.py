@@ -0,0 +1,194 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import PoseModule2 as pm
+
+THUMBNAIL_SIZE = (64, 36)
+
+
+class PresenceGate:
+    """
+    Decides, frame by frame, whether a webcam loop needs pose inference.
+
+    While someone is in view the gate stays active and every frame is analysed. After
+    idle_after seconds without a detected person or motion in the picture, it goes
+    idle: frames are then only read idle_fps times a second and compared with the
+    previous one on a small grey thumbnail, and pose runs as a probe probe_hz times a
+    second. Motion above motion_threshold or a probe that finds a person wakes the
+    gate, and the waking frame itself is analysed.
+    """
+
+    def __init__(self, idle_after=5.0, idle_fps=5.0, probe_hz=1.0, motion_threshold=3.0, log=print):
+        self.idle_after = idle_after
+        self.idle_interval = 1.0 / idle_fps
+        self.probe_interval = 1.0 / probe_hz
+        self.motion_threshold = motion_threshold
+        self.log = log
+
+        self.active = True
+        self.thumbnail = None
+        self.motion = 0.0
+        self.last_activity = None
+        self.last_probe = None
+        self.last_tick = None
+
+        self.frames = 0
+        self.inferred = 0
+        self.wakes = 0
+
+    def frame_motion(self, img):
+        # Mean absolute difference to the previous checked frame, on a 64x36 grey thumbnail
+        small = cv2.cvtColor(cv2.resize(img, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+        motion = 0.0 if self.thumbnail is None else float(cv2.absdiff(small, self.thumbnail).mean())
+        self.thumbnail = small
+        return motion
+
+    def check(self, img, now=None):
+        # True if pose inference should run on this frame
+        now = now if now is not None else time.monotonic()
+        self.frames += 1
+        self.last_tick = now
+        if self.last_activity is None:
+            self.last_activity = now
+        self.motion = self.frame_motion(img)
+        if self.motion > self.motion_threshold:
+            self.last_activity = now
+            if not self.active:
+                self.wake(f"motion {self.motion:.1f}")
+        if self.active:
+            self.inferred += 1
+            return True
+        if self.last_probe is None or now - self.last_probe >= self.probe_interval:
+            self.last_probe = now
+            self.inferred += 1
+            return True
+        return False
+
+    def observe(self, detected, now=None):
+        # Call after each pose inference with whether a person was found
+        now = now if now is not None else time.monotonic()
+        if detected:
+            self.last_activity = now
+            if not self.active:
+                self.wake("person found")
+        elif self.active and now - self.last_activity >= self.idle_after:
+            self.active = False
+            self.last_probe = now
+            self.log(f"⚙️ Nobody in view for {self.idle_after:.0f}s: idling at {1 / self.idle_interval:.0f} fps")
+
+    def wake(self, reason):
+        self.active = True
+        self.wakes += 1
+        self.log(f"⚙️ Waking up ({reason})")
+
+    def wait(self):
+        # Paces an idle loop to idle_fps; returns at once while active
+        if not self.active or self.last_tick is None:
+            return
+        delay = self.last_tick + self.idle_interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+
+    def draw_overlay(self, img):
+        height, width = img.shape[:2]
+        cv2.rectangle(img, (0, height - 40), (width, height), (0, 0, 0), -1)
+        cv2.putText(img, "Resting - step in front of the camera to start", (10, height - 14),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2, cv2.LINE_AA)
+
+    def stats(self):
+        return {"frames": self.frames, "inferred": self.inferred, "wakes": self.wakes, "active": self.active}
+
+
+# --- Benchmark: a simulated empty room with the demo clips played in the middle ---
+def empty_room(shape, seconds, fps, rng):
+    # A static, slightly noisy picture standing in for an empty room
+    background = cv2.GaussianBlur(rng.integers(60, 190, shape, dtype=np.uint8), (0, 0), 25)
+    noisy = [np.clip(background + rng.normal(0, 2, shape), 0, 255).astype(np.uint8) for _ in range(8)]
+    for i in range(int(seconds * fps)):
+        yield noisy[i % len(noisy)], False
+
+
+def clip_frames(path):
+    cap = cv2.VideoCapture(path)
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame, True
+    cap.release()
+
+
+def run(frames, exercise_label, fps, gate=None):
+    import ExerciseAiTrainer as exercise
+
+    detector = pm.posture_detector()
+    count_function = exercise.COUNT_FUNCTIONS[exercise_label]
+    stage, counter = None, 0
+    pose_calls, first_detection = 0, None
+    period = 1.0 / fps
+    next_read = 0.0
+    cpu_seconds = 0.0
+    for index, (frame, person) in enumerate(frames):
+        now = index * period
+        # An idle loop reads the camera idle_fps times a second; the frames in between never arrive
+        if gate is not None and not gate.active and now < next_read:
+            continue
+        next_read = now + (gate.idle_interval if gate is not None else 0.0)
+        start = time.process_time()
+        if gate is not None and not gate.check(frame, now):
+            cpu_seconds += time.process_time() - start
+            continue
+        pose_calls += 1
+        detector.find_person(frame, draw=False)
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        detected = len(landmark_list) != 0
+        if gate is not None:
+            gate.observe(detected, now)
+        cpu_seconds += time.process_time() - start
+        if detected:
+            if first_detection is None and person:
+                first_detection = index
+            stage, counter = count_function(detector, None, landmark_list, stage, counter, None)
+    return {"reps": counter, "pose_calls": pose_calls, "cpu_s": cpu_seconds,
+            "first_detection": first_detection}
+
+
+def main():
+    from benchmark import CLIPS
+
+    parser = argparse.ArgumentParser(description="Presence gate on a simulated idle kiosk.")
+    parser.add_argument("--clips", nargs="*", default=[name for name, label in CLIPS.items() if label])
+    parser.add_argument("--idle-seconds", type=float, default=60.0, help="empty room before and after each clip")
+    parser.add_argument("--fps", type=float, default=30.0)
+    args = parser.parse_args()
+
+    for name in args.clips:
+        shape = next(clip_frames(name))[0].shape
+
+        def session():
+            yield from empty_room(shape, args.idle_seconds, args.fps, np.random.default_rng(1))
+            yield from clip_frames(name)
+            yield from empty_room(shape, args.idle_seconds, args.fps, np.random.default_rng(2))
+
+        total = sum(1 for _ in session())
+        appears = int(args.idle_seconds * args.fps)
+        ungated = run(session(), CLIPS[name], args.fps)
+        gate = PresenceGate(log=lambda message: None)
+        gated = run(session(), CLIPS[name], args.fps, gate)
+        status = "✅" if gated["reps"] == ungated["reps"] else "❌"
+        latency = "n/a"
+        if None not in (gated["first_detection"], ungated["first_detection"]):
+            late = gated["first_detection"] - ungated["first_detection"]
+            latency = f"{late} frames ({late / args.fps * 1000:.0f} ms) later"
+        print(f"{status} {name}: {total} frames ({appears} empty before the person appears)")
+        print(f"   always on: {ungated['pose_calls']} pose calls, {ungated['cpu_s']:.1f}s analysis CPU, "
+              f"{ungated['reps']} reps")
+        print(f"   gated:     {gated['pose_calls']} pose calls, {gated['cpu_s']:.1f}s analysis CPU, {gated['reps']} reps, "
+              f"{gate.wakes} wakes, first detection {latency}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+import PoseModule2 as pm
+
+# Cheapest to most accurate. A lower tracking confidence keeps following the previous
+# frame's region instead of re-running the person detector as often.
+QUALITY_LEVELS = [
+    {"model_complexity": 0, "detection_con": 0.5, "track_con": 0.3},
+    {"model_complexity": 0, "detection_con": 0.5, "track_con": 0.5},
+    {"model_complexity": 1, "detection_con": 0.5, "track_con": 0.3},
+    {"model_complexity": 1, "detection_con": 0.5, "track_con": 0.5},  # posture_detector defaults
+    {"model_complexity": 2, "detection_con": 0.5, "track_con": 0.5},
+]
+DEFAULT_LEVEL = 3
+
+# Rough pose cost of each landmark model relative to the full one, used to predict an
+# upgrade until the level has been measured on this machine
+COMPLEXITY_COST = {0: 0.6, 1: 1.0, 2: 2.5}
+
+
+class AdaptiveQualityController:
+    """
+    Moves a detector between QUALITY_LEVELS to hold target_fps. Frame and pose times
+    are smoothed with an EWMA; the controller steps down as soon as frames miss the
+    budget and steps up only when the next level is predicted to fit within
+    upgrade_headroom of it. Every switch is followed by dwell_frames without changes,
+    and an upgrade that has to be undone soon after doubles the wait before the next one.
+    """
+
+    def __init__(self, target_fps=15, levels=None, level=DEFAULT_LEVEL, alpha=0.1,
+                 upgrade_headroom=0.75, dwell_frames=45, log=print):
+        self.levels = levels or QUALITY_LEVELS
+        self.budget = 1.0 / target_fps
+        self.level = level
+        self.alpha = alpha
+        self.upgrade_headroom = upgrade_headroom
+        self.dwell_frames = dwell_frames
+        self.upgrade_dwell = dwell_frames
+        self.log = log
+
+        self.frame_ewma = None
+        self.pose_ewma = None
+        self.level_cost = {}  # level -> (smoothed pose seconds, frame it was measured at)
+        self.unavailable = set()
+        self.frames = 0
+        self.frames_at_level = 0
+        self.last_upgrade_frame = None
+        self.last_observed = None
+        self.applied = level == DEFAULT_LEVEL
+        self.decisions = []
+
+    def smooth(self, average, value):
+        return value if average is None else average + self.alpha * (value - average)
+
+    def observe(self, detector, pose_seconds, now=None):
+        # Call once per analysed frame; returns the new level if it changed
+        now = now if now is not None else time.perf_counter()
+        if not self.applied:
+            self.applied = True
+            self.switch(detector, self.level, "initial level")
+            self.last_observed = now
+            return self.level
+
+        if self.last_observed is not None:
+            self.frame_ewma = self.smooth(self.frame_ewma, now - self.last_observed)
+        self.last_observed = now
+        self.pose_ewma = self.smooth(self.pose_ewma, pose_seconds)
+        self.frames += 1
+        self.frames_at_level += 1
+        # The first frames after a switch pay for graph warm-up and a fresh detection
+        if self.frames_at_level < self.dwell_frames or self.frame_ewma is None:
+            return None
+        self.level_cost[self.level] = (self.pose_ewma, self.frames)
+
+        if self.frame_ewma > self.budget:
+            target = self.next_level(-1)
+            if target is None:
+                return None
+            if self.last_upgrade_frame is not None and self.frames - self.last_upgrade_frame < 4 * self.dwell_frames:
+                # The last upgrade did not hold: wait longer before trying again
+                self.upgrade_dwell = min(self.upgrade_dwell * 2, 16 * self.dwell_frames)
+            return self.switch(detector, target, "over budget")
+
+        target = self.next_level(1)
+        if target is None or self.frames_at_level < self.upgrade_dwell:
+            return None
+        if self.predicted_frame_seconds(target) < self.upgrade_headroom * self.budget:
+            self.last_upgrade_frame = self.frames
+            return self.switch(detector, target, "headroom")
+        return None
+
+    def pause(self):
+        # Frames skipped on purpose (an idle kiosk) must not count as a slow frame
+        self.last_observed = None
+
+    def next_level(self, direction):
+        level = self.level + direction
+        while 0 <= level < len(self.levels):
+            if level not in self.unavailable:
+                return level
+            level += direction
+        return None
+
+    def predicted_frame_seconds(self, level):
+        cost, measured_at = self.level_cost.get(level, (None, None))
+        # Measurements go stale: the load that made a level too slow may be gone
+        if cost is None or self.frames - measured_at > 8 * self.upgrade_dwell:
+            current = self.levels[self.level]["model_complexity"]
+            target = self.levels[level]["model_complexity"]
+            # Same model with stricter tracking: assume a little more re-detection
+            ratio = COMPLEXITY_COST[target] / COMPLEXITY_COST[current] if target != current else 1.1
+            cost = self.pose_ewma * ratio
+        return self.frame_ewma - self.pose_ewma + cost
+
+    def switch(self, detector, level, reason):
+        previous = self.level
+        try:
+            detector.set_quality(**self.levels[level])
+        except Exception as e:
+            self.unavailable.add(level)
+            self.log(f"❌ Pose quality level {level} unavailable: {e}")
+            return None
+        decision = {
+            "frame": self.frames,
+            "from": previous,
+            "to": level,
+            "reason": reason,
+            "frame_ms": (self.frame_ewma or 0.0) * 1000,
+            "pose_ms": (self.pose_ewma or 0.0) * 1000,
+            "budget_ms": self.budget * 1000,
+        }
+        self.decisions.append(decision)
+        self.log(f"⚙️ Pose quality {previous} -> {level} ({reason}): frame {decision['frame_ms']:.1f} ms, "
+                 f"pose {decision['pose_ms']:.1f} ms, budget {decision['budget_ms']:.1f} ms, {self.levels[level]}")
+        self.level = level
+        self.frames_at_level = 0
+        self.pose_ewma = None
+        self.frame_ewma = None
+        return level
+
+
+# --- Benchmark: accuracy vs. speed at each level on the bundled clips ---
+def run_level(path, exercise_label, level):
+    import ExerciseAiTrainer as exercise
+
+    detector = pm.posture_detector(**level)
+    count_function = exercise.COUNT_FUNCTIONS[exercise_label]
+    cap = cv2.VideoCapture(path)
+    stage, counter = None, 0
+    pose_times, landmarks = [], []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        start = time.perf_counter()
+        detector.find_person(frame, draw=False)
+        pose_times.append(time.perf_counter() - start)
+        landmark_list = detector.find_landmarks(frame, draw=False)
+        landmarks.append(landmark_list.data.copy() if landmark_list.detected else None)
+        if len(landmark_list) != 0:
+            stage, counter = count_function(detector, None, landmark_list, stage, counter, None)
+    cap.release()
+    # The first frame builds the graph
+    return counter, np.array(pose_times[1:]) * 1000, landmarks
+
+
+def landmark_error(landmarks, reference):
+    # Mean distance of the visible landmarks from the reference level, in units of image size
+    errors = [np.linalg.norm(a[:, :2] - b[:, :2], axis=1)[b[:, 3] > 0.5].mean()
+              for a, b in zip(landmarks, reference) if a is not None and b is not None]
+    return float(np.mean(errors)) if errors else float("nan")
+
+
+def main():
+    from benchmark import CLIPS
+
+    parser = argparse.ArgumentParser(description="Pose accuracy vs. speed at each quality level.")
+    parser.add_argument("--clips", nargs="*", default=[name for name, label in CLIPS.items() if label])
+    args = parser.parse_args()
+
+    for name in args.clips:
+        print(f"\n{name} ({CLIPS[name]})")
+        reference_reps, _, reference = run_level(name, CLIPS[name], QUALITY_LEVELS[DEFAULT_LEVEL])
+        for index, level in enumerate(QUALITY_LEVELS):
+            try:
+                reps, pose_ms, landmarks = run_level(name, CLIPS[name], level)
+            except Exception as e:
+                print(f"  level {index} {level}: unavailable ({e})")
+                continue
+            print(f"  level {index} {level}: pose p50 {np.percentile(pose_ms, 50):6.1f} ms "
+                  f"p90 {np.percentile(pose_ms, 90):6.1f} ms, {reps} reps (level {DEFAULT_LEVEL}: {reference_reps}), "
+                  f"landmark error vs level {DEFAULT_LEVEL} {landmark_error(landmarks, reference):.4f}")
+
+
+if __name__ == "__main__":
+    main()
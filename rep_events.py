@@ -0,0 +1,269 @@
+import argparse
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+
+COLUMNS = ("patient_email", "start_time", "session_id", "rep", "exercise", "end_time", "duration",
+           "min_angle", "max_angle", "form_score")
+
+
+def create_tables(conn):
+    # Clustered by patient and time, so a patient's history is one contiguous range of the table
+    conn.execute("""CREATE TABLE IF NOT EXISTS rep_events (
+                    patient_email TEXT,
+                    start_time REAL,
+                    session_id TEXT,
+                    rep INTEGER,
+                    exercise TEXT,
+                    end_time REAL,
+                    duration REAL,
+                    min_angle REAL,
+                    max_angle REAL,
+                    form_score REAL,
+                    PRIMARY KEY (patient_email, start_time, session_id, rep)
+                ) WITHOUT ROWID""")
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(rep_events)")}
+    if "form_score" not in columns:
+        conn.execute("ALTER TABLE rep_events ADD COLUMN form_score REAL")
+    conn.commit()
+
+
+class RepTracker:
+    """
+    Turns the counting functions' per-frame angle and stage into one event per rep:
+    start and end time, duration, and the smallest and largest angle of the counted
+    joint. A rep is a whole movement cycle: it runs from the frame the previous rep was
+    counted to the frame this one is counted, so it includes the return phase and both
+    turning points. The first rep of a set starts at the turning point where the
+    movement into "down" began. The angles in between are the rep's trajectory; with a
+    FormScorer, each rep is scored against the reference trajectories as soon as it is
+    counted.
+
+    Times come from `clock` unless the caller sets frame_time (video time of the
+    current frame plus `origin`). Each event goes to `sink` (e.g. RepEventWriter.submit).
+    """
+
+    def __init__(self, exercise, patient_email=None, session_id=None, sink=None, clock=time.time, origin=0.0,
+                 scorer=None, lead_in_frames=300):
+        self.exercise = exercise
+        self.scorer = scorer
+        self.patient_email = patient_email
+        self.session_id = session_id or uuid.uuid4().hex
+        self.sink = sink
+        self.clock = clock
+        self.origin = origin
+        self.lead_in_frames = lead_in_frames
+        self.frame_time = None
+        self.events = []
+        self.begin(exercise)
+
+    def begin(self, exercise):
+        # A new segment (classify_video) or set; rep numbers continue within the session
+        self.exercise = exercise
+        self.stage = None
+        self.counter = 0
+        self.started = False
+        self.times = []
+        self.trajectory = []
+
+    def now(self):
+        return self.clock() if self.frame_time is None else self.origin + self.frame_time
+
+    def start_first_rep(self):
+        # Before the first rep only the last lead_in_frames frames are kept. The rep begins at
+        # the last frame at the extreme they reach opposite to the way the angle was moving
+        # when "down" began, so a pause before the set is not part of it
+        angles = self.trajectory
+        direction = angles[-1] - angles[-2] if len(angles) > 1 else 0.0
+        if direction:
+            start = max(reversed(range(len(angles))), key=lambda i: -angles[i] if direction > 0 else angles[i])
+        else:
+            start = len(angles) - 1
+        self.times, self.trajectory = self.times[start:], angles[start:]
+        self.started = True
+
+    def observe(self, angle, stage, counter):
+        now = self.now()
+        self.times.append(now)
+        self.trajectory.append(angle)
+        if not self.started:
+            if stage == "down" and self.stage != "down":
+                self.start_first_rep()
+            elif len(self.trajectory) > self.lead_in_frames:
+                del self.times[0], self.trajectory[0]
+        if counter > self.counter and self.started:
+            event = {
+                "patient_email": self.patient_email,
+                "start_time": self.times[0],
+                "session_id": self.session_id,
+                "rep": len(self.events) + 1,
+                "exercise": self.exercise,
+                "end_time": now,
+                "duration": now - self.times[0],
+                "min_angle": float(min(self.trajectory)),
+                "max_angle": float(max(self.trajectory)),
+                "form_score": self.scorer.score(self.exercise, self.trajectory) if self.scorer else None,
+                "trajectory": self.trajectory,
+            }
+            self.events.append(event)
+            if self.sink is not None:
+                self.sink(event)
+            # The next rep starts where this one was counted
+            self.times, self.trajectory = [now], [angle]
+        self.stage = stage
+        self.counter = counter
+
+
+class RepEventWriter:
+    """
+    Writes rep events to rep_events from one background thread, batch_size rows per
+    transaction or whatever has arrived after flush_interval seconds. submit() never
+    touches the database, so counting loops only pay for a queue put.
+    """
+
+    def __init__(self, db_path="elderly_fitness.db", batch_size=500, flush_interval=1.0, log=print):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.log = log
+        self.pending = queue.Queue()
+        self.written = 0
+        conn = sqlite3.connect(db_path, timeout=30)
+        create_tables(conn)
+        conn.close()
+        self.thread = threading.Thread(target=self.write_batches, name="rep-event-writer", daemon=True)
+        self.thread.start()
+
+    def submit(self, event):
+        self.pending.put(tuple(event[column] for column in COLUMNS))
+
+    def write_batches(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        batch, stopping = [], False
+        deadline = None
+        while not stopping:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                row = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                row = ()
+            if row is None:
+                stopping = True
+            elif row:
+                batch.append(row)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+            if batch and (stopping or not row or len(batch) >= self.batch_size):
+                try:
+                    with conn:
+                        # Replace: a retried video analysis produces the same rows again
+                        conn.executemany(f"INSERT OR REPLACE INTO rep_events ({', '.join(COLUMNS)}) "
+                                         f"VALUES ({', '.join('?' * len(COLUMNS))})", batch)
+                    self.written += len(batch)
+                except sqlite3.Error as e:
+                    self.log(f"❌ Could not save {len(batch)} rep events: {e}")
+                batch, deadline = [], None
+        conn.close()
+
+    def close(self):
+        self.pending.put(None)
+        self.thread.join()
+
+
+# --- Summaries, computed by SQLite over one patient's time range ---
+def daily_summary(conn, patient_email, start_time, end_time):
+    return conn.execute(
+        """SELECT date(start_time, 'unixepoch', 'localtime') AS day, exercise, COUNT(*) AS reps,
+                  AVG(duration) AS avg_duration, AVG(max_angle - min_angle) AS avg_range,
+                  MIN(min_angle) AS min_angle, MAX(max_angle) AS max_angle, AVG(form_score) AS form_score
+           FROM rep_events WHERE patient_email=? AND start_time>=? AND start_time<?
+           GROUP BY day, exercise ORDER BY day DESC, exercise""",
+        (patient_email, start_time, end_time)).fetchall()
+
+
+def session_summary(conn, patient_email, start_time, end_time, limit=50):
+    # fatigue: average duration of the second half of a set's reps over the first half
+    return conn.execute(
+        """SELECT session_id, exercise, MIN(start_time) AS started, COUNT(*) AS reps,
+                  AVG(duration) AS avg_duration, AVG(max_angle - min_angle) AS avg_range,
+                  AVG(CASE WHEN rep > half THEN duration END) /
+                  AVG(CASE WHEN rep <= half THEN duration END) AS fatigue, AVG(form_score) AS form_score
+           FROM (SELECT *, (MIN(rep) OVER set_reps + MAX(rep) OVER set_reps) / 2.0 AS half
+                 FROM rep_events WHERE patient_email=? AND start_time>=? AND start_time<?
+                 WINDOW set_reps AS (PARTITION BY session_id, exercise))
+           GROUP BY session_id, exercise ORDER BY started DESC LIMIT ?""",
+        (patient_email, start_time, end_time, limit)).fetchall()
+
+
+# --- Benchmark: write throughput and summary latency on a large synthetic history ---
+def main():
+    import os
+    import random
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Rep event store with a large synthetic history.")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--patients", type=int, default=2000)
+    parser.add_argument("--db", default=None, help="database file (default: a temporary one)")
+    args = parser.parse_args()
+
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="rep-events-"), "reps.db")
+    rng = random.Random(0)
+    now = time.time()
+    exercises = ("push-up", "squat", "shoulder press")
+
+    def synthetic_sets(count):
+        # Sets of 10 reps, each patient exercising on random days of the last year
+        for i in range(0, count, 10):
+            patient = f"patient{rng.randrange(args.patients)}@example.com"
+            start = now - rng.uniform(0, 365 * 86400)
+            session, exercise = uuid.uuid4().hex, rng.choice(exercises)
+            for rep in range(1, 11):
+                duration = rng.uniform(1.5, 3.0) * (1 + rep / 30)
+                low = rng.uniform(60, 100)
+                yield {"patient_email": patient, "start_time": start, "session_id": session, "rep": rep,
+                       "exercise": exercise, "end_time": start + duration, "duration": duration,
+                       "min_angle": low, "max_angle": low + rng.uniform(60, 100), "form_score": rng.uniform(40, 95)}
+                start += duration + 0.2
+
+    writer = RepEventWriter(db_path)
+    queued = min(args.rows, 200_000)
+    start = time.perf_counter()
+    submit_seconds = 0.0
+    for event in synthetic_sets(queued):
+        submit_start = time.perf_counter()
+        writer.submit(event)
+        submit_seconds += time.perf_counter() - submit_start
+    writer.close()
+    elapsed = time.perf_counter() - start
+    print(f"Writer: {writer.written} events in {elapsed:.1f}s ({writer.written / elapsed:.0f}/s), "
+          f"submit {submit_seconds / queued * 1e6:.1f} µs per event")
+
+    conn = sqlite3.connect(db_path)
+    if args.rows > queued:
+        with conn:
+            conn.executemany(f"INSERT OR REPLACE INTO rep_events ({', '.join(COLUMNS)}) "
+                             f"VALUES ({', '.join('?' * len(COLUMNS))})",
+                             (tuple(e[c] for c in COLUMNS) for e in synthetic_sets(args.rows - queued)))
+    rows = conn.execute("SELECT COUNT(*) FROM rep_events").fetchone()[0]
+    print(f"{rows} rep events, {os.path.getsize(db_path) / 1024 ** 2:.0f} MB")
+
+    patients = [f"patient{rng.randrange(args.patients)}@example.com" for _ in range(50)]
+    for name, query in (("daily summary", daily_summary), ("session summary", session_summary)):
+        times = []
+        for patient in patients:
+            query_start = time.perf_counter()
+            query(conn, patient, now - 90 * 86400, now)
+            times.append(time.perf_counter() - query_start)
+        times.sort()
+        print(f"{name}, 90 days: p50 {times[len(times) // 2] * 1000:.2f} ms, max {times[-1] * 1000:.2f} ms")
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM rep_events WHERE patient_email=? "
+                        "AND start_time>=? AND start_time<?", (patients[0], 0, now)).fetchall()
+    print("Plan:", "; ".join(row[-1] for row in plan))
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from difflib import SequenceMatcher
+
+# Negations, modals and "is" flip or qualify a question; prompts that differ in one never match
+MEANING_WORDS = {"no", "not", "never", "without", "dont", "don", "cant", "can", "shouldnt", "should",
+                 "isnt", "is", "nor", "none", "avoid", "stop", "t"}
+
+
+def normalize_prompt(text):
+    # Lowercase, drop punctuation and collapse whitespace so trivial variations share an entry
+    text = re.sub(r"[^\w\s]", " ", text.lower())
+    return " ".join(text.split())
+
+
+def word_similarity(a, b):
+    # Order-aware similarity of the word sequences of two normalized prompts. Prompts
+    # that differ in a negation, a modal or a number score 0, whatever else they share
+    words_a, words_b = a.split(), b.split()
+    if not words_a or not words_b:
+        return 0.0
+    matcher = SequenceMatcher(None, words_a, words_b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        changed = words_a[i1:i2] + words_b[j1:j2]
+        if any(word in MEANING_WORDS or any(ch.isdigit() for ch in word) for word in changed):
+            return 0.0
+    return matcher.ratio()
+
+
+class ResponseCache:
+    """
+    Chatbot response cache persisted in SQLite, with a TTL, LRU eviction and an
+    optional near-duplicate matcher for prompts that are worded slightly differently.
+    """
+
+    def __init__(self, db_path="elderly_fitness.db", ttl_seconds=7 * 24 * 3600, max_entries=500,
+                 similarity_threshold=None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS chat_response_cache (
+                        cache_key TEXT PRIMARY KEY,
+                        context_key TEXT,
+                        prompt TEXT,
+                        response TEXT,
+                        latency REAL,
+                        created_at REAL,
+                        last_used REAL
+                    )""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_cache_context ON chat_response_cache (context_key)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chat_cache_last_used ON chat_response_cache (last_used)")
+        self.conn.commit()
+
+    @staticmethod
+    def context_key(context, scope=""):
+        # The scope (user or session) keeps answers that depend on a conversation private to it
+        return hashlib.sha256(f"{scope}\n{context or ''}".encode("utf-8")).hexdigest()
+
+    def make_key(self, prompt, context, scope=""):
+        context_key = self.context_key(context, scope)
+        digest = hashlib.sha256(f"{context_key}\n{normalize_prompt(prompt)}".encode("utf-8")).hexdigest()
+        return digest, context_key
+
+    def get(self, prompt, context="", scope=""):
+        key, context_key = self.make_key(prompt, context, scope)
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT cache_key, response, latency, created_at FROM chat_response_cache WHERE cache_key=?",
+                (key,)).fetchone()
+            near = False
+            if row is None and self.similarity_threshold is not None:
+                row = self.find_similar(normalize_prompt(prompt), context_key, now)
+                near = row is not None
+
+            if row is None or now - row[3] > self.ttl_seconds:
+                self.misses += 1
+                return None
+
+            self.conn.execute("UPDATE chat_response_cache SET last_used=? WHERE cache_key=?", (now, row[0]))
+            self.conn.commit()
+            self.hits += 1
+            self.near_hits += near
+            self.saved_seconds += row[2] or 0.0
+            return row[1]
+
+    def find_similar(self, normalized, context_key, now):
+        best, best_score = None, self.similarity_threshold
+        rows = self.conn.execute(
+            "SELECT cache_key, response, latency, created_at, prompt FROM chat_response_cache "
+            "WHERE context_key=? AND created_at>=?",
+            (context_key, now - self.ttl_seconds))
+        for row in rows:
+            score = word_similarity(normalized, row[4])
+            if score >= best_score:
+                best, best_score = row[:4], score
+        return best
+
+    def put(self, prompt, context, response, latency, scope=""):
+        key, context_key = self.make_key(prompt, context, scope)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO chat_response_cache "
+                "(cache_key, context_key, prompt, response, latency, created_at, last_used) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, context_key, normalize_prompt(prompt), response, latency, now, now))
+            self.evict(now)
+            self.conn.commit()
+
+    def evict(self, now):
+        # Drop expired entries, then the least recently used ones above max_entries
+        self.conn.execute("DELETE FROM chat_response_cache WHERE created_at<?", (now - self.ttl_seconds,))
+        self.conn.execute(
+            "DELETE FROM chat_response_cache WHERE cache_key IN ("
+            "SELECT cache_key FROM chat_response_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": self.saved_seconds,
+        }
@@ -0,0 +1,426 @@
+import argparse
+import json
+import os
+import queue
+import struct
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import PoseModule2 as pm
+
+NUM_LANDMARKS = pm.NUM_LANDMARKS
+FILE_MAGIC = b"LMREC\x00\x01\x00"
+CHUNK_MAGIC = b"LMCK"
+INDEX_MAGIC = b"LMIX"
+# magic, first frame, frames, first timestamp, length of the chunk's JSON (stage names)
+CHUNK_HEADER = struct.Struct("<4sIIdI")
+# index offset, chunk count, magic
+TRAILER = struct.Struct("<QQ4s")
+INDEX_DTYPE = np.dtype([("frame", "<i8"), ("offset", "<i8"), ("timestamp", "<f8")])
+# Bytes per frame in a chunk: timestamp, counter, stage, detected, 33x4 float16 landmarks
+FRAME_BYTES = 8 + 4 + 1 + 1 + NUM_LANDMARKS * 4 * 2
+
+
+def chunk_payload(timestamps, counters, stages, detected, landmarks):
+    return b"".join(a.tobytes() for a in (timestamps, counters, stages, detected, landmarks))
+
+
+class SessionRecorder:
+    """
+    Append-only recording of a session's landmark stream: per frame a timestamp,
+    the 33x4 landmarks as float16, whether a person was detected, the stage and the
+    rep count. record() only copies into the current chunk; full chunks are written
+    by a background thread, so a slow disk never stalls the capture loop (if the
+    writer falls max_pending_chunks behind, chunks are dropped and counted instead).
+
+    Layout: header (magic, JSON metadata), chunks of chunk_frames frames, then a
+    frame index written by close(). A file without its index (crash) is still
+    readable; SessionRecording rebuilds the index by walking the chunk headers.
+    """
+
+    def __init__(self, path, metadata=None, chunk_frames=64, max_pending_chunks=64, log=print):
+        self.path = path
+        self.chunk_frames = chunk_frames
+        self.log = log
+        self.stages = [None]
+        self.stage_codes = {None: 0}
+        self.frames = 0
+        self.dropped = 0
+        self.index = []  # (first frame, offset, first timestamp) of every written chunk
+        self.pending = queue.Queue(maxsize=max_pending_chunks)
+        self.new_chunk()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "wb")
+        header = json.dumps(dict(metadata or {}, chunk_frames=chunk_frames)).encode()
+        self.file.write(FILE_MAGIC + struct.pack("<I", len(header)) + header)
+        self.writer = threading.Thread(target=self.write_chunks, name="session-recorder", daemon=True)
+        self.writer.start()
+
+    def new_chunk(self):
+        n = self.chunk_frames
+        self.first_frame = self.frames
+        self.fill = 0
+        self.timestamps = np.zeros(n, dtype=np.float64)
+        self.counters = np.zeros(n, dtype=np.int32)
+        self.stage_array = np.zeros(n, dtype=np.uint8)
+        self.detected = np.zeros(n, dtype=np.uint8)
+        self.landmarks = np.zeros((n, NUM_LANDMARKS, 4), dtype=np.float16)
+
+    def stage_code(self, stage):
+        code = self.stage_codes.get(stage)
+        if code is None:
+            code = self.stage_codes[stage] = len(self.stages)
+            self.stages.append(stage)
+        return code
+
+    def record(self, timestamp, landmarks, stage=None, counter=0):
+        i = self.fill
+        self.timestamps[i] = timestamp
+        self.counters[i] = counter
+        self.stage_array[i] = self.stage_code(stage)
+        if landmarks is not None and len(landmarks) != 0:
+            self.landmarks[i] = landmarks.data
+            self.detected[i] = 1
+        self.fill += 1
+        self.frames += 1
+        if self.fill == self.chunk_frames:
+            self.hand_off()
+
+    def hand_off(self):
+        n = self.fill
+        chunk = (self.first_frame, list(self.stages), self.timestamps[:n], self.counters[:n],
+                 self.stage_array[:n], self.detected[:n], self.landmarks[:n])
+        try:
+            self.pending.put_nowait(chunk)
+        except queue.Full:
+            if not self.dropped:
+                self.log("❌ Session recorder is falling behind; dropping frames")
+            self.dropped += n
+        self.new_chunk()
+
+    def write_chunks(self):
+        while True:
+            chunk = self.pending.get()
+            if chunk is None:
+                break
+            first_frame, stages, *arrays = chunk
+            names = json.dumps({"stages": stages}).encode()
+            offset = self.file.tell()
+            self.file.write(CHUNK_HEADER.pack(CHUNK_MAGIC, first_frame, len(arrays[0]), arrays[0][0], len(names)))
+            self.file.write(names)
+            self.file.write(chunk_payload(*arrays))
+            self.index.append((first_frame, offset, arrays[0][0]))
+
+    def close(self):
+        if self.file.closed:
+            return self.stats()
+        if self.fill:
+            self.hand_off()
+        self.pending.put(None)
+        self.writer.join()
+        index = np.array(self.index, dtype=INDEX_DTYPE)
+        index_offset = self.file.tell()
+        self.file.write(index.tobytes())
+        self.file.write(TRAILER.pack(index_offset, len(index), INDEX_MAGIC))
+        self.file.close()
+        return self.stats()
+
+    def stats(self):
+        size = self.file.tell() if not self.file.closed else os.path.getsize(self.path)
+        return {"frames": self.frames, "dropped": self.dropped, "bytes": size}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+class SessionRecording:
+    """
+    Reader for SessionRecorder files. frame(i) seeks straight to the chunk holding
+    frame i through the index; the last decoded chunk is cached, so playing a
+    recording in order reads every chunk once.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        if self.file.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        (length,) = struct.unpack("<I", self.file.read(4))
+        self.metadata = json.loads(self.file.read(length))
+        self.data_start = self.file.tell()
+        self.read_index()
+        self.cached = None
+
+    def read_index(self):
+        size = os.fstat(self.file.fileno()).st_size
+        if size - self.data_start >= TRAILER.size:
+            self.file.seek(size - TRAILER.size)
+            index_offset, count, magic = TRAILER.unpack(self.file.read(TRAILER.size))
+            if magic == INDEX_MAGIC:
+                self.file.seek(index_offset)
+                entries = np.frombuffer(self.file.read(count * INDEX_DTYPE.itemsize), dtype=INDEX_DTYPE)
+                return self.set_index(entries["frame"], entries["offset"], entries["timestamp"])
+        # No index: the recorder did not close cleanly, walk the chunks up to the first incomplete one
+        frames, offsets, timestamps = [], [], []
+        offset = self.data_start
+        while offset + CHUNK_HEADER.size <= size:
+            self.file.seek(offset)
+            magic, first_frame, n, first_timestamp, names = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+            end = offset + CHUNK_HEADER.size + names + n * FRAME_BYTES
+            if magic != CHUNK_MAGIC or end > size:
+                break
+            frames.append(first_frame)
+            offsets.append(offset)
+            timestamps.append(first_timestamp)
+            offset = end
+        return self.set_index(frames, offsets, timestamps)
+
+    def set_index(self, frames, offsets, timestamps):
+        self.chunk_frames = np.asarray(frames, dtype=np.int64)
+        self.chunk_offsets = np.asarray(offsets, dtype=np.int64)
+        self.chunk_timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(self.chunk_offsets):
+            # Frames in the last chunk follow from its header
+            self.file.seek(int(self.chunk_offsets[-1]))
+            _, first_frame, n, _, _ = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+            self.frame_count = first_frame + n
+        else:
+            self.frame_count = 0
+
+    def __len__(self):
+        return self.frame_count
+
+    def chunk(self, number):
+        if self.cached is not None and self.cached[0] == number:
+            return self.cached[1]
+        self.file.seek(int(self.chunk_offsets[number]))
+        _, first_frame, n, _, names = CHUNK_HEADER.unpack(self.file.read(CHUNK_HEADER.size))
+        stages = json.loads(self.file.read(names))["stages"]
+        payload = self.file.read(n * FRAME_BYTES)
+        arrays, position = [], 0
+        for dtype, shape in ((np.float64, (n,)), (np.int32, (n,)), (np.uint8, (n,)), (np.uint8, (n,)),
+                             (np.float16, (n, NUM_LANDMARKS, 4))):
+            count = int(np.prod(shape))
+            arrays.append(np.frombuffer(payload, dtype=dtype, count=count, offset=position).reshape(shape))
+            position += count * np.dtype(dtype).itemsize
+        chunk = (first_frame, stages, *arrays)
+        self.cached = (number, chunk)
+        return chunk
+
+    def frame(self, i):
+        # (timestamp, landmarks float32 (33, 4) or None, stage, counter) of frame i
+        if not 0 <= i < self.frame_count:
+            raise IndexError(i)
+        number = int(np.searchsorted(self.chunk_frames, i, side="right")) - 1
+        first_frame, stages, timestamps, counters, stage_codes, detected, landmarks = self.chunk(number)
+        j = i - first_frame
+        data = landmarks[j].astype(np.float32) if detected[j] else None
+        return float(timestamps[j]), data, stages[stage_codes[j]], int(counters[j])
+
+    def frame_at(self, seconds):
+        # Index of the last frame recorded at most `seconds` after the first one
+        if not self.frame_count:
+            return 0
+        timestamp = self.chunk_timestamps[0] + seconds
+        number = max(int(np.searchsorted(self.chunk_timestamps, timestamp, side="right")) - 1, 0)
+        first_frame, _, timestamps, *_ = self.chunk(number)
+        return first_frame + max(int(np.searchsorted(timestamps, timestamp, side="right")) - 1, 0)
+
+    def frames(self, start=0, end=None):
+        end = self.frame_count if end is None else min(end, self.frame_count)
+        for i in range(start, end):
+            yield self.frame(i)
+
+    def close(self):
+        self.file.close()
+
+
+class RecordedPostureDetector(pm.posture_detector):
+    # posture_detector that hands out the landmarks of the frame ReplayCapture last read
+    def __init__(self, capture):
+        super().__init__()
+        self.capture = capture
+
+    def frame_buffer(self):
+        return None
+
+    def set_quality(self, **quality):
+        pass
+
+    def find_person(self, img, draw=True):
+        height, width = img.shape[:2]
+        self.set_landmarks(self.capture.landmarks, width, height)
+        if draw:
+            self.draw_person(img)
+        return img
+
+    def draw_person(self, img):
+        return pm.draw_landmark_array(img, self.landmarks, self.mp_pose.POSE_CONNECTIONS)
+
+
+class ReplayCapture:
+    """
+    cv2.VideoCapture stand-in that plays a recording back as blank frames of the
+    recorded size. Use detector() as the Exercise detector factory and the recorded
+    landmarks come out of find_person, so the live loops count and classify the
+    recording as if it were a camera. realtime=True keeps the recorded pace.
+    """
+
+    def __init__(self, recording, realtime=False):
+        self.recording = recording
+        self.realtime = realtime
+        self.position = 0
+        self.landmarks = None
+        self.opened = True
+        width = int(recording.metadata.get("width") or 640)
+        height = int(recording.metadata.get("height") or 480)
+        self.blank = np.zeros((height, width, 3), dtype=np.uint8)
+        self.started = None
+
+    def detector(self):
+        return RecordedPostureDetector(self)
+
+    def isOpened(self):
+        return self.opened
+
+    def read(self, image=None):
+        if not self.opened or self.position >= len(self.recording):
+            return False, None
+        timestamp, self.landmarks, _, _ = self.recording.frame(self.position)
+        if self.realtime:
+            first = self.recording.chunk_timestamps[0]
+            if self.started is None:
+                self.started = time.perf_counter()
+            delay = (timestamp - first) - (time.perf_counter() - self.started)
+            if delay > 0:
+                time.sleep(delay)
+        self.position += 1
+        frame = image if image is not None and image.shape == self.blank.shape else self.blank.copy()
+        frame[:] = 0
+        return True, frame
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.recording.metadata.get("fps") or 30)
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(len(self.recording))
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.blank.shape[1])
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.blank.shape[0])
+        return 0.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            return True
+        return False
+
+    def release(self):
+        self.opened = False
+
+
+def replay(recording, exercise_label=None, exer=None):
+    # Headless: rep count with the counter for exercise_label, and classifier labels
+    # for every window of the recorded landmarks when an Exercise is given
+    import ExerciseAiTrainer as exercise
+
+    detector = pm.posture_detector()
+    count_function = exercise.COUNT_FUNCTIONS.get(exercise_label)
+    width = recording.metadata.get("width") or 640
+    height = recording.metadata.get("height") or 480
+    stage, counter, features = None, 0, []
+    for _, data, _, _ in recording.frames():
+        landmark_list = detector.set_landmarks(data, width, height)
+        if len(landmark_list) == 0:
+            continue
+        features.append(exercise.landmark_features(landmark_list))
+        if count_function is not None:
+            stage, counter = count_function(detector, None, landmark_list, stage, counter, None)
+    labels = None
+    if exer is not None and len(features) >= 30:
+        labels = exer.classify_windows(np.asarray(features)).argmax(axis=1)
+    return counter, labels
+
+
+# --- Validation: record the bundled clips, then replay and seek in the recordings ---
+def record_clip(path, exercise_label, output):
+    import ExerciseAiTrainer as exercise
+
+    detector = pm.posture_detector()
+    count_function = exercise.COUNT_FUNCTIONS.get(exercise_label)
+    cap = cv2.VideoCapture(path)
+    metadata = {"exercise": exercise_label, "source": path, "fps": cap.get(cv2.CAP_PROP_FPS),
+                "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}
+    stage, counter, record_times = None, 0, []
+    with SessionRecorder(output, metadata) as recorder:
+        frame_number = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            detector.find_person(frame, draw=False)
+            landmark_list = detector.find_landmarks(frame, draw=False)
+            if len(landmark_list) != 0 and count_function is not None:
+                stage, counter = count_function(detector, None, landmark_list, stage, counter, None)
+            start = time.perf_counter()
+            recorder.record(frame_number / metadata["fps"], landmark_list, stage, counter)
+            record_times.append(time.perf_counter() - start)
+            frame_number += 1
+    cap.release()
+    return counter, np.array(record_times) * 1000
+
+
+def main():
+    import tempfile
+
+    import ExerciseAiTrainer as exercise
+    from benchmark import CLIPS
+
+    parser = argparse.ArgumentParser(description="Record the bundled clips as landmark streams and replay them.")
+    parser.add_argument("--clips", nargs="*", default=list(CLIPS))
+    parser.add_argument("--output", default=None, help="directory for the recordings (default: a temporary one)")
+    args = parser.parse_args()
+
+    output = args.output or tempfile.mkdtemp(prefix="recordings-")
+    exer = exercise.Exercise()
+    for name in args.clips:
+        label = CLIPS[name]
+        path = os.path.join(output, os.path.splitext(os.path.basename(name))[0] + ".lmrec")
+        live_reps, record_ms = record_clip(name, label, path)
+
+        recording = SessionRecording(path)
+        start = time.perf_counter()
+        reps, labels = replay(recording, label, exer)
+        replay_seconds = time.perf_counter() - start
+        seeks = np.random.default_rng(0).integers(0, len(recording), 200)
+        start = time.perf_counter()
+        for i in seeks:
+            recording.cached = None
+            recording.frame(int(i))
+        seek_ms = (time.perf_counter() - start) / len(seeks) * 1000
+        last_counter = recording.frame(len(recording) - 1)[3]
+        recording.close()
+
+        size, video_size = os.path.getsize(path), os.path.getsize(name)
+        print(f"{name} ({label or 'classifier only'}): {len(recording)} frames, {size / 1024:.0f} KB "
+              f"({size / video_size:.1%} of the video), record p99 {np.percentile(record_ms, 99):.3f} ms, "
+              f"random seek {seek_ms:.2f} ms, replay {replay_seconds:.2f}s, "
+              f"reps live {live_reps} / recorded {last_counter} / replayed {reps}"
+              f"{'' if reps == live_reps == last_counter else ' ❌'}"
+              f"{'' if labels is None else f', {len(labels)} windows classified'}")
+    print(f"Recordings in {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+import argparse
+import gc
+import os
+import threading
+import time
+
+
+def process_rss():
+    # Resident memory of this process in bytes, or None where /proc is not available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class SessionResourceManager:
+    """
+    Holds the heavy objects of each UI session (e.g. a chat's LLM client and memory)
+    instead of st.session_state, so they can be let go when the session walks away.
+
+    get() returns a session's resource, building it with `create` on first use or
+    after an eviction. A resource unused for ttl_seconds is evicted by a background
+    sweep; when the tracked resources exceed max_bytes, or the process exceeds
+    max_rss_bytes, the least recently used ones go first (never one used in the last
+    min_idle_seconds). Before a resource is dropped its `persist` callback can save a
+    compact state for `create` to restore from. A resource's size is what its `size`
+    callback reports; the process-wide RSS limit catches what those estimates miss.
+    """
+
+    def __init__(self, ttl_seconds=1800, max_bytes=None, max_rss_bytes=None, min_idle_seconds=60,
+                 sweep_interval=60, clock=time.monotonic, log=print):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_rss_bytes = max_rss_bytes
+        self.min_idle_seconds = min_idle_seconds
+        self.clock = clock
+        self.log = log
+        self.resources = {}  # (session id, name) -> entry dict
+        self.lock = threading.Lock()
+        self.evictions = {"ttl": 0, "memory": 0}
+        self.restores = 0
+        self.evicted = {}  # key -> when, to count restores; forgotten after a day
+        self.stopping = threading.Event()
+        self.sweeper = None
+        if sweep_interval:
+            self.sweeper = threading.Thread(target=self.sweep_forever, args=(sweep_interval,),
+                                            name="session-resources", daemon=True)
+            self.sweeper.start()
+
+    def get(self, session_id, name, create, persist=None, size=None):
+        key = (session_id, name)
+        with self.lock:
+            entry = self.resources.get(key)
+            if entry is not None:
+                entry["last_used"] = self.clock()
+                return entry["resource"]
+        resource = create()
+        with self.lock:
+            entry = self.resources.get(key)
+            if entry is not None:  # built by a concurrent rerun of the same session
+                entry["last_used"] = self.clock()
+                return entry["resource"]
+            self.resources[key] = {"resource": resource, "persist": persist, "size": size,
+                                   "created": self.clock(), "last_used": self.clock()}
+            if self.evicted.pop(key, None) is not None:
+                self.restores += 1
+        self.enforce_budget()
+        return resource
+
+    def entry_bytes(self, entry):
+        return entry["size"](entry["resource"]) if entry["size"] else 0
+
+    def evict(self, key, reason):
+        with self.lock:
+            entry = self.resources.pop(key, None)
+            if entry is None:
+                return 0
+            self.evicted[key] = self.clock()
+            self.evictions[reason] += 1
+        size = self.entry_bytes(entry)
+        if entry["persist"] is not None:
+            try:
+                entry["persist"](entry["resource"])
+            except Exception as e:
+                self.log(f"❌ Could not save {key[1]} of session {key[0]} before evicting it: {e}")
+        return size
+
+    def release(self, session_id):
+        # A session that ended (logout): its resources go without being persisted
+        with self.lock:
+            for key in [key for key in self.resources if key[0] == session_id]:
+                del self.resources[key]
+            for key in [key for key in self.evicted if key[0] == session_id]:
+                del self.evicted[key]
+
+    def sweep(self):
+        now = self.clock()
+        with self.lock:
+            expired = [key for key, entry in self.resources.items() if now - entry["last_used"] >= self.ttl_seconds]
+            for key in [key for key, when in self.evicted.items() if now - when > 86400]:
+                del self.evicted[key]
+        for key in expired:
+            self.evict(key, "ttl")
+        self.enforce_budget()
+        return len(expired)
+
+    def enforce_budget(self):
+        over = self.over_budget()
+        if not over:
+            return 0
+        now = self.clock()
+        with self.lock:
+            candidates = sorted((entry["last_used"], key) for key, entry in self.resources.items()
+                                if now - entry["last_used"] >= self.min_idle_seconds)
+        freed, evicted = 0, 0
+        for _, key in candidates:
+            if freed >= over:
+                break
+            freed += self.evict(key, "memory")
+            evicted += 1
+        if evicted:
+            gc.collect()
+            self.log(f"⚙️ Memory pressure: evicted {evicted} idle session resources ({freed / 1024 ** 2:.1f} MB)")
+        return evicted
+
+    def over_budget(self):
+        # Bytes to free, 0 when within both limits
+        over = 0
+        if self.max_bytes is not None:
+            over = max(over, self.tracked_bytes() - self.max_bytes)
+        if self.max_rss_bytes is not None:
+            rss = process_rss()
+            if rss is not None:
+                over = max(over, rss - self.max_rss_bytes)
+        return over
+
+    def tracked_bytes(self):
+        with self.lock:
+            entries = list(self.resources.values())
+        return sum(self.entry_bytes(entry) for entry in entries)
+
+    def report(self):
+        # Per session: resources held, their estimated bytes and seconds since last use
+        now = self.clock()
+        with self.lock:
+            items = list(self.resources.items())
+        sessions = {}
+        for (session_id, name), entry in items:
+            session = sessions.setdefault(session_id, {"session": session_id, "resources": [], "bytes": 0,
+                                                       "idle_seconds": None})
+            session["resources"].append(name)
+            session["bytes"] += self.entry_bytes(entry)
+            idle = now - entry["last_used"]
+            session["idle_seconds"] = idle if session["idle_seconds"] is None else min(session["idle_seconds"], idle)
+        return sorted(sessions.values(), key=lambda s: -s["bytes"])
+
+    def stats(self):
+        return {"sessions": len({key[0] for key in self.resources}), "resources": len(self.resources),
+                "tracked_bytes": self.tracked_bytes(), "rss_bytes": process_rss(),
+                "ttl_evictions": self.evictions["ttl"], "memory_evictions": self.evictions["memory"],
+                "restores": self.restores}
+
+    def sweep_forever(self, interval):
+        while not self.stopping.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                self.log(f"❌ Session resource sweep failed: {e}")
+
+    def stop(self):
+        self.stopping.set()
+        if self.sweeper is not None:
+            self.sweeper.join()
+
+
+# --- Simulation: visitors who chat and walk away, with and without the manager ---
+def main():
+    import tempfile
+
+    from chat_memory import BudgetedSummaryMemory, ChatStateStore, SummaryWindowConversation
+
+    parser = argparse.ArgumentParser(description="Memory of many short chat sessions, with and without eviction.")
+    parser.add_argument("--visitors", type=int, default=300)
+    parser.add_argument("--turns", type=int, default=12)
+    parser.add_argument("--client-mb", type=float, default=2.0, help="stand-in for an LLM client's memory")
+    parser.add_argument("--ttl", type=float, default=600, help="seconds")
+    args = parser.parse_args()
+
+    class StandInLLM:
+        def __init__(self):
+            self.buffers = bytearray(int(args.client_mb * 1024 ** 2))
+
+        def invoke(self, prompt):
+            if prompt.startswith("Progressively summarize"):
+                return "The user asked about safe home exercises for their knees and balance."
+            return "Try two sets of ten slow squats holding on to a sturdy chair for balance."
+
+    def new_chat(state=None):
+        llm = StandInLLM()
+        memory = BudgetedSummaryMemory(llm, max_token_limit=200, background=False)
+        if state:
+            memory.restore(state)
+        return SummaryWindowConversation(llm, memory)
+
+    def chat_bytes(conversation):
+        return len(conversation.llm.buffers) + conversation.memory.size()
+
+    store = ChatStateStore(os.path.join(tempfile.mkdtemp(prefix="session-resources-"), "chat.db"))
+    now = [0.0]
+    scenarios = (
+        ("No eviction", {"ttl_seconds": float("inf")}),
+        (f"TTL {args.ttl:.0f}s", {"ttl_seconds": args.ttl}),
+        ("20 MB budget", {"ttl_seconds": float("inf"), "max_bytes": 20 * 1024 ** 2, "min_idle_seconds": 30}),
+    )
+    for index, (name, options) in enumerate(scenarios):
+        manager = SessionResourceManager(sweep_interval=0, clock=lambda: now[0], log=lambda message: None, **options)
+        gc.collect()
+        rss_before = process_rss() or 0
+        now[0] = 0.0
+        peak = 0
+        for visitor in range(args.visitors):
+            session_id = f"{index}-{visitor}"
+            for turn in range(args.turns):
+                conversation = manager.get(session_id, "chat", lambda: new_chat(store.load(session_id)),
+                                           persist=lambda c, s=session_id: store.save(s, None, c.memory.state()),
+                                           size=chat_bytes)
+                conversation.run(f"Question {turn} about my knees?")
+                now[0] += 5
+            now[0] += 60  # the next visitor comes a minute after this one leaves
+            manager.sweep()
+            peak = max(peak, manager.tracked_bytes())
+        rss_after = process_rss() or 0
+        stats = manager.stats()
+        print(f"{name:13s}: {stats['resources']} chats held, tracked peak {peak / 1024 ** 2:.0f} MB, "
+              f"process grew {(rss_after - rss_before) / 1024 ** 2:.0f} MB, "
+              f"{stats['ttl_evictions']} TTL / {stats['memory_evictions']} memory evictions")
+
+        if stats["ttl_evictions"] or stats["memory_evictions"]:
+            # The first visitor comes back: their chat is rebuilt from the saved state
+            session_id = f"{index}-0"
+            saved = store.load(session_id)
+            conversation = manager.get(session_id, "chat", lambda: new_chat(store.load(session_id)), size=chat_bytes)
+            restored = conversation.memory.state() == saved
+            print(f"   {'✅' if restored else '❌'} evicted chat restored: {len(saved['turns'])} recent turns and a "
+                  f"{len(saved['summary'])}-character summary")
+        for session in list({key[0] for key in manager.resources}):
+            manager.release(session)
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
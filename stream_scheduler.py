@@ -0,0 +1,217 @@
+import argparse
+import os
+import threading
+import time
+from collections import deque
+
+import cv2
+
+import ExerciseAiTrainer as exercise
+import PoseModule2 as pm
+
+# Frame-drop policies: live cameras keep only the newest frames, files never drop
+DROP_OLDEST = "drop_oldest"
+BLOCK = "block"
+
+
+def open_source(source):
+    # Camera indices may arrive as strings from the command line
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    return cv2.VideoCapture(source)
+
+
+class StreamState:
+    """One analysed stream: its capture, frame buffer, pose graph and rep count."""
+
+    def __init__(self, name, source, exercise_label, drop_policy=None, buffer_size=2):
+        if exercise_label not in exercise.COUNT_FUNCTIONS:
+            raise ValueError(f"Unknown exercise '{exercise_label}', expected one of {list(exercise.COUNT_FUNCTIONS)}")
+        self.name = name
+        self.source = source
+        self.exercise = exercise_label
+        self.count_function = exercise.COUNT_FUNCTIONS[exercise_label]
+        is_file = isinstance(source, str) and not source.isdigit() and "://" not in source
+        self.drop_policy = drop_policy or (BLOCK if is_file else DROP_OLDEST)
+        self.frames = deque(maxlen=buffer_size if self.drop_policy == DROP_OLDEST else None)
+        self.buffer_size = buffer_size
+
+        # Pose graphs track the person between frames, so each stream keeps its own
+        # detector and is processed by at most one worker at a time
+        self.detector = None
+        self.busy = False
+        self.finished = False
+
+        self.stage = None
+        self.counter = 0
+        self.frames_read = 0
+        self.frames_processed = 0
+        self.frames_dropped = 0
+        self.last_started = 0.0
+
+    def ready(self):
+        return bool(self.frames) and not self.busy
+
+    def deadline(self):
+        # Earliest arrival first: the stream whose oldest waiting frame is oldest goes next
+        return self.frames[0][0]
+
+    def result(self):
+        return {
+            "source": self.source,
+            "exercise": self.exercise,
+            "reps": self.counter,
+            "frames_read": self.frames_read,
+            "frames_processed": self.frames_processed,
+            "frames_dropped": self.frames_dropped,
+        }
+
+
+class MultiStreamScheduler:
+    """
+    Runs pose inference and rep counting for many streams on a fixed pool of worker
+    threads. Workers pick streams round-robin or by earliest deadline; a stream is
+    handed one frame per turn, so no stream can starve the others.
+    """
+
+    def __init__(self, workers=None, policy="round_robin", on_update=None):
+        if policy not in ("round_robin", "deadline"):
+            raise ValueError("policy must be 'round_robin' or 'deadline'")
+        self.workers = workers or os.cpu_count() or 1
+        self.policy = policy
+        self.on_update = on_update
+        self.streams = []
+        self.order = deque()
+        self.condition = threading.Condition()
+        self.stopped = False
+        self.threads = []
+
+    def add_stream(self, name, source, exercise_label, drop_policy=None, buffer_size=2):
+        stream = StreamState(name, source, exercise_label, drop_policy, buffer_size)
+        self.streams.append(stream)
+        self.order.append(stream)
+        return stream
+
+    # --- Capture side: one reader thread per stream ---
+    def read_stream(self, stream):
+        cap = open_source(stream.source)
+        if not cap.isOpened():
+            print(f"❌ Could not open stream {stream.name}: {stream.source}")
+        while cap.isOpened() and not self.stopped:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            with self.condition:
+                if stream.drop_policy == BLOCK:
+                    while len(stream.frames) >= stream.buffer_size and not self.stopped:
+                        self.condition.wait()
+                elif len(stream.frames) == stream.frames.maxlen:
+                    stream.frames_dropped += 1  # the append below overwrites the oldest frame
+                stream.frames.append((time.monotonic(), frame))
+                stream.frames_read += 1
+                self.condition.notify_all()
+        cap.release()
+        with self.condition:
+            stream.finished = True
+            self.condition.notify_all()
+
+    # --- Inference side: a fixed pool of workers ---
+    def next_stream(self):
+        # Called with the condition held; returns a stream with a frame to process
+        while not self.stopped:
+            ready = [stream for stream in self.order if stream.ready()]
+            if ready:
+                if self.policy == "deadline":
+                    stream = min(ready, key=StreamState.deadline)
+                else:
+                    stream = ready[0]
+                # Move the chosen stream to the back of the rotation
+                self.order.remove(stream)
+                self.order.append(stream)
+                stream.busy = True
+                return stream
+            if all(stream.finished and not stream.frames for stream in self.streams):
+                return None
+            self.condition.wait()
+        return None
+
+    def work(self):
+        while True:
+            with self.condition:
+                stream = self.next_stream()
+                if stream is None:
+                    return
+                _, frame = stream.frames.popleft()
+                stream.last_started = time.monotonic()
+                self.condition.notify_all()  # wakes a blocked reader
+
+            try:
+                if stream.detector is None:
+                    stream.detector = pm.posture_detector()
+                stream.detector.find_person(frame, draw=False)
+                landmark_list = stream.detector.find_landmarks(frame, draw=False)
+                if len(landmark_list) != 0:
+                    stream.stage, stream.counter = stream.count_function(
+                        stream.detector, None, landmark_list, stream.stage, stream.counter, None)
+                stream.frames_processed += 1
+            finally:
+                with self.condition:
+                    stream.busy = False
+                    self.condition.notify_all()
+
+            if self.on_update is not None:
+                self.on_update(stream.name, stream.stage, stream.counter)
+
+    def start(self):
+        for stream in self.streams:
+            self.threads.append(threading.Thread(target=self.read_stream, args=(stream,), daemon=True))
+        for _ in range(self.workers):
+            self.threads.append(threading.Thread(target=self.work, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def run(self):
+        self.start()
+        self.join()
+        return self.results()
+
+    def results(self):
+        return {stream.name: stream.result() for stream in self.streams}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count reps on several streams with a shared worker pool.")
+    parser.add_argument("streams", nargs="+",
+                        help="SOURCE:EXERCISE pairs, e.g. 0:squat, push-up_1.mp4:push-up, rtsp://host/cam:squat")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--policy", choices=["round_robin", "deadline"], default="round_robin")
+    parser.add_argument("--buffer", type=int, default=2, help="frames buffered per stream")
+    args = parser.parse_args()
+
+    scheduler = MultiStreamScheduler(workers=args.workers, policy=args.policy)
+    for i, spec in enumerate(args.streams):
+        source, exercise_label = spec.rsplit(":", 1)
+        scheduler.add_stream(f"stream-{i}", source, exercise_label, buffer_size=args.buffer)
+
+    start = time.perf_counter()
+    results = scheduler.run()
+    elapsed = time.perf_counter() - start
+
+    processed = sum(r["frames_processed"] for r in results.values())
+    for name, r in results.items():
+        print(f"{name} ({r['source']}, {r['exercise']}): {r['reps']} reps, "
+              f"{r['frames_processed']}/{r['frames_read']} frames processed, {r['frames_dropped']} dropped")
+    print(f"{processed} frames in {elapsed:.1f}s ({processed / elapsed:.1f} fps) on {scheduler.workers} workers")
+
+
+if __name__ == "__main__":
+    main()
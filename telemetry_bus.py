@@ -0,0 +1,306 @@
+import argparse
+import json
+import threading
+import time
+
+CHANNEL_PREFIX = "patient/"
+
+
+def patient_channel(patient_email):
+    return CHANNEL_PREFIX + patient_email
+
+
+class Subscription:
+    """
+    A subscriber's mailbox: the latest state of each of its channels that changed since
+    its last poll. A new message replaces the unread one of the same channel, so a
+    slow subscriber skips intermediate states instead of building a backlog.
+    """
+
+    def __init__(self, bus, channels):
+        self.bus = bus
+        self.channels = set(channels)
+        self.mailbox = {}
+        self.condition = threading.Condition()
+        self.last_poll = time.monotonic()
+        self.delivered = 0
+        self.coalesced = 0
+
+    def deliver(self, channel, state):
+        with self.condition:
+            if channel in self.mailbox:
+                self.coalesced += 1
+            self.mailbox[channel] = state
+            self.delivered += 1
+            self.condition.notify()
+
+    def poll(self, timeout=0.0):
+        # {channel: latest state} of the channels that changed, waiting up to timeout for one
+        with self.condition:
+            self.last_poll = time.monotonic()
+            if not self.mailbox and timeout:
+                self.condition.wait(timeout)
+            updates, self.mailbox = self.mailbox, {}
+            return updates
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class TelemetryBus:
+    """
+    In-process publish/subscribe for live session state. publish() keeps the latest
+    state of each channel, so new subscribers start from a snapshot, and hands it to
+    the channel's subscribers; nothing is stored anywhere else and nothing touches the
+    database. Subscriptions not polled for subscription_timeout seconds (a closed
+    dashboard tab) are dropped. RedisTelemetryBus has the same methods over a broker,
+    for publishers in other processes.
+    """
+
+    def __init__(self, subscription_timeout=60.0, state_ttl=3600.0):
+        self.subscription_timeout = subscription_timeout
+        self.state_ttl = state_ttl
+        self.lock = threading.Lock()
+        self.latest = {}  # channel -> (state, monotonic time)
+        self.subscribers = {}  # channel -> set of Subscriptions
+        self.published = 0
+
+    def publish(self, channel, state):
+        with self.lock:
+            self.latest[channel] = (state, time.monotonic())
+            self.published += 1
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(channel, state)
+
+    def subscribe(self, channels):
+        self.prune()
+        subscription = Subscription(self, channels)
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers.setdefault(channel, set()).add(subscription)
+        for channel, state in self.snapshot(subscription.channels).items():
+            subscription.deliver(channel, state)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                subscribers = self.subscribers.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self.subscribers[channel]
+
+    def snapshot(self, channels):
+        with self.lock:
+            return {channel: self.latest[channel][0] for channel in channels if channel in self.latest}
+
+    def prune(self):
+        now = time.monotonic()
+        with self.lock:
+            stale = {s for subscribers in self.subscribers.values() for s in subscribers
+                     if now - s.last_poll > self.subscription_timeout}
+            for channel in [c for c, (_, when) in self.latest.items() if now - when > self.state_ttl]:
+                del self.latest[channel]
+        for subscription in stale:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self.lock:
+            subscriptions = {s for subscribers in self.subscribers.values() for s in subscribers}
+            return {"channels": len(self.latest), "subscriptions": len(subscriptions), "published": self.published}
+
+
+class RedisTelemetryBus(TelemetryBus):
+    # The same bus over a local Redis: states are kept in keys and announced with PUBLISH.
+    # publish() only hands the state to a sender thread (the latest per channel), so a slow
+    # or vanished broker costs the exercise loop nothing; what cannot be sent is dropped
+    def __init__(self, url="redis://localhost:6379/0", log=print, **kwargs):
+        import redis
+
+        super().__init__(**kwargs)
+        self.log = log
+        self.redis = redis.Redis.from_url(url)
+        self.pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.psubscribe(**{"telemetry:*": self.receive})
+        self.listener = self.pubsub.run_in_thread(sleep_time=0.1, daemon=True)
+        self.outbox = {}
+        self.outbox_ready = threading.Condition()
+        self.dropped = 0
+        self.broker_down = False
+        self.sender = threading.Thread(target=self.send, name="telemetry-sender", daemon=True)
+        self.sender.start()
+
+    def publish(self, channel, state):
+        with self.outbox_ready:
+            self.outbox[channel] = state
+            self.outbox_ready.notify()
+
+    def send(self):
+        while True:
+            with self.outbox_ready:
+                while not self.outbox:
+                    self.outbox_ready.wait()
+                states, self.outbox = self.outbox, {}
+            try:
+                pipeline = self.redis.pipeline()
+                for channel, state in states.items():
+                    data = json.dumps(state)
+                    pipeline.set(f"telemetry-state:{channel}", data, ex=int(self.state_ttl))
+                    pipeline.publish(f"telemetry:{channel}", data)
+                pipeline.execute()
+            except Exception as e:
+                self.dropped += len(states)
+                if not self.broker_down:
+                    self.log(f"❌ Telemetry broker unavailable ({e}); dropping live updates")
+                self.broker_down = True
+                time.sleep(1.0)  # the next states replace these meanwhile
+                continue
+            if self.broker_down:
+                self.log("✅ Telemetry broker is back")
+            self.broker_down = False
+
+    def receive(self, message):
+        channel = message["channel"].decode().split(":", 1)[1]
+        super().publish(channel, json.loads(message["data"]))
+
+    def snapshot(self, channels):
+        channels = list(channels)
+        try:
+            values = self.redis.mget([f"telemetry-state:{channel}" for channel in channels]) if channels else []
+        except Exception as e:
+            self.log(f"❌ Telemetry broker unavailable ({e}); no snapshot of live sessions")
+            return {}
+        return {channel: json.loads(value) for channel, value in zip(channels, values) if value is not None}
+
+
+def make_bus(url=None, log=print):
+    # memory:// (default) or redis://host:port/db; falls back to the in-process bus
+    if url and url.startswith("redis://"):
+        try:
+            return RedisTelemetryBus(url, log=log)
+        except Exception as e:
+            log(f"❌ Telemetry broker {url} unavailable ({e}); using the in-process bus")
+    return TelemetryBus()
+
+
+class TelemetryPublisher:
+    """
+    A live session's view onto the bus. update() is called every frame, but publishes
+    only when the exercise or rep count changes, and otherwise at most once every
+    min_interval seconds when something else (the stage) changed, plus a heartbeat
+    every heartbeat seconds so a dashboard can tell a quiet session from a gone one.
+    """
+
+    def __init__(self, bus, patient_email, session_id=None, min_interval=0.5, heartbeat=5.0, clock=time.time):
+        self.bus = bus
+        self.channel = patient_channel(patient_email)
+        self.min_interval = min_interval
+        self.heartbeat = heartbeat
+        self.clock = clock
+        self.state = {"patient_email": patient_email, "session_id": session_id, "exercise": None, "stage": None,
+                      "counter": 0, "active": True, "started": clock(), "updated": None}
+        self.published_state = None
+        self.last_publish = None
+        self.updates = 0
+
+    def update(self, **fields):
+        self.updates += 1
+        self.state.update(fields)
+        now = self.clock()
+        published = self.published_state
+        if published is None or any(self.state[k] != published[k] for k in ("exercise", "counter", "active")):
+            return self.publish(now)
+        since = now - self.last_publish
+        if (since >= self.min_interval and self.state["stage"] != published["stage"]) or since >= self.heartbeat:
+            return self.publish(now)
+        return False
+
+    def publish(self, now):
+        self.state["updated"] = now
+        self.published_state = dict(self.state)
+        self.last_publish = now
+        self.bus.publish(self.channel, self.published_state)
+        return True
+
+    def close(self):
+        self.state["active"] = False
+        self.publish(self.clock())
+
+
+# --- Benchmark: 50 live patients, doctors polling at different speeds ---
+def main():
+    import numpy as np
+
+    parser = argparse.ArgumentParser(description="Telemetry bus load: many live sessions, fast and slow dashboards.")
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--fps", type=float, default=15.0)
+    args = parser.parse_args()
+
+    bus = TelemetryBus()
+    patients = [f"patient{i}@example.com" for i in range(args.patients)]
+    channels = [patient_channel(p) for p in patients]
+    stop = threading.Event()
+    update_times = []
+    final_counters = {}
+
+    def patient(index, email):
+        # One rep every 2-4 s, the stage flipping halfway through, reported every frame
+        publisher = TelemetryPublisher(bus, email, session_id=f"s{index}")
+        rng = np.random.default_rng(index)
+        rep_seconds = rng.uniform(2, 4)
+        start = time.monotonic()
+        frame = 0
+        while not stop.is_set():
+            elapsed = time.monotonic() - start
+            counter = int(elapsed / rep_seconds)
+            stage = "down" if (elapsed / rep_seconds) % 1 < 0.5 else "up"
+            t = time.perf_counter()
+            publisher.update(exercise="squat", stage=stage, counter=counter)
+            update_times.append(time.perf_counter() - t)
+            frame += 1
+            time.sleep(max(start + frame / args.fps - time.monotonic(), 0))
+        publisher.close()
+        final_counters[publisher.channel] = publisher.state["counter"]
+
+    def dashboard(name, poll_interval, latencies, seen):
+        subscription = bus.subscribe(channels)
+        while not stop.is_set():
+            for channel, state in subscription.poll(timeout=poll_interval).items():
+                latencies.append(time.time() - state["updated"])
+                seen[channel] = state
+            time.sleep(poll_interval if name == "slow" else 0)
+        time.sleep(0.2)
+        for channel, state in subscription.poll().items():
+            seen[channel] = state
+        subscription.close()
+
+    dashboards = {"live": (0.5, [], {}), "slow": (3.0, [], {})}
+    dashboard_threads = [threading.Thread(target=dashboard, args=(name, *spec)) for name, spec in dashboards.items()]
+    for thread in dashboard_threads:
+        thread.start()
+    time.sleep(0.1)
+    publishers = [threading.Thread(target=patient, args=(i, email)) for i, email in enumerate(patients)]
+    for thread in publishers:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in publishers + dashboard_threads:
+        thread.join()
+
+    updates = len(update_times)
+    stats = bus.stats()
+    print(f"{args.patients} patients, {updates} frame updates in {args.seconds:.0f}s -> {stats['published']} messages "
+          f"({stats['published'] / args.seconds:.0f}/s, {stats['published'] / updates:.1%} of updates); "
+          f"update p50 {np.percentile(update_times, 50) * 1e6:.1f} µs, p99 {np.percentile(update_times, 99) * 1e6:.1f} µs")
+    for name, (interval, latencies, seen) in dashboards.items():
+        current = all(seen.get(c, {}).get("counter") == final_counters[c] and seen[c]["active"] is False
+                      for c in channels)
+        print(f"{'✅' if current else '❌'} {name} dashboard (poll every {interval}s): {len(latencies)} states received, "
+              f"staleness p50 {np.percentile(latencies, 50) * 1000:.0f} ms, final state of every patient current: {current}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import os
+
+import joblib
+
+from create_sequence_of_features import NUM_FEATURES, WINDOW_SIZE, WindowDataset, split_videos
+
+# File names Exercise loads at startup
+MODEL_FILE = "final_forthesis_bidirectionallstm_and_encoders_exercise_classifier_model.h5"
+SCALER_FILE = "thesis_bidirectionallstm_scaler.pkl"
+LABEL_ENCODER_FILE = "thesis_bidirectionallstm_label_encoder.pkl"
+# Where the deployed classifier lives; training only writes here with --overwrite-deployed
+DEPLOYED_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def build_model(classes, units=91, dropout=0.4159725093210579, l2=0.01, learning_rate=1e-5):
+    # Same layers and hyperparameters as the shipped classifier
+    from tensorflow.keras import layers, models, optimizers, regularizers
+
+    model = models.Sequential([
+        layers.Input((WINDOW_SIZE, NUM_FEATURES)),
+        layers.Bidirectional(layers.LSTM(units, return_sequences=True, kernel_regularizer=regularizers.L2(l2))),
+        layers.Dropout(dropout),
+        layers.Bidirectional(layers.LSTM(units, kernel_regularizer=regularizers.L2(l2))),
+        layers.Dropout(dropout),
+        layers.Dense(classes, activation="softmax", kernel_regularizer=regularizers.L2(l2)),
+    ])
+    model.compile(optimizer=optimizers.Adam(learning_rate), loss="categorical_crossentropy", metrics=["accuracy"])
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the exercise classifier from extracted feature shards.")
+    parser.add_argument("feature_dir", help="output directory of extract_features.py")
+    parser.add_argument("--output", default="trained_models", help="directory for the model, scaler and label encoder")
+    parser.add_argument("--overwrite-deployed", action="store_true",
+                        help="allow --output to be the app directory and replace the deployed classifier")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--stride", type=int, default=1)
+    parser.add_argument("--validation", type=float, default=0.2, help="fraction of videos held out")
+    parser.add_argument("--learning-rate", type=float, default=1e-5)
+    parser.add_argument("--label-encoder", default=None,
+                        help="existing label encoder to keep the class order of a deployed model")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if os.path.realpath(args.output) == os.path.realpath(DEPLOYED_DIR) and not args.overwrite_deployed:
+        print(f"❌ {args.output} holds the deployed classifier; pass --overwrite-deployed to replace it")
+        return 1
+
+    from tensorflow.keras import callbacks
+
+    label_encoder = joblib.load(args.label_encoder) if args.label_encoder else None
+    train_videos, validation_videos = split_videos(args.feature_dir, args.validation, args.seed)
+    train = WindowDataset(args.feature_dir, stride=args.stride, label_encoder=label_encoder, videos=train_videos)
+    label_encoder = train.label_encoder
+    validation = WindowDataset(args.feature_dir, stride=args.stride, label_encoder=label_encoder,
+                               videos=validation_videos)
+    print(f"Training on {len(train)} windows from {len(train.entries)} videos, "
+          f"validating on {len(validation)} windows from {len(validation.entries)} videos")
+    if len(train) == 0:
+        print("❌ No training windows: videos need at least "
+              f"{WINDOW_SIZE} frames with a detected person")
+        return 1
+
+    # The scaler only sees training windows
+    scaler = train.fit_scaler()
+    model = build_model(len(label_encoder.classes_), learning_rate=args.learning_rate)
+
+    os.makedirs(args.output, exist_ok=True)
+    model_path = os.path.join(args.output, MODEL_FILE)
+    # Best epoch so far; the output files are only written once training completes
+    checkpoint_path = os.path.join(args.output, "checkpoint_" + MODEL_FILE)
+    fit_args = {}
+    monitor = "loss"
+    if len(validation):
+        fit_args = {
+            "validation_data": validation.tf_dataset(scaler, args.batch_size, shuffle=False).repeat(),
+            "validation_steps": validation.steps(args.batch_size),
+        }
+        monitor = "val_loss"
+    model.fit(
+        train.tf_dataset(scaler, args.batch_size, seed=args.seed),
+        steps_per_epoch=train.steps(args.batch_size),
+        epochs=args.epochs,
+        callbacks=[
+            callbacks.EarlyStopping(monitor=monitor, patience=5, restore_best_weights=True),
+            callbacks.ModelCheckpoint(checkpoint_path, monitor=monitor, save_best_only=True),
+        ],
+        **fit_args,
+    )
+    model.save(model_path)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    joblib.dump(scaler, os.path.join(args.output, SCALER_FILE))
+    joblib.dump(label_encoder, os.path.join(args.output, LABEL_ENCODER_FILE))
+    print(f"✅ Saved model, scaler and label encoder to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
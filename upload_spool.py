@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import os
+import tempfile
+import threading
+import time
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class UploadSpool:
+    """
+    Uploaded videos on disk, named by the SHA-256 of their content. Uploads are
+    streamed to disk in chunks while hashing, so the same video is stored once
+    however often it is uploaded or the page reruns. gc() removes files unused for
+    max_age_seconds, then the least recently used ones while the spool is over
+    max_total_bytes. Paths returned by in_use (e.g. videos of queued analyses) are
+    never removed.
+    """
+
+    def __init__(self, directory=None, max_age_seconds=24 * 3600, max_total_bytes=2 * 1024 ** 3,
+                 chunk_size=CHUNK_SIZE, in_use=None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "elderly_fitness_uploads")
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_age_seconds = max_age_seconds
+        self.max_total_bytes = max_total_bytes
+        self.chunk_size = chunk_size
+        self.in_use = in_use
+        self.lock = threading.Lock()
+        self.spooled = 0
+        self.deduplicated = 0
+        self.removed = 0
+
+    def spool(self, upload, name=None):
+        # Stores a file-like upload and returns the path of its content-addressed copy
+        name = name or getattr(upload, "name", "")
+        extension = os.path.splitext(name)[1].lower()
+        digest = hashlib.sha256()
+        chunk = bytearray(self.chunk_size)
+        view = memoryview(chunk)
+
+        upload.seek(0)
+        fd, part_path = tempfile.mkstemp(suffix=".part", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    size = upload.readinto(chunk) if hasattr(upload, "readinto") else self._read_into(upload, view)
+                    if not size:
+                        break
+                    digest.update(view[:size])
+                    f.write(view[:size])
+            path = os.path.join(self.directory, digest.hexdigest() + extension)
+            with self.lock:
+                if os.path.exists(path):
+                    os.remove(part_path)
+                    os.utime(path)  # counts as a use for gc
+                    self.deduplicated += 1
+                else:
+                    os.replace(part_path, path)
+                    self.spooled += 1
+        except BaseException:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+        finally:
+            upload.seek(0)
+        self.gc(keep=path)
+        return path
+
+    @staticmethod
+    def _read_into(upload, view):
+        data = upload.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+
+    def touch(self, path):
+        # Marks a spooled file as used; False if gc already removed it
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def gc(self, now=None, keep=None):
+        now = now or time.time()
+        pinned = {os.path.abspath(path) for path in (self.in_use() if self.in_use else ())}
+        if keep:
+            pinned.add(os.path.abspath(keep))
+        with self.lock:
+            files, pinned_bytes = [], 0
+            for entry in os.scandir(self.directory):
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if os.path.abspath(entry.path) in pinned:
+                    pinned_bytes += stat.st_size  # still needed, but uses disk all the same
+                    continue
+                # Leftovers of interrupted uploads are dropped after an hour
+                max_age = 3600 if entry.name.endswith(".part") else self.max_age_seconds
+                if now - stat.st_mtime > max_age:
+                    self._remove(entry.path)
+                elif not entry.name.endswith(".part"):
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = pinned_bytes + sum(size for _, size, _ in files)
+            for _, size, path in sorted(files):
+                if total <= self.max_total_bytes:
+                    break
+                self._remove(path)
+                total -= size
+        return total
+
+    def _remove(self, path):
+        # Files already opened by an analysis stay readable until it closes them
+        try:
+            os.remove(path)
+            self.removed += 1
+        except FileNotFoundError:
+            pass
+
+    def stats(self):
+        files = [entry for entry in os.scandir(self.directory) if entry.is_file() and not entry.name.endswith(".part")]
+        return {
+            "files": len(files),
+            "bytes": sum(entry.stat().st_size for entry in files),
+            "spooled": self.spooled,
+            "deduplicated": self.deduplicated,
+            "removed": self.removed,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Spool files into an upload spool and show what it keeps.")
+    parser.add_argument("files", nargs="+")
+    parser.add_argument("--directory", default=None)
+    parser.add_argument("--max-mb", type=float, default=2048)
+    args = parser.parse_args()
+
+    spool = UploadSpool(args.directory, max_total_bytes=int(args.max_mb * 1024 * 1024))
+    for path in args.files:
+        start = time.perf_counter()
+        with open(path, "rb") as f:
+            spooled = spool.spool(f, name=path)
+        print(f"{path} -> {spooled} ({time.perf_counter() - start:.3f}s)")
+    print(spool.stats())
+
+
+if __name__ == "__main__":
+    main()